@@ -1,5 +1,5 @@
 from fastapi import APIRouter, FastAPI
-from app.api.routes import auth, user, task, file, assistant, project
+from app.api.routes import auth, user, task, file, assistant, project, calendar, metrics
 from fastapi.staticfiles import StaticFiles
 
 router = APIRouter()
@@ -12,6 +12,8 @@ router.include_router(task.router, tags=["Tasks"])
 router.include_router(file.router, tags=["Files"])
 router.include_router(assistant.router, tags=["Assistant"])
 router.include_router(project.router, tags=["Project"])
+router.include_router(calendar.router, tags=["Calendar"])
+router.include_router(metrics.router, tags=["Metrics"])
 
 
 # app.include_router(router)
\ No newline at end of file
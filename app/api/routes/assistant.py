@@ -10,11 +10,16 @@ from typing import List, Optional
 import google.generativeai as genai
 import os
 from dotenv import load_dotenv
-from app.gemini.summary_pdf import get_gemini_project_draft
+from starlette.concurrency import run_in_threadpool
+from app.gemini.summary_pdf import get_gemini_project_draft_async, retrieve_from_documents_async
+from app.crud.crud_file import get_owned_files, stored_file_source
+from app.crud.crud_version import mark_user_changed
 from app.gemini.json_to_markdown import json_to_markdown
 from app.gemini.replan_project import replan_project_with_gemini
+from app.services import vector_store
 
 router = APIRouter(tags=["Assistant"])
+REPLAN_CONTEXT_TOP_K = 8
 load_dotenv() 
 genai.configure(api_key=os.getenv("GEMINI_KEY"))
 
@@ -77,6 +82,8 @@ class PreviewMessageResponse(BaseModel):
 class ReplanRequest(BaseModel):
     original_json: dict
     chat_history: list[ChatItem]
+    project_id: Optional[UUID] = None  # 有提供時會從專案的文件與對話中找相關內容
+    file_ids: List[UUID] = []  # 已上傳的檔案，會從中找出與使用者回饋相關的段落
 
 class ReplanResponse(BaseModel):
     updated_json: List[dict]  # <--- ✅ 改成 List[dict]
@@ -86,17 +93,31 @@ class ReplanResponse(BaseModel):
 
 @router.post("/assistant/project_draft")
 async def get_project_draft(
-    file: UploadFile = File(...),
+    file: Optional[UploadFile] = File(None),
+    file_ids: Optional[List[UUID]] = Form(None),
     title: str = Form(...),
     deadline: datetime = Form(...),
     current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
 ):
+    # 可以直接上傳 PDF，或是使用 /upload 已經存好的檔案（file_ids），兩者可同時使用
+    if file is None and not file_ids:
+        raise HTTPException(status_code=400, detail="Either file or file_ids is required")
+
+    sources, file_names = [], []
+    if file_ids:
+        stored_files = await run_in_threadpool(get_owned_files, db, current_user.id, file_ids)
+        sources += [stored_file_source(f) for f in stored_files]
+        file_names += [f.name for f in stored_files]
+
     try:
-        content = await file.read()
-        result = get_gemini_project_draft(content, title=title, deadline=deadline)
-        result_markdown = json_to_markdown(result)
+        if file is not None:
+            sources.append(await file.read())
+            file_names.append(file.filename)
+        result = await get_gemini_project_draft_async(sources, title=title, deadline=deadline)
+        result_markdown = await run_in_threadpool(json_to_markdown, result)
         return {
-            "file_name": file.filename,
+            "file_name": ", ".join(file_names),
             "projects": result.get("projects") if isinstance(result, dict) else result,
             "response": result_markdown,
         }
@@ -104,21 +125,48 @@ async def get_project_draft(
         raise HTTPException(status_code=500, detail=f"處理失敗：{str(e)}")
 
 
+def load_replan_sources(db: Session, user_id, payload: ReplanRequest):
+    """Check access to the project and files referenced by a replan request and return the document sources."""
+    if payload.project_id:
+        project = db.query(Project.id).filter_by(id=payload.project_id, user_id=user_id).first()
+        if not project:
+            raise HTTPException(status_code=404, detail="Project not found")
+    if not payload.file_ids:
+        return []
+    return [stored_file_source(f) for f in get_owned_files(db, user_id, payload.file_ids)]
+
+
 @router.post("/assistant/replan", response_model=ReplanResponse)
-def replan_project_api(
+async def replan_project_api(
     payload: ReplanRequest,
     current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
 ):
+    file_paths = await run_in_threadpool(load_replan_sources, db, current_user.id, payload)
+
+    reference_context = None
+    user_messages = [item.message for item in payload.chat_history if item.sender.lower() == "user"]
+    if user_messages and (payload.project_id or file_paths):
+        query = "\n".join(user_messages[-3:])
+        reference_context = []
+        if payload.project_id:
+            hits = await run_in_threadpool(vector_store.search, payload.project_id, query, REPLAN_CONTEXT_TOP_K)
+            reference_context += [hit["text"] for hit in hits]
+        if file_paths:
+            reference_context += await retrieve_from_documents_async(file_paths, query, REPLAN_CONTEXT_TOP_K)
+
     try:
-        result_json = replan_project_with_gemini(
+        result_json = await run_in_threadpool(
+            replan_project_with_gemini,
             original_json=payload.original_json,
-            chat_history=[item.model_dump() for item in payload.chat_history]
+            chat_history=[item.model_dump() for item in payload.chat_history],
+            reference_context=reference_context,
         )
 
         print("DEBUG Gemini 回傳：", result_json)  # <-- 新增這行幫你看回傳什麼
 
         updated_json = result_json.get("projects") if isinstance(result_json, dict) else result_json  # 如果沒有這個 key 就會噴錯
-        markdown = json_to_markdown(updated_json)
+        markdown = await run_in_threadpool(json_to_markdown, updated_json)
 
         return {
             "updated_json": updated_json,
@@ -183,8 +231,10 @@ def create_new_project(
             db.add(task_model)
 
     # === Step 3: 寫入 Chat History ===
+    indexed_chats = []
     for chat in payload.chat_history:
         chat_obj = ChatHistory(
+            id=uuid4(),
             user_id=current_user.id,
             project=project,
             message=chat.message,
@@ -192,9 +242,15 @@ def create_new_project(
             timestamp=datetime.fromisoformat(chat.timestamp) if chat.timestamp else datetime.now(timezone.utc)
         )
         db.add(chat_obj)
+        indexed_chats.append((chat_obj.id, chat.sender, chat.message))
 
+    mark_user_changed(db, current_user.id)
     db.commit()
 
+    # 對話紀錄在背景加入專案的向量搜尋
+    for chat_id, sender, message in indexed_chats:
+        vector_store.submit_chat_message(payload.project_id, chat_id, sender, message)
+
     return {
         "message": "✅ Project and milestones saved successfully",
         "project_id": str(project.id),
@@ -0,0 +1,50 @@
+import os
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from app.core.db import get_db
+from app.core.etag import etag_matches
+from app.crud.crud_calendar import create_feed_token, feed_etag, iter_feed_events, read_feed_token
+from app.crud.crud_user import get_current_user
+from app.models import User
+from app.services.ical import iter_calendar
+
+
+router = APIRouter(tags=["Calendar"])
+
+BASE_URL = os.getenv("BASE_URL", "http://localhost:3000")
+# 行事曆 app 大約每小時輪詢一次，每次都用 If-None-Match 重新驗證
+CALENDAR_CACHE_CONTROL = "private, no-cache"
+
+
+@router.get("/calendar/feed_url")
+def get_calendar_feed_url(current_user: User = Depends(get_current_user)):
+    url = f"{BASE_URL}/calendar/{create_feed_token(current_user.id)}.ics"
+    return {
+        "url": url,
+        "webcal_url": "webcal://" + url.split("://", 1)[-1],
+    }
+
+
+@router.get("/calendar/{token}.ics")
+def get_calendar_feed(
+    token: str,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    user_id = read_feed_token(token)
+    if not db.get(User, user_id):
+        raise HTTPException(status_code=401, detail="Invalid calendar token")
+
+    etag = feed_etag(db, user_id)
+    headers = {"ETag": etag, "Cache-Control": CALENDAR_CACHE_CONTROL}
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    # 任務與里程碑邊查邊輸出，不必先把整個行事曆組好
+    return StreamingResponse(
+        iter_calendar(iter_feed_events(db, user_id)),
+        media_type="text/calendar; charset=utf-8",
+        headers=headers,
+    )
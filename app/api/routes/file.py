@@ -1,19 +1,86 @@
+import mimetypes
 import os
-from fastapi import APIRouter, UploadFile, HTTPException, File, Form, Depends
+from functools import partial
+from fastapi import APIRouter, UploadFile, HTTPException, File, Form, Depends, Path, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from app.core.db import get_db
+from app.core.config import MAX_UPLOAD_FILE_BYTES, MAX_UPLOAD_REQUEST_BYTES, UPLOAD_SESSION_CHUNK_SIZE
+from app.core.etag import etag_matches
+from app.crud.crud_file import delete_unreferenced_blobs, get_accessible_blob, release_blobs, reserve_blob
 from app.crud.crud_user import get_current_user
 from app.models import Files as FileModel, Project, User
 from sqlalchemy.dialects.postgresql import UUID
+from app.services import extraction, upload_sessions, vector_store
+from app.services.file_storage import StoredBlob, blob_key, blob_url, save_blob
+from app.services.storage import get_storage
 import uuid
 
 
 router = APIRouter(tags=["Files"])
 
 BASE_URL = os.getenv("BASE_URL", "http://localhost:3000")
-UPLOAD_DIR = "uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+# 網址帶內容 hash，同一個網址的內容永遠不變；需要登入才能下載，所以只允許瀏覽器端快取
+DOWNLOAD_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+
+def get_owned_project_id(db: Session, user_id, project_id: Optional[uuid.UUID]):
+    if not project_id:
+        return None
+    project = db.query(Project).filter_by(id=project_id, user_id=user_id).first()
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found or not owned by user")
+    return project.id
+
+
+def register_files(db: Session, user_id, project_id, saved_files) -> List[dict]:
+    """
+    Insert Files rows for blobs that are already in storage, then queue PDFs for extraction
+    and project PDFs for indexing.
+
+    saved_files is a list of (filename, size, sha256).
+    """
+    response_files = []
+    pdf_hashes = []
+    indexed_files = []
+    for filename, size, sha256 in saved_files:
+        url = blob_url(sha256, filename)
+        db_file = FileModel(
+            id=uuid.uuid4(),
+            name=filename,
+            url=url,
+            project_id=project_id,
+            user_id=user_id,
+            sha256=sha256,
+            size=size
+        )
+        db.add(db_file)
+        if filename.lower().endswith(".pdf"):
+            pdf_hashes.append(sha256)
+            if project_id:
+                indexed_files.append((db_file.id, StoredBlob(sha256)))
+        file_url = f"{BASE_URL}{url}"
+        response_files.append({
+            "file_id": str(db_file.id),
+            "file_url": file_url,
+            "file_name": filename,
+            "size": size,
+            "sha256": sha256
+        })
+
+    db.commit()
+
+    # PDF 先在背景解析與 embedding，之後產生草稿時只剩 Gemini 的步驟
+    for sha256 in dict.fromkeys(pdf_hashes):
+        extraction.submit(sha256)
+    # 專案的 PDF 在背景加入向量搜尋（會等同一份解析結果，不會重複解析）
+    for file_id, blob in indexed_files:
+        vector_store.submit_file(project_id, file_id, blob)
+    return response_files
+
 
 @router.post("/upload")
 async def upload_files(
@@ -22,36 +89,172 @@ async def upload_files(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    project_db_id = None
-
-    if projectId:
-        project = db.query(Project).filter_by(id=projectId, user_id=current_user.id).first()
-        if not project:
-            raise HTTPException(status_code=404, detail="Project not found or not owned by user")
-        project_db_id = project.id
+    # 查資料庫、刪檔案都會阻塞，一律交給 threadpool，event loop 只負責串流
+    project_db_id = await run_in_threadpool(get_owned_project_id, db, current_user.id, projectId)
 
     saved_files = []
-    for file in files:
-        file_path = os.path.join(UPLOAD_DIR, file.filename)
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+    reserved = []
+    total_bytes = 0
 
-        db_file = FileModel(
-            name=file.filename,
-            url=f"/{UPLOAD_DIR}/{file.filename}",
-            project_id=project_db_id
-        )
-        db.add(db_file)
-        file_url = f"{BASE_URL}/uploads/{file.filename}"
-        saved_files.append({
-            "file_url": file_url,
-            "file_name": file.filename
-        })
+    def reserve(sha256):
+        reserve_blob(db, sha256)
+        reserved.append(sha256)
 
-    db.commit()
+    try:
+        for file in files:
+            # 只保留檔名，原始檔名只存在資料庫，磁碟上以內容 hash 命名
+            filename = os.path.basename(file.filename or "")
+            if not filename:
+                raise HTTPException(status_code=400, detail="Missing file name")
+            # 單檔上限與整個請求剩餘的額度取較小者
+            remaining = MAX_UPLOAD_REQUEST_BYTES - total_bytes
+            size, sha256 = await save_blob(file, min(MAX_UPLOAD_FILE_BYTES, remaining), reserve)
+            total_bytes += size
+            saved_files.append((filename, size, sha256))
+    except HTTPException:
+        # 這個請求寫入、但沒有任何紀錄引用的 blob 一併清掉
+        await run_in_threadpool(release_blobs, db, reserved)
+        await run_in_threadpool(delete_unreferenced_blobs, db, reserved)
+        raise
 
+    try:
+        response_files = await run_in_threadpool(register_files, db, current_user.id, project_db_id, saved_files)
+    finally:
+        # Files 紀錄寫入後才解除保留，之後由紀錄本身保住 blob
+        await run_in_threadpool(release_blobs, db, reserved)
     return {
         "project_id": projectId,
-        "files": saved_files
+        "files": response_files
     }
+
+
+class InitiateUploadRequest(BaseModel):
+    file_name: str
+    size: int = Field(..., gt=0)
+    chunk_size: Optional[int] = Field(None, gt=0)
+    project_id: Optional[uuid.UUID] = None
+
+
+class CompleteUploadRequest(BaseModel):
+    sha256: str = Field(..., pattern="^[0-9a-fA-F]{64}$")
+
+
+@router.post("/upload/sessions")
+def initiate_upload(
+    payload: InitiateUploadRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Start a resumable upload; the client then PUTs chunks of chunk_size bytes numbered from 0."""
+    filename = os.path.basename(payload.file_name)
+    if not filename:
+        raise HTTPException(status_code=400, detail="Missing file name")
+    if payload.size > MAX_UPLOAD_FILE_BYTES:
+        raise HTTPException(status_code=413, detail=f"File exceeds the {MAX_UPLOAD_FILE_BYTES} byte limit")
+    # 每個 chunk 是一個 PUT 請求，不能超過單一請求的上限
+    chunk_size = min(payload.chunk_size or UPLOAD_SESSION_CHUNK_SIZE, MAX_UPLOAD_REQUEST_BYTES)
+    project_db_id = get_owned_project_id(db, current_user.id, payload.project_id)
+
+    # 順便清掉過期未完成的上傳
+    upload_sessions.collect_abandoned_sessions()
+    session = upload_sessions.create_session(current_user.id, filename, payload.size, chunk_size, project_db_id)
+    return upload_sessions.session_status(session)
+
+
+@router.put("/upload/sessions/{upload_id}/chunks/{index}")
+async def upload_chunk(
+    upload_id: str,
+    index: int,
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    session = await run_in_threadpool(upload_sessions.load_session, upload_id, current_user.id)
+    size = await upload_sessions.write_chunk(session, index, request.stream())
+    return {"upload_id": upload_id, "index": index, "size": size}
+
+
+@router.get("/upload/sessions/{upload_id}")
+def get_upload_status(
+    upload_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    session = upload_sessions.load_session(upload_id, current_user.id)
+    return upload_sessions.session_status(session)
+
+
+@router.post("/upload/sessions/{upload_id}/complete")
+def complete_upload(
+    upload_id: str,
+    payload: CompleteUploadRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Assemble the chunks, verify the SHA-256 and register the file like /upload does."""
+    session = upload_sessions.load_session(upload_id, current_user.id)
+    size, sha256 = upload_sessions.assemble(session, payload.sha256, partial(reserve_blob, db))
+    project_id = uuid.UUID(session["project_id"]) if session["project_id"] else None
+    try:
+        saved = register_files(db, current_user.id, project_id, [(session["file_name"], size, sha256)])
+    except Exception:
+        db.rollback()
+        release_blobs(db, [sha256])
+        delete_unreferenced_blobs(db, [sha256])
+        raise
+    release_blobs(db, [sha256])
+    upload_sessions.delete_session(upload_id)
+    return {"project_id": project_id, "file": saved[0]}
+
+
+@router.delete("/upload/sessions/{upload_id}")
+def abort_upload(
+    upload_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    upload_sessions.load_session(upload_id, current_user.id)
+    upload_sessions.delete_session(upload_id)
+    return {"status": "success", "message": "Upload session deleted"}
+
+
+@router.get("/uploads/{sha256}/{filename}")
+def download_file(
+    request: Request,
+    sha256: str = Path(..., pattern="^[0-9a-f]{64}$"),
+    filename: str = Path(...),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Serve a stored file to its uploader or the owner of its project.
+
+    The content hash is the strong ETag, so repeat views answer 304 without
+    touching the file, and Range / If-Range requests return partial content for
+    incremental PDF loading. Files on local disk (or in the remote storage's
+    read-through cache) are sent with the server's zero-copy pathsend extension
+    when it supports one; without a cache, remote objects are streamed whole.
+    """
+    get_accessible_blob(db, current_user.id, sha256)
+
+    etag = f'"{sha256}"'
+    headers = {"ETag": etag, "Cache-Control": DOWNLOAD_CACHE_CONTROL}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    storage = get_storage()
+    key = blob_key(sha256)
+    if not storage.exists(key):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    path = storage.local_path(key)
+    if path is None:
+        headers["Content-Length"] = str(storage.size(key))
+        return StreamingResponse(storage.open(key), headers=headers, media_type=media_type)
+
+    return FileResponse(
+        path,
+        headers=headers,
+        media_type=media_type,
+        filename=filename,
+        content_disposition_type="inline"
+    )
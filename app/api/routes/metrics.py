@@ -0,0 +1,13 @@
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from app.core.metrics import update_threadpool_gauges
+
+
+router = APIRouter(tags=["Metrics"])
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    # async route：不佔用 threadpool，被塞滿時也能抓到指標
+    update_threadpool_gauges()
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -1,15 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 from sqlalchemy.dialects.postgresql import UUID
 import uuid
-from typing import List
+from functools import lru_cache
+from typing import Callable, List, Optional
+from pydantic import TypeAdapter
 from sqlalchemy.exc import SQLAlchemyError
 from fastapi.responses import JSONResponse
 from app.core.db import get_db 
+from app.core.etag import etag_matches
+from app.core.responses import orjson_dumps
 from app.crud.crud_user import get_current_user
 from app.schemas.project import *
 from app.crud.crud_project import *
+from app.crud.crud_cache import read_through
+from app.crud.crud_fields import fields_key, parse_fields
+from app.crud.crud_version import versions_digest
 from app.models import User
 
 
@@ -23,13 +30,80 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     return token
 
 
+# 客戶端可以快取，但每次都要用 If-None-Match 重新驗證
+PROJECT_CACHE_CONTROL = "private, no-cache"
+
+
+def project_list_etag(versions) -> str:
+    return f'"projects-{versions_digest(versions)}"'
+
+
+FIELDS_DESCRIPTION = "只回傳指定欄位，以逗號分隔；巢狀欄位用點號，例如 milestones.milestone_name"
+
+
+def sparse_etag(etag: str, fields: Optional[dict]) -> str:
+    # 不同欄位組合是不同的內容，ETag 也要不同
+    return f'{etag[:-1]}-f{fields_key(fields)}"' if fields else etag
+
+
+@lru_cache(maxsize=None)
+def response_adapter(schema) -> TypeAdapter:
+    return TypeAdapter(schema)
+
+
+def cached_json(route: str, response: Response, user_id, etag: str, schema, fields: Optional[dict], load: Callable) -> Optional[Response]:
+    """
+    Serve the JSON body of etag from the per-user read cache, loading it on a miss.
+
+    Full responses are validated against the route schema and dumped by
+    pydantic-core, the same as the response_model path; sparse ones do not
+    match the schema and are dumped with orjson. Returns None when load finds nothing.
+    """
+    def build() -> Optional[bytes]:
+        content = load()
+        if content is None:
+            return None
+        if fields is not None:
+            return orjson_dumps(content)
+        adapter = response_adapter(schema)
+        return adapter.dump_json(adapter.validate_python(content))
+
+    body = read_through(route, user_id, etag, build)
+    if body is None:
+        return None
+    return Response(body, media_type="application/json", headers=dict(response.headers))
+
+
+def not_modified(response: Response, etag: str, if_none_match: Optional[str]) -> Optional[Response]:
+    # 版本號沒變就回 304，不必載入整個專案樹
+    headers = {"ETag": etag, "Cache-Control": PROJECT_CACHE_CONTROL}
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
 @router.get("/projects", response_model=List[ProjectSchema])
-def get_all_projects(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_all_projects(
+    response: Response,
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    if_none_match: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    selection = parse_fields(fields, ProjectSchema)
     try:
-        projects = get_all_projects_with_progress(db, current_user)
-        if not projects:
+        versions = get_project_versions(db, current_user.id)
+        if not versions:
             return JSONResponse(status_code=404, content={"detail": "No projects found"})
-        return projects
+        etag = sparse_etag(project_list_etag(versions), selection)
+        cached = not_modified(response, etag, if_none_match)
+        if cached:
+            return cached
+        return cached_json(
+            "projects", response, current_user.id, etag, List[ProjectSchema], selection,
+            lambda: get_all_projects_with_progress(db, current_user, selection),
+        )
 
     except SQLAlchemyError as e:
         return JSONResponse(status_code=500, content={"detail": "Database error", "error": str(e)})
@@ -40,28 +114,102 @@ def get_all_projects(current_user: User = Depends(get_current_user), db: Session
 @router.get("/project_detail", response_model=ProjectDetailSchema)
 def get_project_detail(
     project_id: uuid.UUID,
+    response: Response,
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    if_none_match: Optional[str] = Header(None),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    project_detail = get_project_detail_from_db(db, current_user.id, project_id)
+    selection = parse_fields(fields, ProjectDetailSchema)
+    version = get_project_version(db, current_user.id, project_id)
+    if version is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    etag = sparse_etag(f'"project-{project_id}-v{version}"', selection)
+    cached = not_modified(response, etag, if_none_match)
+    if cached:
+        return cached
+    project_detail = cached_json(
+        "project_detail", response, current_user.id, etag, ProjectDetailSchema, selection,
+        lambda: get_project_detail_from_db(db, current_user.id, project_id, selection),
+    )
     if not project_detail:
         raise HTTPException(status_code=404, detail="Project not found")
     return project_detail
 
 
+@router.get("/project_tree", response_model=ProjectTreeSchema)
+def get_project_tree(
+    project_id: uuid.UUID,
+    response: Response,
+    exclude_completed: bool = Query(False, description="不回傳已完成的任務（進度仍以全部任務計算）"),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    if_none_match: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # 一次回傳專案、所有里程碑與任務，取代 /project_detail 加上每個里程碑一次的 /milestone_detail
+    selection = parse_fields(fields, ProjectTreeSchema)
+    version = get_project_version(db, current_user.id, project_id)
+    if version is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    variant = "-open" if exclude_completed else ""
+    etag = sparse_etag(f'"project-tree-{project_id}-v{version}{variant}"', selection)
+    cached = not_modified(response, etag, if_none_match)
+    if cached:
+        return cached
+    project_tree = cached_json(
+        "project_tree", response, current_user.id, etag, ProjectTreeSchema, selection,
+        lambda: get_project_tree_from_db(db, current_user.id, project_id, exclude_completed, selection),
+    )
+    if not project_tree:
+        raise HTTPException(status_code=404, detail="Project not found")
+    return project_tree
+
+
 @router.get("/milestone_detail", response_model=MilestoneDetailSchema)
 def get_milestone_detail(
     project_id: uuid.UUID,
     milestone_id: uuid.UUID,
+    response: Response,
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    if_none_match: Optional[str] = Header(None),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    milestone_detail = get_milestone_detail_from_db(db, current_user.id, project_id, milestone_id)
+    selection = parse_fields(fields, MilestoneDetailSchema)
+    version = get_project_version(db, current_user.id, project_id, milestone_id)
+    if version is None:
+        raise HTTPException(status_code=404, detail="Milestone not found")
+    etag = sparse_etag(f'"milestone-{milestone_id}-v{version}"', selection)
+    cached = not_modified(response, etag, if_none_match)
+    if cached:
+        return cached
+    milestone_detail = cached_json(
+        "milestone_detail", response, current_user.id, etag, MilestoneDetailSchema, selection,
+        lambda: get_milestone_detail_from_db(db, current_user.id, project_id, milestone_id, selection),
+    )
     if not milestone_detail:
         raise HTTPException(status_code=404, detail="Milestone not found")
     return milestone_detail
 
 
+@router.get("/project_search")
+def search_project(
+    project_id: uuid.UUID,
+    query: str,
+    top_k: int = Query(5, ge=1, le=50),
+    source: Optional[str] = Query(None, pattern="^(file|chat)$", description="file 或 chat"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    results = search_project_context(db, current_user.id, project_id, query, top_k=top_k, source=source)
+    return {
+        "project_id": str(project_id),
+        "query": query,
+        "results": results
+    }
+
+
 @router.put("/project_detail", response_model=UpdateProjectResponse)
 def update_project_detail(
     payload: UpdateProjectRequest,
@@ -1,9 +1,16 @@
 from fastapi import APIRouter, HTTPException, Depends, Query, Path, Body
 from sqlalchemy.orm import Session
 from datetime import datetime
+from typing import Optional
+from app.core.config import DAILY_CAPACITY_HOURS, WORKLOAD_MAX_DAYS
 from app.models import Task, Project, User, Milestone
 from app.core.db import get_db
+from app.core.responses import ORJSONResponse
 from app.crud.crud_user import get_current_user
+from app.crud.crud_version import touch_project
+from app.crud.crud_task import batch_update_tasks
+from app.crud.crud_workload import get_workload
+from app.schemas.project import BatchTaskUpdateRequest, BatchTaskUpdateResponse
 from sqlalchemy.dialects.postgresql import UUID
 import uuid
 
@@ -21,35 +28,47 @@ def get_tasks_by_date(
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD.")
     
-    tasks = (
-        db.query(Task)
-        .join(Milestone, Task.milestone_id == Milestone.id) 
+    # 只查需要的欄位，一個 query 取回所有資料，不載入 ORM 物件也不會觸發 lazy load
+    rows = (
+        db.query(
+            Task.id,
+            Task.title,
+            Task.description,
+            Task.estimated_loading,
+            Task.is_completed,
+            Project.id.label("project_id"),
+            Project.name.label("project_name"),
+        )
+        .join(Milestone, Task.milestone_id == Milestone.id)
         .join(Project, Milestone.project_id == Project.id)
         .filter(Project.user_id == current_user.id)
         .filter(Task.due_date == date_obj)
         .all()
     )
 
-    
-
-    result = []
-    for task in tasks:
-        project_name = task.milestone.project.name
-
-        if task.estimated_loading == None:
-            task.estimated_loading = 0.0
-
-        result.append({
-            "task_id": task.id,
-            "task_title": task.title,
-            "project_name": project_name,
-            "description": task.description,
-            "estimated_loading": float(task.estimated_loading),
-            "isCompleted": task.is_completed,
-            "project_id": task.milestone.project_id if task.milestone else None
-        })
+    # 沒有 response_model 的 route 直接回傳 ORJSONResponse，略過 jsonable_encoder
+    return ORJSONResponse([
+        {
+            "task_id": row.id,
+            "task_title": row.title,
+            "project_name": row.project_name,
+            "description": row.description,
+            "estimated_loading": float(row.estimated_loading or 0.0),
+            "isCompleted": row.is_completed,
+            "project_id": row.project_id
+        }
+        for row in rows
+    ])
+
+@router.patch("/tasks", response_model=BatchTaskUpdateResponse)
+def update_tasks_batch(
+    payload: BatchTaskUpdateRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # 一次更新多個任務（例如勾選當天所有任務），只做一次權限查詢與一次 commit
+    return batch_update_tasks(db, current_user.id, payload.tasks)
 
-    return result
 
 @router.patch("/tasks/{task_id}")
 def update_task_status(
@@ -76,6 +95,7 @@ def update_task_status(
         raise HTTPException(status_code=404, detail="Task not found or not authorized")
 
     task.is_completed = is_completed
+    touch_project(db, task.milestone.project_id)
     db.commit()
     db.refresh(task)
 
@@ -120,6 +140,7 @@ def update_task(
     if not updated:
         raise HTTPException(status_code=400, detail="No valid fields to update.")
 
+    touch_project(db, task.milestone.project_id)
     db.commit()
     db.refresh(task)
 
@@ -130,6 +151,29 @@ def update_task(
     }
 
 
+@router.get("/workload")
+def get_daily_workload(
+    start_date: str = Query(..., description="Start Date: YYYY-MM-DD"),
+    end_date: str = Query(..., description="End Date: YYYY-MM-DD"),
+    capacity: Optional[float] = Query(None, gt=0, description="每日可用工時，預設為 DAILY_CAPACITY_HOURS"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    try:
+        start = datetime.strptime(start_date, "%Y-%m-%d").date()
+        end = datetime.strptime(end_date, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD.")
+
+    if end < start:
+        raise HTTPException(status_code=400, detail="End date must be after start date.")
+    if (end - start).days >= WORKLOAD_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range cannot exceed {WORKLOAD_MAX_DAYS} days.")
+
+    # 所有專案未完成任務的每日工作量，一個 group by 查詢算出並依使用者快取
+    return ORJSONResponse(get_workload(db, current_user.id, start, end, capacity or DAILY_CAPACITY_HOURS))
+
+
 @router.get("/calendar_projects")
 def get_projects_in_range(
     start_date: str = Query(..., description="Start Date: YYYY-MM-DD"),
@@ -163,4 +207,4 @@ def get_projects_in_range(
             "end_time": p.end_time.isoformat() if p.end_time else None,
         })
         
-    return result
\ No newline at end of file
+    return ORJSONResponse(result)
\ No newline at end of file
@@ -1 +1,93 @@
-# 環境設定
\ No newline at end of file
+# 環境設定
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# === 文件向量快取 ===
+# 以上傳檔案內容的 SHA-256 為 key，把段落、embeddings 與 FAISS index 存在磁碟上
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "cache/embeddings")
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# === PDF 解析 ===
+# 頁數達到 PDF_PARALLEL_MIN_PAGES 時改用 process pool 分段平行解析
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "50"))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "8"))
+
+# === 文件切塊 ===
+CHUNK_TARGET_TOKENS = int(os.getenv("CHUNK_TARGET_TOKENS", "200"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "40"))
+
+# === 專案向量搜尋 ===
+# 筆數少於 VECTOR_STORE_FLAT_MAX 時用精確搜尋（IndexFlatL2），超過後改用 HNSW
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", "cache/vector_store")
+VECTOR_STORE_FLAT_MAX = int(os.getenv("VECTOR_STORE_FLAT_MAX", "10000"))
+VECTOR_STORE_HNSW_M = int(os.getenv("VECTOR_STORE_HNSW_M", "32"))
+
+# === 背景運算 ===
+# 草稿流程中 CPU 密集階段（PDF 解析、切塊、embedding）使用的 process 數
+PROCESS_POOL_SIZE = int(os.getenv("PROCESS_POOL_SIZE", str(min(4, os.cpu_count() or 1))))
+
+# === 檔案上傳 ===
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+MAX_UPLOAD_FILE_BYTES = int(os.getenv("MAX_UPLOAD_FILE_BYTES", str(50 * 1024 * 1024)))
+MAX_UPLOAD_REQUEST_BYTES = int(os.getenv("MAX_UPLOAD_REQUEST_BYTES", str(200 * 1024 * 1024)))
+
+# === 檔案儲存 ===
+# local：存在 UPLOAD_DIR；s3：存到 S3 相容的物件儲存（AWS S3、MinIO、GCS interoperability），需安裝 boto3
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+S3_BUCKET = os.getenv("S3_BUCKET")
+S3_PREFIX = os.getenv("S3_PREFIX", "uploads/")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")
+S3_REGION = os.getenv("S3_REGION")
+# 遠端儲存的本機讀取快取，STORAGE_CACHE_MAX_BYTES 設為 0 即關閉
+STORAGE_CACHE_DIR = os.getenv("STORAGE_CACHE_DIR", "cache/storage")
+STORAGE_CACHE_MAX_BYTES = int(os.getenv("STORAGE_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+# === 分段續傳 ===
+# 暫存區最好與 UPLOAD_DIR 在同一個檔案系統，組合完成的檔案才能直接 rename 成 blob
+UPLOAD_SESSION_DIR = os.getenv("UPLOAD_SESSION_DIR", os.path.join(UPLOAD_DIR, ".sessions"))
+UPLOAD_SESSION_CHUNK_SIZE = int(os.getenv("UPLOAD_SESSION_CHUNK_SIZE", str(5 * 1024 * 1024)))
+UPLOAD_SESSION_TTL_SECONDS = int(os.getenv("UPLOAD_SESSION_TTL_SECONDS", str(24 * 60 * 60)))
+
+# === 重新排程 ===
+# 版本衝突時回傳的 reschedule_token 有效時間，期間內可直接重新套用同一份排程結果
+RESCHEDULE_TOKEN_TTL_SECONDS = int(os.getenv("RESCHEDULE_TOKEN_TTL_SECONDS", str(60 * 60)))
+
+# === 每日工作量 ===
+# 單日未完成任務的 estimated_loading 加總超過 DAILY_CAPACITY_HOURS 即標記為超載
+DAILY_CAPACITY_HOURS = float(os.getenv("DAILY_CAPACITY_HOURS", "8"))
+WORKLOAD_MAX_DAYS = int(os.getenv("WORKLOAD_MAX_DAYS", "366"))
+WORKLOAD_CACHE_SIZE = int(os.getenv("WORKLOAD_CACHE_SIZE", "1024"))
+
+# === 行事曆訂閱 ===
+# ICS feed 以 server-side cursor 每次取回的筆數
+CALENDAR_FEED_BATCH_SIZE = int(os.getenv("CALENDAR_FEED_BATCH_SIZE", "500"))
+
+# === 回應壓縮 ===
+# 只壓縮白名單內的文字類型；PDF、圖片等本身已壓縮的檔案直接略過。安裝 brotli 套件後會優先使用 br
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+COMPRESSION_MEDIA_TYPES = tuple(
+    media_type.strip()
+    for media_type in os.getenv(
+        "COMPRESSION_MEDIA_TYPES",
+        "application/json,text/markdown,text/plain,text/calendar,text/event-stream,text/csv,text/html",
+    ).split(",")
+    if media_type.strip()
+)
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "5"))
+
+# === 專案讀取快取 ===
+# memory：單一 process 內的 LRU；redis：多個 instance 共用（需安裝 redis）；off：關閉
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory")
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", str(60 * 60)))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# === SQL 查詢檢查（開發用）===
+# 開啟後每個 response 帶 X-Query-Count；同一句 SQL 在一個請求內執行達 QUERY_REPEAT_THRESHOLD 次會記 warning（疑似 N+1）
+QUERY_DEBUG = os.getenv("QUERY_DEBUG", "false").lower() in ("1", "true", "yes")
+QUERY_REPEAT_THRESHOLD = int(os.getenv("QUERY_REPEAT_THRESHOLD", "5"))
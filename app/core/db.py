@@ -3,6 +3,7 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, Session, declarative_base
 from dotenv import load_dotenv
 from typing import Generator
+from app.core.metrics import InstrumentedQueuePool
 
 load_dotenv()
 
@@ -17,7 +18,8 @@ if not all([DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT]):
 
 DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
-engine = create_engine(DATABASE_URL)
+# 量測從連線池取得連線的等待時間
+engine = create_engine(DATABASE_URL, poolclass=InstrumentedQueuePool)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
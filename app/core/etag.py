@@ -0,0 +1,8 @@
+# ETag / If-None-Match 共用工具
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Match 使用弱比較，W/ 前綴不影響結果
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    etag = etag.removeprefix("W/")
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
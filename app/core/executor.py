@@ -0,0 +1,40 @@
+# 共用的 process pool：PDF 解析、切塊與 embedding 這類 CPU 密集的工作在這裡執行，避免卡住 event loop
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from app.core.config import PROCESS_POOL_SIZE
+
+_process_pool = None
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        # 用 spawn 而不是 Linux 預設的 fork：worker 是需要時才建立的，fork 當下其他 thread（torch / OpenMP）
+        # 可能正持有鎖，子 process 會卡住。worker 只 import 需要的模組，不沿用父 process 的狀態
+        _process_pool = ProcessPoolExecutor(
+            max_workers=PROCESS_POOL_SIZE,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _process_pool
+
+
+async def run_in_process(fn, *args, **kwargs):
+    """
+    Run fn(*args, **kwargs) in the shared process pool.
+
+    fn must be a module-level function and, like its arguments, picklable. The
+    workers are spawned, so fn sees module state as freshly imported (config
+    from the environment), never objects set up or patched in this process.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_process_pool(), partial(fn, *args, **kwargs))
+
+
+def shutdown_process_pool():
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
@@ -0,0 +1,161 @@
+"""
+Prometheus metrics for routes, the database, the project read cache and Gemini calls.
+
+Everything is registered on the default prometheus_client registry and
+served by GET /metrics. Collection is kept cheap enough to leave on in
+production:
+
+- Counters and histograms are updated in place. No per-request objects
+  are allocated besides the query counter.
+- The route label is the route template (e.g. /tasks/{task_id}), never the
+  raw path, so label cardinality is bounded.
+- Pool and threadpool gauges are read when /metrics is scraped, not
+  tracked on every call.
+"""
+
+import time
+from collections import Counter as StatementCounter
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool, QueuePool
+
+# === HTTP ===
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time from receiving the request until the response is fully sent.",
+    ["method", "route", "status"],
+)
+REQUESTS_IN_PROGRESS = Gauge("http_requests_in_progress", "Requests currently being handled.", ["method"])
+REQUEST_QUERIES = Histogram(
+    "http_request_db_queries",
+    "SQL statements executed while handling one request.",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100, 250),
+)
+
+# === threadpool（sync route 與 run_in_threadpool）===
+THREADPOOL_IN_USE = Gauge("threadpool_threads_in_use", "Worker threads of the default anyio limiter in use.")
+THREADPOOL_LIMIT = Gauge("threadpool_threads_limit", "Size of the default anyio thread limiter.")
+THREADPOOL_WAITING = Gauge("threadpool_tasks_waiting", "Calls waiting for a free worker thread.")
+
+# === SQLAlchemy 連線池 ===
+POOL_CHECKOUTS = Counter("db_pool_checkouts_total", "Connections checked out of the pool.")
+POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "Connections currently checked out.")
+POOL_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a pooled connection (including opening a new one).",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+
+# === 專案讀取快取 ===
+RESPONSE_CACHE_LOOKUPS = Counter(
+    "response_cache_lookups_total",
+    "Project read cache lookups.",
+    ["route", "result"],
+)
+RESPONSE_CACHE_INVALIDATIONS = Counter(
+    "response_cache_invalidations_total",
+    "Per-user project read cache invalidations after a write.",
+)
+RESPONSE_CACHE_ERRORS = Counter(
+    "response_cache_errors_total",
+    "Project read cache backend failures (treated as misses).",
+)
+
+# === Gemini ===
+LLM_LATENCY = Histogram(
+    "gemini_request_duration_seconds",
+    "Latency of Gemini generate_content calls.",
+    ["prompt_type", "status"],
+    buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300),
+)
+LLM_TOKENS = Counter("gemini_tokens_total", "Tokens used by Gemini calls.", ["prompt_type", "kind"])
+
+
+class RequestQueries:
+    # 放在 contextvar 裡的可變物件，threadpool 裡的 sync route 也能累加到同一個計數
+    __slots__ = ("count", "statements")
+
+    def __init__(self, track_statements: bool = False):
+        self.count = 0
+        # 只在開發模式記錄每句 SQL 的次數，正式環境只計數
+        self.statements = StatementCounter() if track_statements else None
+
+    def repeated(self, threshold: int) -> List[Tuple[str, int]]:
+        """Statements executed at least threshold times, most frequent first."""
+        if self.statements is None:
+            return []
+        return [(statement, count) for statement, count in self.statements.most_common() if count >= threshold]
+
+
+_request_queries: ContextVar[Optional[RequestQueries]] = ContextVar("request_queries", default=None)
+
+
+def start_request_queries(track_statements: bool = False) -> RequestQueries:
+    queries = RequestQueries(track_statements)
+    _request_queries.set(queries)
+    return queries
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    queries = _request_queries.get()
+    if queries is not None:
+        queries.count += 1
+        if queries.statements is not None:
+            queries.statements[statement] += 1
+
+
+@event.listens_for(Pool, "checkout")
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    POOL_CHECKOUTS.inc()
+    POOL_CHECKED_OUT.inc()
+
+
+@event.listens_for(Pool, "checkin")
+def _on_checkin(dbapi_connection, connection_record):
+    POOL_CHECKED_OUT.dec()
+
+
+class InstrumentedQueuePool(QueuePool):
+    # 連線池沒有「開始等待」的事件，改為量測 _do_get（取得連線，池滿時會阻塞）
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_WAIT.observe(time.perf_counter() - start)
+
+
+def update_threadpool_gauges() -> None:
+    """Read the default anyio thread limiter; call from async code (the /metrics route)."""
+    import anyio.to_thread
+
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    THREADPOOL_IN_USE.set(limiter.borrowed_tokens)
+    THREADPOOL_LIMIT.set(limiter.total_tokens)
+    THREADPOOL_WAITING.set(limiter.statistics().tasks_waiting)
+
+
+def generate_content(model, prompt, prompt_type: str):
+    """
+    Call model.generate_content(prompt), recording latency and token usage under prompt_type.
+
+    prompt_type is one of draft, refine, replan, reschedule or markdown.
+    """
+    start = time.perf_counter()
+    status = "error"
+    try:
+        response = model.generate_content(prompt)
+        status = "ok"
+    finally:
+        LLM_LATENCY.labels(prompt_type, status).observe(time.perf_counter() - start)
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        LLM_TOKENS.labels(prompt_type, "prompt").inc(getattr(usage, "prompt_token_count", 0) or 0)
+        LLM_TOKENS.labels(prompt_type, "completion").inc(getattr(usage, "candidates_token_count", 0) or 0)
+    return response
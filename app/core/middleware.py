@@ -0,0 +1,333 @@
+# ASGI middleware
+import logging
+import time
+import zlib
+from typing import Optional
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.core.metrics import REQUEST_LATENCY, REQUEST_QUERIES, REQUESTS_IN_PROGRESS, start_request_queries
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+query_logger = logging.getLogger("app.queries")
+
+
+class RequestSizeLimitMiddleware:
+    """
+    Reject request bodies larger than max_bytes on the given path prefixes with 413.
+
+    Checks Content-Length before the body is read, and also counts the bytes of
+    chunked bodies as they arrive, so oversized uploads fail before the
+    multipart parser spools them to disk. Once the limit is passed the app sees
+    the client disconnect, and whatever it answers is replaced by the 413.
+    """
+
+    def __init__(self, app: ASGIApp, max_bytes: int, path_prefixes: tuple = ("/",)):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_prefixes = path_prefixes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefixes):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_bytes:
+            await self._reject(scope, receive, send)
+            return
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            if exceeded:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # 不在 receive 裡丟例外（FastAPI 解析 form 時會把它換成 400），
+                    # 改成結束 body，等 app 返回後由這裡回 413
+                    exceeded = True
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if exceeded and not response_started:
+                # app 對截斷的 body 所產生的回應（通常是 400）不送出
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except Exception:
+            if not exceeded or response_started:
+                raise
+        if exceeded and not response_started:
+            await self._reject(scope, receive, send)
+
+    async def _reject(self, scope: Scope, receive: Receive, send: Send):
+        response = JSONResponse(
+            status_code=413,
+            content={"detail": f"Request body exceeds the {self.max_bytes} byte limit"},
+        )
+        await response(scope, receive, send)
+
+
+def parse_accept_encoding(value: str) -> dict:
+    """Map each coding in an Accept-Encoding header to its q-value."""
+    accepted = {}
+    for item in value.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, number = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(number)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding] = quality
+    return accepted
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    # 同分時 br 優先；q=0 表示客戶端明確拒絕
+    accepted = parse_accept_encoding(accept_encoding)
+    wildcard = accepted.get("*", 0.0)
+    best, best_quality = None, 0.0
+    for coding in ("br", "gzip") if brotli is not None else ("gzip",):
+        quality = accepted.get(coding, wildcard)
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+class GzipStream:
+    def __init__(self, level: int):
+        # wbits=31 輸出含 gzip header 的格式
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, flush: bool = False) -> bytes:
+        output = self._compressor.compress(data)
+        if flush:
+            output += self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        return output
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class BrotliStream:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes, flush: bool = False) -> bytes:
+        output = self._compressor.process(data)
+        if flush:
+            output += self._compressor.flush()
+        return output
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class CompressionMiddleware:
+    """
+    Compress responses with brotli (when installed) or gzip, per Accept-Encoding.
+
+    Only responses whose media type is in media_types are compressed, so PDFs,
+    images and other already-compressed files pass through untouched, as do
+    responses that already carry a Content-Encoding, partial (206) responses
+    and HEAD requests. A complete body smaller than minimum_size is sent as is.
+    Streamed bodies are compressed incrementally; text/event-stream chunks are
+    flushed one by one so every event reaches the client immediately.
+    Compressed responses get Vary: Accept-Encoding and a weak ETag.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        media_types: tuple = ("application/json",),
+        gzip_level: int = 6,
+        brotli_quality: int = 5,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.media_types = frozenset(media_type.lower() for media_type in media_types)
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, CompressionResponder(self, encoding, send))
+
+    def media_type(self, headers: Headers) -> str:
+        return headers.get("content-type", "").split(";")[0].strip().lower()
+
+    def should_compress(self, message: Message) -> bool:
+        headers = Headers(raw=message.get("headers", []))
+        return (
+            message["status"] not in (204, 206, 304)
+            and "content-encoding" not in headers
+            and "content-range" not in headers
+            and self.media_type(headers) in self.media_types
+        )
+
+    def compressor(self, encoding: str):
+        if encoding == "br":
+            return BrotliStream(self.brotli_quality)
+        return GzipStream(self.gzip_level)
+
+
+class CompressionResponder:
+    # 先扣住 http.response.start，看到第一段 body 才決定要不要壓縮
+
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.send = send
+        self.start: Optional[Message] = None
+        self.passthrough = False
+        self.stream = None
+        self.flush_each_chunk = False
+
+    async def __call__(self, message: Message):
+        if self.passthrough:
+            await self.send(message)
+            return
+
+        if message["type"] == "http.response.start":
+            if not self.middleware.should_compress(message):
+                self.passthrough = True
+                await self.send(message)
+                return
+            self.start = message
+            self.flush_each_chunk = self.middleware.media_type(Headers(raw=message["headers"])) == "text/event-stream"
+            return
+
+        if message["type"] != "http.response.body":
+            # pathsend 等擴充訊息無法壓縮，原樣送出
+            self.passthrough = True
+            await self.send(self.start)
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.stream is None:
+            headers = MutableHeaders(raw=list(self.start["headers"]))
+            headers.add_vary_header("Accept-Encoding")
+            if not more_body and len(body) < self.middleware.minimum_size:
+                self.passthrough = True
+                await self.send({**self.start, "headers": headers.raw})
+                await self.send(message)
+                return
+
+            self.stream = self.middleware.compressor(self.encoding)
+            headers["Content-Encoding"] = self.encoding
+            # 壓縮後內容與原本的 bytes 不同，強 ETag 改成弱 ETag
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                headers["ETag"] = f"W/{etag}"
+            if "content-length" in headers:
+                del headers["content-length"]
+            if not more_body:
+                data = self.stream.compress(body) + self.stream.finish()
+                headers["Content-Length"] = str(len(data))
+                await self.send({**self.start, "headers": headers.raw})
+                await self.send({"type": "http.response.body", "body": data})
+                return
+            await self.send({**self.start, "headers": headers.raw})
+
+        data = self.stream.compress(body, flush=self.flush_each_chunk)
+        if not more_body:
+            data += self.stream.finish()
+        if data or not more_body:
+            await self.send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+
+class MetricsMiddleware:
+    """
+    Record latency, in-flight requests and SQL statement counts per route.
+
+    The route label is the matched route template (set by the router in
+    scope["route"]), or "unmatched" for 404s, so paths with ids do not
+    create new series. Add it as the outermost middleware so the latency
+    covers compression and the whole response body.
+
+    With debug_queries (development and tests), every response carries an
+    X-Query-Count header with the statements run before the response
+    started, and a statement executed repeat_threshold times or more in one
+    request is logged as a warning on the "app.queries" logger: that is
+    almost always a lazy load or a query inside a loop.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        exclude_paths: tuple = ("/metrics",),
+        debug_queries: bool = False,
+        repeat_threshold: int = 5,
+    ):
+        self.app = app
+        self.exclude_paths = frozenset(exclude_paths)
+        self.debug_queries = debug_queries
+        self.repeat_threshold = repeat_threshold
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+        queries = start_request_queries(track_statements=self.debug_queries)
+        start = time.perf_counter()
+
+        async def tracking_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.debug_queries:
+                    headers = MutableHeaders(raw=list(message.get("headers", [])))
+                    headers["X-Query-Count"] = str(queries.count)
+                    message = {**message, "headers": headers.raw}
+            await send(message)
+
+        in_progress = REQUESTS_IN_PROGRESS.labels(method)
+        in_progress.inc()
+        try:
+            await self.app(scope, receive, tracking_send)
+        finally:
+            in_progress.dec()
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            REQUEST_LATENCY.labels(method, path, str(status)).observe(time.perf_counter() - start)
+            REQUEST_QUERIES.labels(path).observe(queries.count)
+            for statement, count in queries.repeated(self.repeat_threshold):
+                query_logger.warning(
+                    "%s %s ran the same statement %d times (possible N+1): %s",
+                    method, path, count, " ".join(statement.split()),
+                )
@@ -0,0 +1,31 @@
+# 自訂 response class
+from decimal import Decimal
+from typing import Any
+
+import orjson
+from starlette.responses import JSONResponse
+
+
+def _default(value: Any):
+    # orjson 原生支援 datetime / date / UUID，Numeric 欄位取出的 Decimal 轉成 float
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def orjson_dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class ORJSONResponse(JSONResponse):
+    """
+    JSON response rendered with orjson, for routes without a response_model.
+
+    Return it directly from the route so FastAPI skips jsonable_encoder and the
+    payload is encoded exactly once. Routes with a response_model should keep
+    the default response class: FastAPI then dumps the validated model straight
+    to JSON bytes in pydantic-core, which is faster still.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson_dumps(content)
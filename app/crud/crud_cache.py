@@ -0,0 +1,28 @@
+# 專案讀取的 read-through 快取
+from typing import Callable, Optional
+from app.crud.crud_version import on_user_change
+from app.services.response_cache import get_response_cache
+
+
+@on_user_change
+def invalidate_user(user_id) -> None:
+    # 寫入 commit 之後只清掉該使用者的快取
+    get_response_cache().invalidate(user_id)
+
+
+def read_through(route: str, user_id, key: str, load: Callable[[], Optional[bytes]]) -> Optional[bytes]:
+    """
+    Return the cached body of key, or load, cache and return it.
+
+    key must change whenever the content does (the routes use the ETag, which
+    carries the project version), so a body loaded concurrently with a write
+    is stored under the old key and never served again. None from load (not
+    found) is not cached.
+    """
+    cache = get_response_cache()
+    body = cache.get(route, user_id, key)
+    if body is None:
+        body = load()
+        if body is not None:
+            cache.set(user_id, key, body)
+    return body
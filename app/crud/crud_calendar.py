@@ -0,0 +1,89 @@
+# 行事曆訂閱 crud
+import uuid
+from typing import Iterator, List
+from fastapi import HTTPException
+from jose import JWTError, jwt
+from sqlalchemy.orm import Session
+from app.core.config import CALENDAR_FEED_BATCH_SIZE
+from app.crud.crud_version import get_project_versions, versions_digest
+from app.models import Project as ProjectModel, Milestone as MilestoneModel, Task as TaskModel
+from app.services.ical import event_lines, utc_stamp
+from app.utils import ALGORITHM, SECRET_KEY
+
+FEED_TOKEN_AUDIENCE = "calendar-feed"
+
+
+def create_feed_token(user_id) -> str:
+    # 行事曆 app 無法帶 Authorization header，改用網址上的簽章 token
+    return jwt.encode({"aud": FEED_TOKEN_AUDIENCE, "sub": str(user_id)}, SECRET_KEY, algorithm=ALGORITHM)
+
+
+def read_feed_token(token: str) -> uuid.UUID:
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM], audience=FEED_TOKEN_AUDIENCE)
+        return uuid.UUID(payload["sub"])
+    except (JWTError, KeyError, ValueError):
+        raise HTTPException(status_code=401, detail="Invalid calendar token")
+
+
+def feed_etag(db: Session, user_id) -> str:
+    # 內容含產生時間（DTSTAMP），所以用弱 ETag
+    return f'W/"calendar-{versions_digest(get_project_versions(db, user_id))}"'
+
+
+def iter_feed_events(db: Session, user_id) -> Iterator[List[str]]:
+    """
+    Yield the VEVENT lines of every milestone deadline and task due date of the user.
+
+    Rows are read through yield_per, which streams them from a server-side
+    cursor on PostgreSQL instead of loading the whole result first.
+    """
+    stamp = utc_stamp()
+    milestones = (
+        db.query(
+            MilestoneModel.id,
+            MilestoneModel.name,
+            MilestoneModel.summary,
+            MilestoneModel.end_time,
+            ProjectModel.name.label("project_name"),
+        )
+        .join(ProjectModel, MilestoneModel.project_id == ProjectModel.id)
+        .filter(ProjectModel.user_id == user_id)
+        .filter(MilestoneModel.end_time.isnot(None))
+        .yield_per(CALENDAR_FEED_BATCH_SIZE)
+    )
+    for row in milestones:
+        yield event_lines(
+            f"milestone-{row.id}",
+            row.end_time.date(),
+            f"Milestone: {row.name}",
+            stamp,
+            description=row.summary,
+            categories=row.project_name,
+        )
+
+    tasks = (
+        db.query(
+            TaskModel.id,
+            TaskModel.title,
+            TaskModel.description,
+            TaskModel.due_date,
+            TaskModel.is_completed,
+            ProjectModel.name.label("project_name"),
+        )
+        .join(MilestoneModel, TaskModel.milestone_id == MilestoneModel.id)
+        .join(ProjectModel, MilestoneModel.project_id == ProjectModel.id)
+        .filter(ProjectModel.user_id == user_id)
+        .filter(TaskModel.due_date.isnot(None))
+        .yield_per(CALENDAR_FEED_BATCH_SIZE)
+    )
+    for row in tasks:
+        yield event_lines(
+            f"task-{row.id}",
+            row.due_date,
+            row.title,
+            stamp,
+            description=row.description,
+            categories=row.project_name,
+            completed=bool(row.is_completed),
+        )
@@ -0,0 +1,90 @@
+# 稀疏欄位（fields= 查詢參數）
+import hashlib
+from typing import Callable, Dict, Optional, Tuple, Type, get_args, get_origin
+from fastapi import HTTPException
+from pydantic import BaseModel
+
+# 輸出欄位 -> (ORM 屬性名稱, 轉換函式或 None)
+OutputMap = Dict[str, Tuple[str, Optional[Callable]]]
+
+
+def item_model(annotation) -> Optional[Type[BaseModel]]:
+    # List[Schema] 或 Schema 取出 Schema，其他型別回傳 None
+    if get_origin(annotation) is not None:
+        args = [arg for arg in get_args(annotation) if item_model(arg)]
+        return item_model(args[0]) if args else None
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation
+    return None
+
+
+def parse_fields(value: Optional[str], schema: Type[BaseModel]) -> Optional[dict]:
+    """
+    Parse a fields= value such as "project_name,milestones.progress" into a nested selection.
+
+    The result maps each selected field to None (the whole field) or to the
+    selection inside a nested list, e.g.
+    {"project_name": None, "milestones": {"progress": None}}. Names are checked
+    against the response schema; an empty value selects everything (None).
+    """
+    if value is None:
+        return None
+    selection: dict = {}
+    for path in value.split(","):
+        path = path.strip()
+        if not path:
+            continue
+        node, model = selection, schema
+        parts = path.split(".")
+        for index, part in enumerate(parts):
+            field = model.model_fields.get(part) if model else None
+            if field is None:
+                raise HTTPException(status_code=400, detail=f"Unknown field: {path}")
+            if index == len(parts) - 1:
+                node[part] = None
+                break
+            if part in node and node[part] is None:
+                # 已經選了整個欄位
+                break
+            model = item_model(field.annotation)
+            node = node.setdefault(part, {})
+    return selection or None
+
+
+def wants(fields: Optional[dict], name: str) -> bool:
+    return fields is None or name in fields
+
+
+def sub_fields(fields: Optional[dict], name: str) -> Optional[dict]:
+    return None if fields is None else fields.get(name)
+
+
+def load_columns(model, output: OutputMap, fields: Optional[dict], *extra) -> list:
+    """ORM columns to pass to load_only: the primary key, those behind the selected output fields, plus extra."""
+    columns = {"id"} | {attr for name, (attr, _) in output.items() if wants(fields, name)}
+    columns |= {column.key for column in extra}
+    return [getattr(model, attr) for attr in sorted(columns)]
+
+
+def pick(obj, output: OutputMap, fields: Optional[dict]) -> dict:
+    # 只讀取有選到的屬性，避免觸發未載入欄位的 lazy load
+    item = {}
+    for name, (attr, convert) in output.items():
+        if wants(fields, name):
+            value = getattr(obj, attr)
+            item[name] = convert(value) if convert else value
+    return item
+
+
+def fields_key(fields: Optional[dict]) -> str:
+    # 依選取內容產生穩定的字串，放進 ETag 區分不同的欄位組合
+    if fields is None:
+        return ""
+
+    def render(selection: dict) -> str:
+        return ",".join(
+            name if selection[name] is None else f"{name}({render(selection[name])})"
+            for name in sorted(selection)
+        )
+
+    return hashlib.sha1(render(fields).encode()).hexdigest()[:12]
@@ -0,0 +1,116 @@
+# 檔案table crud
+import os
+import uuid
+from typing import Iterable, List, Union
+from fastapi import HTTPException
+from sqlalchemy import or_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from app.core.config import UPLOAD_DIR
+from app.models import BlobReservation, Files as FileModel, Project as ProjectModel
+from app.services import extraction, file_storage
+
+
+def get_owned_files(db: Session, user_id, file_ids: List[uuid.UUID]) -> List[FileModel]:
+    """Load files uploaded by the user or attached to one of the user's projects, in the requested order."""
+    files = (
+        db.query(FileModel)
+        .outerjoin(ProjectModel, FileModel.project_id == ProjectModel.id)
+        .filter(FileModel.id.in_(file_ids))
+        .filter(or_(FileModel.user_id == user_id, ProjectModel.user_id == user_id))
+        .all()
+    )
+    by_id = {f.id: f for f in files}
+    missing = [str(file_id) for file_id in file_ids if file_id not in by_id]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"File not found or not owned by user: {', '.join(missing)}")
+    return [by_id[file_id] for file_id in dict.fromkeys(file_ids)]
+
+
+def get_accessible_blob(db: Session, user_id, sha256: str) -> FileModel:
+    """Return a file with the given content hash that the user uploaded or that belongs to one of the user's projects."""
+    db_file = (
+        db.query(FileModel)
+        .outerjoin(ProjectModel, FileModel.project_id == ProjectModel.id)
+        .filter(FileModel.sha256 == sha256)
+        .filter(or_(FileModel.user_id == user_id, ProjectModel.user_id == user_id))
+        .first()
+    )
+    if not db_file:
+        raise HTTPException(status_code=404, detail="File not found")
+    return db_file
+
+
+def stored_file_source(db_file: FileModel) -> Union[file_storage.StoredBlob, str]:
+    """Return a document source for a stored file: a blob reference, or a path for legacy uploads."""
+    if db_file.sha256:
+        return file_storage.StoredBlob(db_file.sha256)
+    # 內容定址之前上傳的檔案，url 存的是 /uploads/<檔名>
+    return os.path.join(UPLOAD_DIR, os.path.basename(db_file.url))
+
+
+def _lock_blob(db: Session, sha256: str) -> BlobReservation:
+    """Lock the blob's reservation row (creating it if needed) until the next commit."""
+    # 用 row lock 讓所有 instance 對同一個 blob 的保留與刪除依序進行
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    db.execute(dialect.insert(BlobReservation).values(sha256=sha256, count=0).on_conflict_do_nothing())
+    return db.query(BlobReservation).filter_by(sha256=sha256).with_for_update().one()
+
+
+def reserve_blob(db: Session, sha256: str) -> None:
+    """
+    Keep a blob from being deleted until release_blobs is called.
+
+    Call it before the blob is committed to storage, and release it once the
+    Files row pointing to the blob is committed (or the upload failed).
+    delete_unreferenced_blobs skips reserved blobs, so a duplicate upload that
+    reuses an existing blob cannot lose it to a concurrent delete on any
+    instance. The reservation is committed right away.
+    """
+    reservation = _lock_blob(db, sha256)
+    reservation.count += 1
+    db.commit()
+
+
+def release_blobs(db: Session, sha256s: Iterable[str]) -> None:
+    """Drop one reservation per hash taken by reserve_blob."""
+    for sha256 in sha256s:
+        reservation = _lock_blob(db, sha256)
+        reservation.count -= 1
+        if reservation.count <= 0:
+            db.delete(reservation)
+        db.commit()
+
+
+def delete_unreferenced_blobs(db: Session, sha256s: Iterable[str]) -> List[str]:
+    """
+    Remove blobs that no Files row points to anymore.
+
+    The reference count of a blob is the number of Files rows with its hash,
+    so this must run after the rows have been deleted and committed. Each
+    blob is checked again under the lock of its reservation row right before
+    it is removed, and blobs reserved by an upload that has not committed its
+    Files row yet are kept.
+
+    Returns:
+        the hashes whose blobs were removed
+    """
+    sha256s = {sha for sha in sha256s if sha}
+    if not sha256s:
+        return []
+    referenced = {
+        sha for (sha,) in db.query(FileModel.sha256).filter(FileModel.sha256.in_(sha256s)).distinct()
+    }
+    removed = []
+    for sha in sorted(sha256s - referenced):
+        reservation = _lock_blob(db, sha)
+        # 期間可能有相同內容的上傳保留或引用了這個 blob，鎖內重新確認
+        if reservation.count > 0 or db.query(FileModel.id).filter(FileModel.sha256 == sha).first():
+            db.commit()
+            continue
+        file_storage.remove_blob(sha)
+        extraction.delete_from_storage(sha)
+        db.delete(reservation)
+        db.commit()
+        removed.append(sha)
+    return removed
@@ -1,94 +1,150 @@
 # crud/crud_project.py
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session, joinedload, load_only, selectinload
 from decimal import Decimal
+from types import SimpleNamespace
 from app.schemas.project import *
 from typing import Optional
-from app.models import Project as ProjectModel, Milestone as MilestoneModel, Task as TaskModel, ChatHistory as ChatHistoryModel
+from app.models import Project as ProjectModel, Milestone as MilestoneModel, Task as TaskModel, ChatHistory as ChatHistoryModel, Files as FileModel
 from fastapi import HTTPException
 from app.models import User
 from sqlalchemy.dialects.postgresql import UUID
 import uuid
 from app.gemini.reschedule_project import reschedule_project, update_project_task
-
-
-def get_all_projects_with_progress(db: Session, current_user: User):
-    projects = db.query(ProjectModel).filter(ProjectModel.user_id == current_user.id).all()
+from app.services import vector_store
+from app.crud.crud_fields import load_columns, pick, sub_fields, wants
+from app.crud.crud_file import delete_unreferenced_blobs
+from app.crud.crud_reschedule import apply_or_conflict, apply_schedule, normalize, project_snapshot, read_token, schedule_diff
+from app.crud.crud_version import get_project_version, get_project_versions, mark_user_changed, touch_project, version_conflict
+
+
+def to_float(value) -> float:
+    return float(value or 0.0)
+
+
+# 各回應欄位對應的 ORM 屬性；指定 fields= 時只載入並輸出選到的欄位
+PROJECT_LIST_OUTPUT = {
+    "project_id": ("id", str),
+    "project_name": ("name", None),
+    "due_date": ("due_date", None),
+    "current_milestone": ("current_milestone", lambda value: value or ""),
+}
+PROJECT_DETAIL_OUTPUT = {
+    "project_name": ("name", None),
+    "project_summary": ("summary", None),
+    "project_start_time": ("start_time", None),
+    "project_end_time": ("end_time", None),
+    "estimated_loading": ("estimated_loading", to_float),
+    "version": ("version", None),
+}
+PROJECT_TREE_OUTPUT = {"project_id": ("id", str), **PROJECT_DETAIL_OUTPUT}
+MILESTONE_SUMMARY_OUTPUT = {
+    "milestone_id": ("id", str),
+    "milestone_name": ("name", None),
+    "ddl": ("end_time", None),
+    "estimated_loading": ("estimated_loading", to_float),
+}
+MILESTONE_DETAIL_OUTPUT = {
+    "milestone_id": ("id", str),
+    "milestone_name": ("name", None),
+    "milestone_summary": ("summary", None),
+    "milestone_start_time": ("start_time", None),
+    "milestone_end_time": ("end_time", None),
+    "milestone_estimated_loading": ("estimated_loading", to_float),
+}
+TASK_OUTPUT = {
+    "task_name": ("title", None),
+    "task_id": ("id", str),
+    "task_ddl_day": ("due_date", None),
+    "description": ("description", lambda value: value or ""),
+    "estimated_loading": ("estimated_loading", to_float),
+    "isCompleted": ("is_completed", None),
+}
+# 計算進度需要的任務欄位
+PROGRESS_COLUMNS = (TaskModel.estimated_loading, TaskModel.is_completed)
+
+
+def get_all_projects_with_progress(db: Session, current_user: User, fields: Optional[dict] = None):
+    projects = (
+        db.query(ProjectModel)
+        .options(load_only(*load_columns(ProjectModel, PROJECT_LIST_OUTPUT, fields)))
+        .filter(ProjectModel.user_id == current_user.id)
+        .all()
+    )
+    # 所有專案的進度由一個 grouped query 算出，不再每個專案各查一次
+    totals = project_loading_totals(db, current_user.id) if wants(fields, "progress") else {}
     result = []
 
     for project in projects:
-        milestone = (
-            db.query(MilestoneModel)
-            .filter(MilestoneModel.project_id == project.id)
-            .order_by(MilestoneModel.end_time.desc())
-            .first()
-        )
-        progress = 0.0
-        if milestone:
-            total_loading = sum(
-            task.estimated_loading for ms in project.milestones for task in ms.tasks if task.estimated_loading is not None
-            )
-            completed_loading = sum(
-            task.estimated_loading for ms in project.milestones for task in ms.tasks if task.is_completed and task.estimated_loading is not None
-            )
-            progress = (completed_loading / total_loading) if total_loading > 0 else 0.0
-
-        # print(project.name)
-        # print(progress)
-        result.append({
-            "project_id": str(project.id),
-            "project_name": project.name,
-            "due_date": project.due_date,
-            "progress": progress,
-            "current_milestone": project.current_milestone or ""
-        })
+        item = pick(project, PROJECT_LIST_OUTPUT, fields)
+        if wants(fields, "progress"):
+            item["progress"] = loading_progress(*totals.get(project.id, (0.0, 0.0)))
+
+        result.append(item)
 
     return result
 
-def get_project_detail_from_db(db: Session, user_id: str, project_id: uuid.UUID) -> Optional[ProjectDetailSchema]:
-    project = db.query(ProjectModel).filter(
-        ProjectModel.id == project_id,
-        ProjectModel.user_id == user_id
-    ).first()
+def loading_totals(tasks) -> tuple:
+    # (全部工作量, 已完成工作量)，進度以工作量加權
+    total = sum(float(task.estimated_loading or 0) for task in tasks)
+    done = sum(float(task.estimated_loading or 0) for task in tasks if task.is_completed)
+    return total, done
+
+
+def loading_progress(total: float, done: float) -> float:
+    return done / total if total > 0 else 0.0
+
+
+def task_item(task: TaskModel, fields: Optional[dict] = None) -> dict:
+    return pick(task, TASK_OUTPUT, fields)
+
+def get_project_detail_from_db(db: Session, user_id: str, project_id: uuid.UUID, fields: Optional[dict] = None) -> Optional[dict]:
+    # 回傳 dict，由 route 的 response_model 驗證一次後直接序列化成 JSON bytes
+    project = (
+        db.query(ProjectModel)
+        .options(load_only(*load_columns(ProjectModel, PROJECT_DETAIL_OUTPUT, fields)))
+        .filter(ProjectModel.id == project_id, ProjectModel.user_id == user_id)
+        .first()
+    )
 
     if not project:
         return None
 
-    milestones = db.query(MilestoneModel).filter(
-        MilestoneModel.project_id == project_id
-    ).all()
+    detail = pick(project, PROJECT_DETAIL_OUTPUT, fields)
+    if not wants(fields, "milestones"):
+        return detail
 
-    milestone_summaries = []
-    for ms in milestones:
-        progress = 0.0
-        if ms.tasks:
-            # progress = sum(task.is_completed for task in ms.tasks) / len(ms.tasks)
-            progress = (
-                sum(task.estimated_loading for task in ms.tasks if task.is_completed)
-                / sum(task.estimated_loading for task in ms.tasks)
-                if sum(task.estimated_loading for task in ms.tasks) > 0 else 0.0
-            )
-        milestone_summaries.append(MilestoneSummarySchema(
-            milestone_id=str(ms.id),
-            milestone_name=ms.name,
-            ddl=ms.end_time,
-            estimated_loading=float(ms.estimated_loading or 0.0),
-            progress=progress
-        ))
-
-    return ProjectDetailSchema(
-        project_name=project.name,
-        project_summary=project.summary,
-        project_start_time=project.start_time,
-        project_end_time=project.end_time,
-        estimated_loading=float(project.estimated_loading or 0.0),
-        milestones=milestone_summaries
+    milestone_fields = sub_fields(fields, "milestones")
+    query = db.query(MilestoneModel).options(
+        load_only(*load_columns(MilestoneModel, MILESTONE_SUMMARY_OUTPUT, milestone_fields))
     )
+    if wants(milestone_fields, "progress"):
+        # 進度需要任務的工作量，一個 selectinload 取回所有里程碑的任務
+        query = query.options(selectinload(MilestoneModel.tasks).load_only(*PROGRESS_COLUMNS))
+    milestones = query.filter(MilestoneModel.project_id == project_id).all()
 
-def get_milestone_detail_from_db(db: Session, user_id: str, project_id: uuid.UUID, milestone_id: uuid.UUID) -> Optional[MilestoneDetailSchema]:
-    milestone = (
+    milestone_summaries = []
+    for ms in milestones:
+        item = pick(ms, MILESTONE_SUMMARY_OUTPUT, milestone_fields)
+        if wants(milestone_fields, "progress"):
+            item["progress"] = loading_progress(*loading_totals(ms.tasks))
+        milestone_summaries.append(item)
+    detail["milestones"] = milestone_summaries
+    return detail
+
+def get_milestone_detail_from_db(db: Session, user_id: str, project_id: uuid.UUID, milestone_id: uuid.UUID, fields: Optional[dict] = None) -> Optional[dict]:
+    task_fields = sub_fields(fields, "tasks")
+    # 回傳 version 時要用 project_id 查專案的版本號
+    extra = (MilestoneModel.project_id,) if wants(fields, "version") else ()
+    query = (
         db.query(MilestoneModel)
         .join(ProjectModel)
-        .filter(
+        .options(load_only(*load_columns(MilestoneModel, MILESTONE_DETAIL_OUTPUT, fields, *extra)))
+    )
+    if wants(fields, "tasks"):
+        query = query.options(selectinload(MilestoneModel.tasks).load_only(*load_columns(TaskModel, TASK_OUTPUT, task_fields)))
+    milestone = (
+        query.filter(
             MilestoneModel.id == milestone_id,
             MilestoneModel.project_id == project_id,
             ProjectModel.user_id == user_id
@@ -99,27 +155,126 @@ def get_milestone_detail_from_db(db: Session, user_id: str, project_id: uuid.UUI
     if not milestone:
         return None
 
-    tasks = [
-        TaskSchema(
-            task_name=task.title,
-            task_id=str(task.id),
-            task_ddl_day=task.due_date,
-            estimated_loading=float(task.estimated_loading or 0.0),
-            description=task.description or "",
-            isCompleted=task.is_completed
+    detail = pick(milestone, MILESTONE_DETAIL_OUTPUT, fields)
+    if wants(fields, "tasks"):
+        detail["tasks"] = [task_item(task, task_fields) for task in milestone.tasks]
+    if wants(fields, "version"):
+        detail["version"] = db.query(ProjectModel.version).filter(ProjectModel.id == milestone.project_id).scalar()
+    return detail
+
+def milestone_loading_totals(db: Session, project_id: uuid.UUID) -> dict:
+    """(total, done) estimated_loading of every milestone of the project, in one grouped query."""
+    loading = func.coalesce(TaskModel.estimated_loading, 0)
+    rows = (
+        db.query(
+            TaskModel.milestone_id,
+            func.sum(loading),
+            func.sum(case((TaskModel.is_completed.is_(True), loading), else_=0)),
+        )
+        .join(MilestoneModel, TaskModel.milestone_id == MilestoneModel.id)
+        .filter(MilestoneModel.project_id == project_id)
+        .group_by(TaskModel.milestone_id)
+        .all()
+    )
+    return {milestone_id: (float(total or 0), float(done or 0)) for milestone_id, total, done in rows}
+
+
+def project_loading_totals(db: Session, user_id) -> dict:
+    """(total, done) estimated_loading of every project of the user, in one grouped query."""
+    loading = func.coalesce(TaskModel.estimated_loading, 0)
+    rows = (
+        db.query(
+            MilestoneModel.project_id,
+            func.sum(loading),
+            func.sum(case((TaskModel.is_completed.is_(True), loading), else_=0)),
         )
-        for task in milestone.tasks
-    ]
-
-    return MilestoneDetailSchema(
-        milestone_id=str(milestone.id),
-        milestone_name=milestone.name,
-        milestone_summary=milestone.summary,
-        milestone_start_time=milestone.start_time,
-        milestone_estimated_loading = milestone.estimated_loading,
-        milestone_end_time=milestone.end_time,
-        tasks=tasks
+        .join(TaskModel, TaskModel.milestone_id == MilestoneModel.id)
+        .join(ProjectModel, MilestoneModel.project_id == ProjectModel.id)
+        .filter(ProjectModel.user_id == user_id)
+        .group_by(MilestoneModel.project_id)
+        .all()
+    )
+    return {project_id: (float(total or 0), float(done or 0)) for project_id, total, done in rows}
+
+
+def get_project_tree_from_db(db: Session, user_id: str, project_id: uuid.UUID, exclude_completed: bool = False, fields: Optional[dict] = None) -> Optional[dict]:
+    """
+    The project with all its milestones and tasks, loaded in a fixed number of queries.
+
+    One query for the project, then one selectinload query for the milestones
+    and one for all of their tasks, whatever the size of the tree. With
+    exclude_completed the completed tasks are filtered out in SQL and progress
+    comes from one extra grouped query, so it still counts every task. With
+    fields, only the selected columns (and levels of the tree) are loaded.
+    """
+    milestone_fields = sub_fields(fields, "milestones")
+    task_fields = sub_fields(milestone_fields, "tasks")
+    with_milestones = wants(fields, "milestones")
+    with_tasks = with_milestones and wants(milestone_fields, "tasks")
+    with_progress = wants(fields, "progress") or (with_milestones and wants(milestone_fields, "progress"))
+    # 載入的任務不是全部任務時，進度改用 group by 查詢計算
+    progress_query = with_progress and (exclude_completed or not with_tasks)
+
+    query = db.query(ProjectModel).options(load_only(*load_columns(ProjectModel, PROJECT_TREE_OUTPUT, fields)))
+    if with_milestones:
+        milestones = selectinload(ProjectModel.milestones).load_only(
+            *load_columns(MilestoneModel, MILESTONE_DETAIL_OUTPUT, milestone_fields, MilestoneModel.start_time)
+        )
+        if with_tasks:
+            tasks = MilestoneModel.tasks
+            if exclude_completed:
+                tasks = tasks.and_(TaskModel.is_completed.isnot(True))
+            extra = (TaskModel.due_date, TaskModel.title) + (() if progress_query else PROGRESS_COLUMNS)
+            milestones = milestones.selectinload(tasks).load_only(*load_columns(TaskModel, TASK_OUTPUT, task_fields, *extra))
+        query = query.options(milestones)
+    project = (
+        query.filter(ProjectModel.id == project_id, ProjectModel.user_id == user_id)
+        # session 裡已載入的 tasks 集合也要套用 exclude_completed 的條件
+        .populate_existing()
+        .first()
     )
+    if not project:
+        return None
+
+    totals = {}
+    if progress_query:
+        totals = milestone_loading_totals(db, project.id)
+    elif with_progress:
+        totals = {ms.id: loading_totals(ms.tasks) for ms in project.milestones}
+
+    tree = pick(project, PROJECT_TREE_OUTPUT, fields)
+    if wants(fields, "progress"):
+        tree["progress"] = loading_progress(
+            sum(total for total, _ in totals.values()),
+            sum(done for _, done in totals.values()),
+        )
+    if not with_milestones:
+        return tree
+
+    milestones = []
+    for ms in sorted(project.milestones, key=lambda ms: ms.start_time):
+        item = pick(ms, MILESTONE_DETAIL_OUTPUT, milestone_fields)
+        if wants(milestone_fields, "progress"):
+            item["progress"] = loading_progress(*totals.get(ms.id, (0.0, 0.0)))
+        if with_tasks:
+            item["tasks"] = [
+                task_item(task, task_fields)
+                for task in sorted(ms.tasks, key=lambda task: (task.due_date is None, task.due_date, task.title))
+            ]
+        milestones.append(item)
+    tree["milestones"] = milestones
+    return tree
+
+def search_project_context(db: Session, user_id: str, project_id: uuid.UUID, query: str, top_k: int = 5, source: Optional[str] = None) -> list:
+    project = db.query(ProjectModel.id).filter(
+        ProjectModel.id == project_id,
+        ProjectModel.user_id == user_id
+    ).first()
+
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    return vector_store.search(project_id, query, top_k=top_k, source=source)
 
 def update_project(db: Session, payload: UpdateProjectRequest) -> UpdateProjectResponse:
     project = db.query(ProjectModel).filter(ProjectModel.id == payload.project_id).first()
@@ -127,6 +282,8 @@ def update_project(db: Session, payload: UpdateProjectRequest) -> UpdateProjectR
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
 
+    # 先檢查並遞增版本號，同時鎖住專案這一列直到 commit
+    version = touch_project(db, project.id, payload.expected_version)
     project.name = payload.changed_name
     project.summary = payload.changed_project_summary
     project.start_time = payload.changed_project_start_time
@@ -141,7 +298,8 @@ def update_project(db: Session, payload: UpdateProjectRequest) -> UpdateProjectR
             "changed_name": project.name,
             "changed_project_start_time": project.start_time,
             "changed_project_end_time": project.end_time
-        }
+        },
+        version=version
     )
 
 def update_milestone(db: Session, payload: UpdateMilestoneRequest) -> UpdateMilestoneResponse:
@@ -153,6 +311,7 @@ def update_milestone(db: Session, payload: UpdateMilestoneRequest) -> UpdateMile
     if not milestone:
         raise HTTPException(status_code=404, detail="Milestone not found")
 
+    version = touch_project(db, milestone.project_id, payload.expected_version)
     milestone.summary = payload.changed_milestone_summary
     milestone.start_time = payload.changed_milestone_start_time
     milestone.end_time = payload.changed_milestone_end_time
@@ -165,7 +324,8 @@ def update_milestone(db: Session, payload: UpdateMilestoneRequest) -> UpdateMile
             "changed_milestone_summary": milestone.summary,
             "changed_milestone_start_time": milestone.start_time,
             "changed_milestone_end_time": milestone.end_time
-        }
+        },
+        version=version
     )
 
 def delete_project_in_db(db: Session, user_id: str, project_id: uuid.UUID) -> dict:
@@ -177,25 +337,18 @@ def delete_project_in_db(db: Session, user_id: str, project_id: uuid.UUID) -> di
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
 
+    file_hashes = [sha for (sha,) in db.query(FileModel.sha256).filter(FileModel.project_id == project_id)]
     db.delete(project)
+    mark_user_changed(db, project.user_id)
     db.commit()
+    vector_store.delete_project_store(project_id)
+    # 其他紀錄仍引用的 blob 保留，沒有引用的才從磁碟刪除
+    delete_unreferenced_blobs(db, file_hashes)
 
     return {"status": "success", "message": "Project successfully deleted"}
 
 def create_new_task(db: Session, payload: CreateTaskRequest) -> CreateTaskResponse:
-    
-    new_task = TaskModel(
-        title=payload.name,
-        due_date=payload.ddl,
-        estimated_loading=payload.estimated_loading,
-        description=payload.description,
-        is_completed=False,
-        milestone_id=payload.milestone_id
-    )
-    db.add(new_task)
-    db.flush()  # Flush to get the new ID assigned by the database
-    # new_task_id = new_task.id
-    # Load milestone with all relationships
+    # 加載 milestone 所屬專案的完整資料
     milestone = db.query(MilestoneModel)\
         .options(
             joinedload(MilestoneModel.project)
@@ -204,115 +357,56 @@ def create_new_task(db: Session, payload: CreateTaskRequest) -> CreateTaskRespon
         )\
         .filter(MilestoneModel.id == payload.milestone_id)\
         .first()
-    
 
     if not milestone:
         raise HTTPException(status_code=404, detail="Milestone not found")
+    project_id = milestone.project_id
+    target = str(milestone.id)
 
-    # Convert project to dict with all relationships
-    project_data = {
-        "name": milestone.project.name,
-        "summary": milestone.project.summary or "",
-        "start_time": milestone.project.start_time.isoformat() if milestone.project.start_time else "",
-        "end_time": milestone.project.end_time.isoformat() if milestone.project.end_time else "",
-        "due_date": milestone.project.due_date.isoformat() if milestone.project.due_date else "",
-        "estimated_loading": float(milestone.project.estimated_loading) if milestone.project.estimated_loading else 0.0,
-        "current_milestone": "null",
-        "milestones": [
-            {
-                "id": str(m.id),
-                "name": m.name,
-                "summary": m.summary or "",
-                "start_time": m.start_time.isoformat() if m.start_time else "",
-                "end_time": m.end_time.isoformat() if m.end_time else "",
-                "estimated_loading": float(m.estimated_loading) if m.estimated_loading else 0.0,
-                "project_id": str(m.project_id),
-                "tasks": [
-                    {
-                        "id": str(t.id),
-                        "title": t.title,
-                        "description": t.description or "",
-                        "due_date": t.due_date.isoformat() if t.due_date else "",
-                        "estimated_loading": float(t.estimated_loading) if t.estimated_loading else 0.0,
-                        "is_completed": t.is_completed or False,
-                        "milestone_id": str(t.milestone_id)
-                    }
-                    for t in m.tasks
-                ]
-            }
-            for m in milestone.project.milestones
-        ]
-    }
-    rescheduled_project = reschedule_project(project_data, payload, new_task.id)
-    
-    print("re:", rescheduled_project)
-    # Create the new task
-    
-    # Update milestone's estimated_loading
     try:
-        print("try")
-        # Update all tasks and milestones based on the rescheduled project
-        projects = rescheduled_project.get("projects", [])
-        if projects and isinstance(projects[0], dict):
-            for milestone_data in projects[0].get("milestones", []):
-                # Find the milestone in the database
-                print("milestone data: ", milestone_data)
-                milestone = db.query(MilestoneModel).filter(
-                    MilestoneModel.id == uuid.UUID(milestone_data['id']),
-                    MilestoneModel.project_id == uuid.UUID(milestone_data['project_id'])
-                ).first()
-                
-                if not milestone:
-                    continue
-                    
-                # Update milestone dates if needed
-                if 'start_time' in milestone_data:
-                    milestone.start_time = milestone_data['start_time']
-                if 'end_time' in milestone_data:
-                    milestone.end_time = milestone_data['end_time']
-                if 'estimated_loading' in milestone_data:
-                    # print("es:", milestone_data['estimated_loading'])
-                    milestone.estimated_loading = Decimal(str(milestone_data['estimated_loading'] or 0))
-                    
-                # Update tasks for this milestone
-                for task_data in milestone_data.get('tasks', []):
-                    task = db.query(TaskModel).filter(
-                        TaskModel.id == task_data['id'],
-                        TaskModel.milestone_id == milestone.id
-                    ).first()
-                    
-                    if task:
-                        # Update existing task
-                        if 'due_date' in task_data:
-                            task.due_date = task_data['due_date']
-                        if 'estimated_loading' in task_data:
-                            task.estimated_loading = Decimal(str(task_data['estimated_loading'] or 0))
-                        if 'title' in task_data:
-                            task.title = task_data['title']
-                        if 'description' in task_data:
-                            task.description = task_data.get('description', '')
-                        if 'is_completed' in task_data:
-                            task.is_completed = task_data['is_completed']
-                    else:
-                        # This should be our new task
-                        if task_data['title'] == payload.name:  # Match by title as a fallback
-                            new_task.due_date = task_data.get('due_date', new_task.due_date)
-                            new_task.estimated_loading = Decimal(str(task_data.get('estimated_loading', 0)))
-        
+        if payload.reschedule_token:
+            # 重新套用上次衝突時的排程結果，不再呼叫 LLM
+            diff = read_token(payload.reschedule_token, project_id, target)
+            version, conflicts, new_task = apply_schedule(db, project_id, diff, payload.expected_version)
+        else:
+            project = milestone.project
+            if payload.expected_version is not None and payload.expected_version != project.version:
+                raise version_conflict(project.version)
+            base_version = project.version
+            project_data = project_snapshot(project)
+            new_task_data = {
+                "id": str(uuid.uuid4()),
+                "milestone_id": target,
+                "title": payload.name,
+                "description": payload.description,
+                "due_date": normalize("due_date", payload.ddl),
+                "estimated_loading": payload.estimated_loading,
+            }
+            # 呼叫 LLM 期間不佔用 transaction
+            db.rollback()
+
+            rescheduled_project = reschedule_project(project_data, payload, new_task_data["id"])
+            diff = schedule_diff(project_data, rescheduled_project, new_task=new_task_data)
+            version, conflicts, new_task = apply_or_conflict(db, project_id, target, diff, base_version)
+
         db.commit()
         return CreateTaskResponse(
-        status="success",
-        task={
-            "task_id": str(new_task.id),
-            "name": new_task.title,
-            "ddl": new_task.due_date,
-            "milestone_id": str(new_task.milestone_id),
-            "estimated_loading": float(new_task.estimated_loading) if new_task.estimated_loading else 0.0,
-            "isCompleted": new_task.is_completed,
-            "description": new_task.description or ""
-        }
-    )
-        
+            status="success",
+            task={
+                "task_id": str(new_task.id),
+                "name": new_task.title,
+                "ddl": new_task.due_date,
+                "milestone_id": str(new_task.milestone_id),
+                "estimated_loading": float(new_task.estimated_loading) if new_task.estimated_loading else 0.0,
+                "isCompleted": new_task.is_completed,
+                "description": new_task.description or ""
+            },
+            version=version,
+            conflicts=conflicts
+        )
+
+    except HTTPException:
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to update tasks: {str(e)}")
@@ -331,118 +425,46 @@ def update_existing_task(db: Session, payload: UpdateTaskRequest) -> UpdateTaskR
 
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
+    task_id = task.id
+    project_id = task.milestone.project_id
+    target = str(task_id)
 
-    # Get the complete project data
-    project_data = {
-        "name": task.milestone.project.name,
-        "summary": task.milestone.project.summary or "",
-        "start_time": task.milestone.project.start_time.isoformat() if task.milestone.project.start_time else "",
-        "end_time": task.milestone.project.end_time.isoformat() if task.milestone.project.end_time else "",
-        "due_date": task.milestone.project.due_date.isoformat() if task.milestone.project.due_date else "",
-        "estimated_loading": float(task.milestone.project.estimated_loading) if task.milestone.project.estimated_loading else 0.0,
-        "current_milestone": "null",
-        "milestones": [
-            {
-                "id": str(m.id),
-                "name": m.name,
-                "summary": m.summary or "",
-                "start_time": m.start_time.isoformat() if m.start_time else "",
-                "end_time": m.end_time.isoformat() if m.end_time else "",
-                "estimated_loading": float(m.estimated_loading) if m.estimated_loading else 0.0,
-                "project_id": str(m.project_id),
-                "tasks": [
-                    {
-                        "id": str(t.id),
-                        "title": t.title,
-                        "description": t.description or "",
-                        "due_date": t.due_date.isoformat() if t.due_date else "",
-                        "estimated_loading": float(t.estimated_loading) if t.estimated_loading else 0.0,
-                        "is_completed": t.is_completed or False,
-                        "milestone_id": str(t.milestone_id)
-                    }
-                    for t in m.tasks
-                ]
-            }
-            for m in task.milestone.project.milestones
-        ]
-    }
-
-    # 存儲舊值用於日誌
-    old_title = task.title
-    old_loading = task.estimated_loading
-    
-    # 更新任務字段
-    if hasattr(payload, 'changed_name') and payload.changed_name is not None:
-        task.title = payload.changed_name
-    if hasattr(payload, 'changed_ddl') and payload.changed_ddl is not None:
-        task.due_date = payload.changed_ddl
-    if hasattr(payload, 'changed_estimated_loading') and payload.changed_estimated_loading is not None:
-        task.estimated_loading = Decimal(str(payload.changed_estimated_loading))
-    if hasattr(payload, 'changed_description') and payload.changed_description is not None:
-        task.description = payload.changed_description
-    
-    rescheduled_project = update_project_task(project_data, task)
     try:
-        # Process the rescheduled project data
-        for milestone_data in rescheduled_project.get('milestones', []):
-            # Find the milestone in the database
-            milestone = db.query(MilestoneModel).filter(
-                MilestoneModel.id == milestone_data['id'],
-                MilestoneModel.project_id == project.id
-            ).first()
-            
-            if not milestone:
-                continue
-                
-            # Update milestone dates if needed
-            if 'start_time' in milestone_data:
-                milestone.start_time = milestone_data['start_time']
-            if 'end_time' in milestone_data:
-                milestone.end_time = milestone_data['end_time']
-            if 'estimated_loading' in milestone_data:
-                milestone.estimated_loading = Decimal(str(milestone_data['estimated_loading'] or 0))
-                
-            # Update tasks for this milestone
-            for task_data in milestone_data.get('tasks', []):
-                task = db.query(TaskModel).filter(
-                    TaskModel.id == task_data['id'],
-                    TaskModel.milestone_id == milestone.id
-                ).first()
-                
-                if task:
-                    # Update existing task
-                    if 'due_date' in task_data:
-                        task.due_date = task_data['due_date']
-                    if 'estimated_loading' in task_data:
-                        task.estimated_loading = Decimal(str(task_data['estimated_loading'] or 0))
-                    if 'title' in task_data:
-                        task.title = task_data['title']
-                    if 'description' in task_data:
-                        task.description = task_data.get('description', '')
-                    if 'is_completed' in task_data:
-                        task.is_completed = task_data['is_completed']
-
-        db.commit()
-        
-        # Update milestone's estimated_loading
-        if task.milestone:
-            db.refresh(task.milestone)
-            if task.milestone.tasks:
-                task.milestone.estimated_loading = sum(
-                    Decimal(str(t.estimated_loading or 0)) 
-                    for t in task.milestone.tasks 
-                    if t.estimated_loading is not None
-                )
-        
-        # Update project's estimated_loading
-        if task.milestone and task.milestone.project:
-            task.milestone.project.estimated_loading = sum(
-                Decimal(str(m.estimated_loading or 0)) 
-                for m in task.milestone.project.milestones 
-                if m.estimated_loading is not None
+        if payload.reschedule_token:
+            # 重新套用上次衝突時的排程結果，不再呼叫 LLM
+            diff = read_token(payload.reschedule_token, project_id, target)
+            version, conflicts, _ = apply_schedule(db, project_id, diff, payload.expected_version)
+        else:
+            project = task.milestone.project
+            if payload.expected_version is not None and payload.expected_version != project.version:
+                raise version_conflict(project.version)
+            base_version = project.version
+            project_data = project_snapshot(project)
+
+            # 使用者指定的修改，LLM 的結果不會覆蓋這些欄位
+            edits = {"title": payload.changed_name, "due_date": payload.changed_ddl}
+            if payload.changed_estimated_loading is not None:
+                edits["estimated_loading"] = payload.changed_estimated_loading
+            if payload.changed_description is not None:
+                edits["description"] = payload.changed_description
+            updated_task = SimpleNamespace(
+                id=task.id,
+                title=edits["title"],
+                description=edits.get("description", task.description),
+                due_date=edits["due_date"],
+                estimated_loading=edits.get("estimated_loading", task.estimated_loading),
+                is_completed=task.is_completed,
+                milestone_id=task.milestone_id,
             )
-        
+            # 呼叫 LLM 期間不佔用 transaction
+            db.rollback()
+
+            rescheduled_project = update_project_task(project_data, updated_task)
+            diff = schedule_diff(project_data, rescheduled_project, edits={target: edits})
+            version, conflicts, _ = apply_or_conflict(db, project_id, target, diff, base_version)
+
         db.commit()
+        task = db.get(TaskModel, task_id)
         return UpdateTaskResponse(
             status="success",
             updated_fields={
@@ -450,9 +472,13 @@ def update_existing_task(db: Session, payload: UpdateTaskRequest) -> UpdateTaskR
                 "changed_ddl": task.due_date,
                 "changed_estimated_loading": float(task.estimated_loading) if task.estimated_loading is not None else None,
                 "changed_description": task.description
-            }
+            },
+            version=version,
+            conflicts=conflicts
         )
-        
+
+    except HTTPException:
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to update task: {str(e)}")
@@ -502,16 +528,23 @@ def delete_existing_task(db: Session, task_id: uuid.UUID) -> dict:
     
     # 添加聊天歷史記錄
     if project:
+        project_id = project.id
+        chat_entry_id = uuid.uuid4()
         chat_entry = ChatHistoryModel(
+            id=chat_entry_id,
             user_id=project.user_id,
             project_id=project.id,
             message=f"Deleted task: {task_title}",
             sender="system"
         )
         db.add(chat_entry)
+        touch_project(db, project.id)
     
     db.commit()
 
+    if project:
+        vector_store.submit_chat_message(project_id, chat_entry_id, "system", f"Deleted task: {task_title}")
+
     return {
         "status": "success",
         "message": "Task successfully deleted"
@@ -0,0 +1,257 @@
+# 重新排程：LLM 結果轉成差異，再以版本檢查套用
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+from fastapi import HTTPException
+from jose import JWTError, jwt
+from sqlalchemy.orm import Session
+from app.core.config import RESCHEDULE_TOKEN_TTL_SECONDS
+from app.crud.crud_task import refresh_loading_rollups
+from app.crud.crud_version import touch_project
+from app.models import Milestone as MilestoneModel, Task as TaskModel
+from app.utils import ALGORITHM, SECRET_KEY
+
+# 完成狀態只由使用者修改，不採用 LLM 回傳的值；milestone 工作量由任務加總
+TASK_FIELDS = ("title", "description", "due_date", "estimated_loading")
+MILESTONE_FIELDS = ("start_time", "end_time")
+TOKEN_AUDIENCE = "reschedule"
+
+
+def project_snapshot(project) -> dict:
+    """Serialize a loaded project tree into the dict the reschedule prompts expect."""
+    return {
+        "name": project.name,
+        "summary": project.summary or "",
+        "start_time": project.start_time.isoformat() if project.start_time else "",
+        "end_time": project.end_time.isoformat() if project.end_time else "",
+        "due_date": project.due_date.isoformat() if project.due_date else "",
+        "estimated_loading": float(project.estimated_loading) if project.estimated_loading else 0.0,
+        "current_milestone": "null",
+        "milestones": [
+            {
+                "id": str(m.id),
+                "name": m.name,
+                "summary": m.summary or "",
+                "start_time": m.start_time.isoformat() if m.start_time else "",
+                "end_time": m.end_time.isoformat() if m.end_time else "",
+                "estimated_loading": float(m.estimated_loading) if m.estimated_loading else 0.0,
+                "project_id": str(m.project_id),
+                "tasks": [
+                    {
+                        "id": str(t.id),
+                        "title": t.title,
+                        "description": t.description or "",
+                        "due_date": t.due_date.isoformat() if t.due_date else "",
+                        "estimated_loading": float(t.estimated_loading) if t.estimated_loading else 0.0,
+                        "is_completed": t.is_completed or False,
+                        "milestone_id": str(t.milestone_id)
+                    }
+                    for t in m.tasks
+                ]
+            }
+            for m in project.milestones
+        ]
+    }
+
+
+def normalize(field: str, value):
+    """Convert a column or LLM value to its JSON form in a diff; None means "no value"."""
+    if value is None or value == "":
+        return None
+    if field == "due_date":
+        if isinstance(value, datetime):
+            value = value.date()
+        return (value if isinstance(value, date) else date.fromisoformat(str(value)[:10])).isoformat()
+    if field in ("start_time", "end_time"):
+        if not isinstance(value, datetime):
+            value = datetime.fromisoformat(str(value))
+        return value.replace(tzinfo=None).isoformat()
+    if field == "estimated_loading":
+        return float(value)
+    return str(value)
+
+
+def to_column(field: str, value):
+    if value is None:
+        return None
+    if field == "due_date":
+        return date.fromisoformat(value)
+    if field in ("start_time", "end_time"):
+        return datetime.fromisoformat(value)
+    if field == "estimated_loading":
+        return Decimal(str(value))
+    return value
+
+
+def _rescheduled_milestones(rescheduled: dict) -> List[dict]:
+    # 模型有時包在 {"projects": [...]} 裡，有時直接回傳專案
+    projects = rescheduled.get("projects")
+    if projects and isinstance(projects[0], dict):
+        return projects[0].get("milestones", [])
+    return rescheduled.get("milestones", [])
+
+
+def _field_changes(fields, base: dict, target: dict) -> dict:
+    changes = {}
+    for field in fields:
+        if field not in target:
+            continue
+        try:
+            value = normalize(field, target[field])
+        except (TypeError, ValueError):
+            # LLM 回傳無法解析的值時保留原值
+            continue
+        base_value = normalize(field, base.get(field))
+        if value is not None and value != base_value:
+            changes[field] = {"base": base_value, "value": value}
+    return changes
+
+
+def schedule_diff(
+    snapshot: dict,
+    rescheduled: dict,
+    new_task: Optional[dict] = None,
+    edits: Optional[Dict[str, dict]] = None,
+) -> dict:
+    """
+    Compare a rescheduled project with the snapshot it was generated from.
+
+    Only changed fields are kept, each with its value in the snapshot, so the
+    diff can be applied later on top of a newer version of the project.
+
+    Args:
+        new_task: the task being created, matched in the LLM output by id or title;
+            its due date and loading are taken from the LLM when present
+        edits: {task_id: {field: value}} the user asked for explicitly; they
+            win over the LLM's values for the same fields
+    """
+    milestones = {m["id"]: m for m in snapshot["milestones"]}
+    tasks = {t["id"]: t for m in snapshot["milestones"] for t in m["tasks"]}
+    diff = {"milestones": {}, "tasks": {}, "new_task": new_task}
+
+    for milestone_data in _rescheduled_milestones(rescheduled):
+        base = milestones.get(str(milestone_data.get("id")))
+        if base:
+            changes = _field_changes(MILESTONE_FIELDS, base, milestone_data)
+            if changes:
+                diff["milestones"][base["id"]] = changes
+        for task_data in milestone_data.get("tasks", []):
+            task_id = str(task_data.get("id"))
+            if task_id in tasks:
+                changes = _field_changes(TASK_FIELDS, tasks[task_id], task_data)
+                if changes:
+                    diff["tasks"][task_id] = changes
+            elif new_task and (task_id == new_task["id"] or task_data.get("title") == new_task["title"]):
+                for field, change in _field_changes(("due_date", "estimated_loading"), {}, task_data).items():
+                    new_task[field] = change["value"]
+
+    for task_id, fields in (edits or {}).items():
+        changes = _field_changes(TASK_FIELDS, tasks[task_id], fields)
+        diff["tasks"].setdefault(task_id, {}).update(changes)
+        if not diff["tasks"][task_id]:
+            del diff["tasks"][task_id]
+    return diff
+
+
+def apply_schedule(
+    db: Session,
+    project_id,
+    diff: dict,
+    expected_version: Optional[int] = None,
+) -> Tuple[int, List[str], Optional[TaskModel]]:
+    """
+    Apply a reschedule diff in the current transaction (the caller commits).
+
+    The project version is checked and bumped first, which also locks the
+    project row until commit. A field is only written while it still holds the
+    diff's base value: edits made after the snapshot are kept and reported as
+    conflicts ("task:<id>:<field>") instead of being overwritten.
+
+    Returns:
+        (new project version, conflicts, created task or None)
+    """
+    version = touch_project(db, project_id, expected_version)
+
+    def load(model, ids):
+        if not ids:
+            return {}
+        rows = db.query(model).filter(model.id.in_([uuid.UUID(i) for i in ids])).all()
+        return {str(row.id): row for row in rows}
+
+    conflicts = []
+    reloaded = set()
+    for kind, rows, entries in (
+        ("milestone", load(MilestoneModel, list(diff["milestones"])), diff["milestones"]),
+        ("task", load(TaskModel, list(diff["tasks"])), diff["tasks"]),
+    ):
+        for row_id, changes in entries.items():
+            row = rows.get(row_id)
+            if row is None:
+                conflicts.append(f"{kind}:{row_id}")
+                continue
+            for field, change in changes.items():
+                current = normalize(field, getattr(row, field))
+                if current == change["value"]:
+                    continue
+                if current != change["base"]:
+                    conflicts.append(f"{kind}:{row_id}:{field}")
+                    continue
+                setattr(row, field, to_column(field, change["value"]))
+                if field == "estimated_loading":
+                    reloaded.add(row.milestone_id)
+
+    task = None
+    new_task = diff.get("new_task")
+    if new_task:
+        # 重新套用同一個 token 時不重複建立任務
+        task = db.get(TaskModel, uuid.UUID(new_task["id"]))
+        if task is None:
+            task = TaskModel(
+                id=uuid.UUID(new_task["id"]),
+                title=new_task["title"],
+                description=new_task.get("description"),
+                due_date=to_column("due_date", new_task.get("due_date")),
+                estimated_loading=to_column("estimated_loading", new_task.get("estimated_loading")),
+                is_completed=False,
+                milestone_id=uuid.UUID(new_task["milestone_id"]),
+            )
+            db.add(task)
+            reloaded.add(task.milestone_id)
+
+    db.flush()
+    if reloaded:
+        refresh_loading_rollups(db, reloaded, {project_id})
+    return version, conflicts, task
+
+
+def issue_token(project_id, target: str, diff: dict) -> str:
+    """Sign a diff so the client can re-apply it later without another LLM call."""
+    expires = datetime.now(timezone.utc) + timedelta(seconds=RESCHEDULE_TOKEN_TTL_SECONDS)
+    payload = {"aud": TOKEN_AUDIENCE, "project_id": str(project_id), "target": target, "diff": diff, "exp": expires}
+    return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
+
+
+def read_token(token: str, project_id, target: str) -> dict:
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM], audience=TOKEN_AUDIENCE)
+    except JWTError:
+        raise HTTPException(status_code=400, detail="Invalid or expired reschedule token")
+    if payload.get("project_id") != str(project_id) or payload.get("target") != target:
+        raise HTTPException(status_code=400, detail="Reschedule token does not match this request")
+    return payload["diff"]
+
+
+def apply_or_conflict(db: Session, project_id, target: str, diff: dict, base_version: int):
+    """
+    Apply a freshly generated diff against the version it was computed from.
+
+    When the project changed while the LLM was running, the 409 carries a
+    reschedule_token that re-applies the same diff without calling the LLM again.
+    """
+    try:
+        return apply_schedule(db, project_id, diff, base_version)
+    except HTTPException as e:
+        if e.status_code == 409:
+            e.detail["reschedule_token"] = issue_token(project_id, target, diff)
+        raise
@@ -0,0 +1,145 @@
+# 任務table crud
+import uuid
+from typing import Dict, List
+from sqlalchemy import case, func, select, update
+from sqlalchemy.orm import Session
+from app.crud.crud_version import touch_projects
+from app.models import Project as ProjectModel, Milestone as MilestoneModel, Task as TaskModel
+from app.schemas.project import BatchTaskChange, BatchTaskUpdateResponse
+
+# API 欄位名稱 -> Task 欄位
+BATCH_TASK_FIELDS = {
+    "isCompleted": "is_completed",
+    "title": "title",
+    "due_date": "due_date",
+    "estimated_loading": "estimated_loading",
+}
+
+
+def get_projects_progress(db: Session, project_ids) -> Dict[uuid.UUID, float]:
+    """Completed share of estimated loading per project, in one grouped query."""
+    if not project_ids:
+        return {}
+    loading = func.coalesce(TaskModel.estimated_loading, 0)
+    rows = (
+        db.query(
+            MilestoneModel.project_id,
+            func.sum(loading).label("total"),
+            func.sum(case((TaskModel.is_completed.is_(True), loading), else_=0)).label("completed"),
+        )
+        .join(TaskModel, TaskModel.milestone_id == MilestoneModel.id)
+        .filter(MilestoneModel.project_id.in_(project_ids))
+        .group_by(MilestoneModel.project_id)
+        .all()
+    )
+    progress = {project_id: 0.0 for project_id in project_ids}
+    for project_id, total, completed in rows:
+        progress[project_id] = float(completed) / float(total) if total else 0.0
+    return progress
+
+
+def bulk_update_statement(changed: Dict[uuid.UUID, dict]):
+    """
+    Build one UPDATE for tasks with different changes.
+
+    Each column is set with CASE id WHEN ... so every task only gets its own
+    values, and columns a task did not change keep their current value.
+    """
+    columns = sorted({column for values in changed.values() for column in values})
+    assignments = {}
+    for column in columns:
+        current = getattr(TaskModel, column)
+        whens = [(TaskModel.id == task_id, values[column]) for task_id, values in changed.items() if column in values]
+        assignments[column] = case(*whens, else_=current)
+    return update(TaskModel).where(TaskModel.id.in_(list(changed))).values(assignments)
+
+
+def refresh_loading_rollups(db: Session, milestone_ids, project_ids) -> None:
+    """
+    Recompute milestone and project estimated_loading with two UPDATEs.
+
+    Milestones are set to the sum of their tasks and projects to the sum of their
+    milestones, the same rollup update_existing_task does for a single task.
+    """
+    if milestone_ids:
+        task_total = (
+            select(func.coalesce(func.sum(TaskModel.estimated_loading), 0))
+            .where(TaskModel.milestone_id == MilestoneModel.id)
+            .scalar_subquery()
+        )
+        db.execute(
+            update(MilestoneModel)
+            .where(MilestoneModel.id.in_(list(milestone_ids)))
+            .values(estimated_loading=task_total)
+            .execution_options(synchronize_session=False)
+        )
+    if project_ids:
+        milestone_total = (
+            select(func.coalesce(func.sum(MilestoneModel.estimated_loading), 0))
+            .where(MilestoneModel.project_id == ProjectModel.id)
+            .scalar_subquery()
+        )
+        db.execute(
+            update(ProjectModel)
+            .where(ProjectModel.id.in_(list(project_ids)))
+            .values(estimated_loading=milestone_total)
+            .execution_options(synchronize_session=False)
+        )
+
+
+def batch_update_tasks(db: Session, user_id, changes: List[BatchTaskChange]) -> BatchTaskUpdateResponse:
+    """
+    Apply field changes to many tasks in one transaction.
+
+    Ownership of every task is checked with a single query, all updates are sent
+    as one bulk UPDATE, and the loading rollups and project progress are
+    recomputed once for the milestones and projects the batch touched. Tasks that do not exist or belong to
+    another user are reported as not_found and left untouched.
+    """
+    task_ids = list(dict.fromkeys(change.task_id for change in changes))
+    owned = {
+        task_id: (milestone_id, project_id)
+        for task_id, milestone_id, project_id in db.query(TaskModel.id, TaskModel.milestone_id, MilestoneModel.project_id)
+        .join(MilestoneModel, TaskModel.milestone_id == MilestoneModel.id)
+        .join(ProjectModel, MilestoneModel.project_id == ProjectModel.id)
+        .filter(ProjectModel.user_id == user_id)
+        .filter(TaskModel.id.in_(task_ids))
+        .all()
+    }
+
+    # 同一個任務出現多次時依序合併，後面的值覆蓋前面的
+    merged: Dict[uuid.UUID, dict] = {}
+    results = []
+    for change in changes:
+        fields = change.model_dump(exclude_unset=True, exclude={"task_id"})
+        if change.task_id not in owned:
+            results.append({"task_id": str(change.task_id), "status": "not_found", "updated_fields": []})
+            continue
+        values = {BATCH_TASK_FIELDS[name]: value for name, value in fields.items() if value is not None}
+        merged.setdefault(change.task_id, {}).update(values)
+        results.append({
+            "task_id": str(change.task_id),
+            "status": "updated" if values else "unchanged",
+            "updated_fields": [name for name, value in fields.items() if value is not None],
+        })
+
+    changed = {task_id: values for task_id, values in merged.items() if values}
+    touched = {owned[task_id][1] for task_id in changed}
+    if changed:
+        db.execute(bulk_update_statement(changed).execution_options(synchronize_session=False))
+        # 只有工作量變動時才需要重算 milestone 與專案的總工作量
+        reloaded = [task_id for task_id, values in changed.items() if "estimated_loading" in values]
+        if reloaded:
+            refresh_loading_rollups(
+                db,
+                {owned[task_id][0] for task_id in reloaded},
+                {owned[task_id][1] for task_id in reloaded},
+            )
+        touch_projects(db, touched)
+        db.commit()
+
+    progress = get_projects_progress(db, touched)
+    return BatchTaskUpdateResponse(
+        results=results,
+        projects=[{"project_id": str(project_id), "progress": value} for project_id, value in progress.items()],
+    )
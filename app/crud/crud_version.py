@@ -0,0 +1,109 @@
+# 專案版本號 crud
+import hashlib
+import uuid
+from typing import Callable, List, Optional
+from fastapi import HTTPException
+from sqlalchemy import event, update
+from sqlalchemy.orm import Session
+from app.models import Project as ProjectModel, Milestone as MilestoneModel
+
+# 有寫入的使用者記在 session 上，commit 之後才通知快取失效，
+# 避免其他 request 在 commit 前讀到舊資料又放回快取
+CHANGED_USERS_KEY = "changed_users"
+_change_listeners: List[Callable] = []
+
+
+def on_user_change(callback: Callable) -> Callable:
+    """Register callback(user_id), called after a commit that changed the user's projects."""
+    _change_listeners.append(callback)
+    return callback
+
+
+def mark_user_changed(db: Session, user_id) -> None:
+    db.info.setdefault(CHANGED_USERS_KEY, set()).add(user_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _notify_changed_users(session):
+    for user_id in session.info.pop(CHANGED_USERS_KEY, ()):
+        for callback in _change_listeners:
+            callback(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changed_users(session):
+    session.info.pop(CHANGED_USERS_KEY, None)
+
+
+def version_conflict(current_version: int, **extra) -> HTTPException:
+    return HTTPException(
+        status_code=409,
+        detail={"message": "Project was modified by another request", "current_version": current_version, **extra},
+    )
+
+
+def touch_project(db: Session, project_id, expected_version: Optional[int] = None) -> int:
+    """
+    Increment the project's version in the current transaction and return the new value.
+
+    With expected_version the increment is a compare-and-set
+    (UPDATE ... WHERE version = expected_version); when another write got there
+    first the transaction is rolled back and a 409 with the current version is raised.
+    The UPDATE also locks the project row until commit, so call it before
+    reading the rows the write is based on.
+    """
+    statement = update(ProjectModel).where(ProjectModel.id == project_id)
+    if expected_version is not None:
+        statement = statement.where(ProjectModel.version == expected_version)
+    row = db.execute(
+        statement.values(version=ProjectModel.version + 1)
+        .returning(ProjectModel.version, ProjectModel.user_id)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if row:
+        mark_user_changed(db, row.user_id)
+        return row.version
+
+    current = db.query(ProjectModel.version).filter(ProjectModel.id == project_id).scalar()
+    db.rollback()
+    if current is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    raise version_conflict(current)
+
+
+def touch_projects(db: Session, project_ids) -> None:
+    # 版本號在資料庫端遞增，與其他寫入在同一個 transaction 內 commit
+    project_ids = [project_id for project_id in set(project_ids) if project_id is not None]
+    if not project_ids:
+        return
+    rows = db.execute(
+        update(ProjectModel)
+        .where(ProjectModel.id.in_(project_ids))
+        .values(version=ProjectModel.version + 1)
+        .returning(ProjectModel.user_id)
+        .execution_options(synchronize_session=False)
+    )
+    for row in rows:
+        mark_user_changed(db, row.user_id)
+
+
+def get_project_version(db: Session, user_id, project_id: uuid.UUID, milestone_id: Optional[uuid.UUID] = None) -> Optional[int]:
+    """Return the project's version, or None when the project (or milestone) is not the user's."""
+    query = db.query(ProjectModel.version).filter(
+        ProjectModel.id == project_id,
+        ProjectModel.user_id == user_id
+    )
+    if milestone_id is not None:
+        query = query.join(MilestoneModel, MilestoneModel.project_id == ProjectModel.id).filter(MilestoneModel.id == milestone_id)
+    row = query.first()
+    return row.version if row else None
+
+
+def get_project_versions(db: Session, user_id) -> list:
+    """(id, version) of every project of the user, ordered by id."""
+    return db.query(ProjectModel.id, ProjectModel.version).filter(ProjectModel.user_id == user_id).order_by(ProjectModel.id).all()
+
+
+def versions_digest(versions) -> str:
+    """Hash of (id, version) pairs; changes whenever any of the user's projects is written, added or deleted."""
+    return hashlib.sha1(",".join(f"{project_id}:{version}" for project_id, version in versions).encode()).hexdigest()
@@ -0,0 +1,93 @@
+# 跨專案每日工作量
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+from typing import Dict, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.core.config import WORKLOAD_CACHE_SIZE
+from app.crud.crud_version import on_user_change
+from app.models import Project as ProjectModel, Milestone as MilestoneModel, Task as TaskModel
+
+# (user_id, start, end) -> {due_date: (loading, task_count)}，依最近使用排序
+_cache: "OrderedDict[tuple, Dict[date, Tuple[float, int]]]" = OrderedDict()
+# 每個使用者的失效次數，查詢期間有寫入 commit 時結果不放進快取
+_generations: Dict[object, int] = {}
+_lock = threading.Lock()
+
+
+@on_user_change
+def invalidate_user(user_id) -> None:
+    with _lock:
+        _generations[user_id] = _generations.get(user_id, 0) + 1
+        for key in [key for key in _cache if key[0] == user_id]:
+            del _cache[key]
+
+
+def clear_cache() -> None:
+    with _lock:
+        _cache.clear()
+
+
+def query_daily_loading(db: Session, user_id, start: date, end: date) -> Dict[date, Tuple[float, int]]:
+    """Sum estimated_loading of incomplete tasks per due date across all of the user's projects, in one grouped query."""
+    rows = (
+        db.query(
+            TaskModel.due_date,
+            func.sum(func.coalesce(TaskModel.estimated_loading, 0)),
+            func.count(TaskModel.id),
+        )
+        .join(MilestoneModel, TaskModel.milestone_id == MilestoneModel.id)
+        .join(ProjectModel, MilestoneModel.project_id == ProjectModel.id)
+        .filter(ProjectModel.user_id == user_id)
+        .filter(TaskModel.is_completed.isnot(True))
+        .filter(TaskModel.due_date >= start, TaskModel.due_date <= end)
+        .group_by(TaskModel.due_date)
+        .all()
+    )
+    return {due_date: (float(loading or 0), count) for due_date, loading, count in rows}
+
+
+def get_daily_loading(db: Session, user_id, start: date, end: date) -> Dict[date, Tuple[float, int]]:
+    key = (user_id, start, end)
+    with _lock:
+        cached = _cache.get(key)
+        if cached is not None:
+            _cache.move_to_end(key)
+            return cached
+        generation = _generations.get(user_id, 0)
+
+    loading = query_daily_loading(db, user_id, start, end)
+    with _lock:
+        if _generations.get(user_id, 0) == generation:
+            _cache[key] = loading
+            while len(_cache) > WORKLOAD_CACHE_SIZE:
+                _cache.popitem(last=False)
+    return loading
+
+
+def get_workload(db: Session, user_id, start: date, end: date, capacity: float) -> dict:
+    """
+    Daily workload over [start, end], one entry per day including empty days.
+
+    A day is overloaded when its summed loading exceeds capacity. Only the sums
+    are cached, so different capacities share the same cache entry.
+    """
+    loading = get_daily_loading(db, user_id, start, end)
+    days = []
+    for offset in range((end - start).days + 1):
+        day = start + timedelta(days=offset)
+        total, count = loading.get(day, (0.0, 0))
+        days.append({
+            "date": day,
+            "estimated_loading": total,
+            "task_count": count,
+            "overloaded": total > capacity,
+        })
+    return {
+        "start_date": start,
+        "end_date": end,
+        "capacity": capacity,
+        "days": days,
+        "overloaded_days": [day["date"] for day in days if day["overloaded"]],
+    }
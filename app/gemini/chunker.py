@@ -0,0 +1,158 @@
+"""
+Token-bounded chunking with boilerplate deduplication for retrieval.
+
+Extracted paragraphs are normalized and hashed so repeated headers, footers and
+copy-pasted blocks are embedded only once, then packed into chunks of about
+target_tokens tokens. Consecutive chunks share overlap_tokens tokens of context,
+and paragraphs longer than the window are split with the same overlap.
+
+Token counts are approximate: every CJK character, Latin word/number and
+punctuation mark counts as one token, which tracks the embedding model's
+word-piece count closely enough for sizing chunks.
+"""
+
+import hashlib
+import re
+import statistics
+from typing import Dict, List, Tuple
+
+from app.core.config import CHUNK_TARGET_TOKENS, CHUNK_OVERLAP_TOKENS
+
+TOKEN_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]|[A-Za-z0-9]+|[^\sA-Za-z0-9]")
+WHITESPACE_RE = re.compile(r"\s+")
+DIGITS_RE = re.compile(r"\d+")
+
+
+def count_tokens(text: str) -> int:
+    return len(TOKEN_RE.findall(text))
+
+
+def token_spans(text: str) -> List[Tuple[int, int]]:
+    return [m.span() for m in TOKEN_RE.finditer(text)]
+
+
+def boilerplate_hash(paragraph: str) -> str:
+    # 數字統一替換，讓「第 3 頁」與「第 4 頁」這類頁首頁尾被視為同一段
+    normalized = DIGITS_RE.sub("#", WHITESPACE_RE.sub(" ", paragraph).strip().lower())
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+def deduplicate(paragraphs: List[str]) -> Tuple[List[str], Dict[str, int]]:
+    """
+    Keep only the first occurrence of each normalized paragraph.
+
+    Returns:
+        (unique paragraphs, {hash: occurrence count} for paragraphs seen more than once)
+    """
+    seen: Dict[str, int] = {}
+    unique = []
+    for para in paragraphs:
+        key = boilerplate_hash(para)
+        if key in seen:
+            seen[key] += 1
+            continue
+        seen[key] = 1
+        unique.append(para)
+    repeated = {key: count for key, count in seen.items() if count > 1}
+    return unique, repeated
+
+
+def split_long_paragraph(paragraph: str, target_tokens: int, overlap_tokens: int) -> List[str]:
+    spans = token_spans(paragraph)
+    if len(spans) <= target_tokens:
+        return [paragraph]
+
+    step = max(target_tokens - overlap_tokens, 1)
+    pieces = []
+    for start in range(0, len(spans), step):
+        window = spans[start:start + target_tokens]
+        pieces.append(paragraph[window[0][0]:window[-1][1]])
+        if start + target_tokens >= len(spans):
+            break
+    return pieces
+
+
+def overlap_tail(text: str, overlap_tokens: int) -> str:
+    if overlap_tokens <= 0:
+        return ""
+    spans = token_spans(text)
+    if len(spans) <= overlap_tokens:
+        return text
+    return text[spans[-overlap_tokens][0]:]
+
+
+def chunk_paragraphs(
+    paragraphs: List[str],
+    target_tokens: int = CHUNK_TARGET_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+) -> Tuple[List[str], dict]:
+    """
+    Deduplicate paragraphs and pack them into token-bounded chunks.
+
+    Returns:
+        (chunks, stats) where stats summarizes the input, the removed duplicates
+        and the resulting chunk sizes, for tuning target_tokens/overlap_tokens.
+    """
+    unique, repeated = deduplicate(paragraphs)
+
+    chunks: List[str] = []
+    buffer: List[str] = []
+    buffer_tokens = 0
+    has_new_text = False
+
+    def flush():
+        nonlocal buffer, buffer_tokens, has_new_text
+        chunk = "\n\n".join(buffer)
+        chunks.append(chunk)
+        tail = overlap_tail(chunk, overlap_tokens)
+        buffer = [tail] if tail and tail != chunk else []
+        buffer_tokens = count_tokens(tail) if buffer else 0
+        has_new_text = False
+
+    for para in unique:
+        for piece in split_long_paragraph(para, target_tokens, overlap_tokens):
+            piece_tokens = count_tokens(piece)
+            if has_new_text and buffer_tokens + piece_tokens > target_tokens:
+                flush()
+                # 上一塊的重疊尾巴加上這段仍然超過上限時，只保留這段
+                if buffer_tokens + piece_tokens > target_tokens:
+                    buffer, buffer_tokens = [], 0
+            buffer.append(piece)
+            buffer_tokens += piece_tokens
+            has_new_text = True
+
+    # 只剩上一塊的重疊尾巴時不需要再輸出
+    if has_new_text:
+        flush()
+
+    sizes = [count_tokens(chunk) for chunk in chunks]
+    stats = {
+        "input_paragraphs": len(paragraphs),
+        "unique_paragraphs": len(unique),
+        "duplicates_removed": len(paragraphs) - len(unique),
+        "repeated_blocks": len(repeated),
+        "chunks": len(chunks),
+        "target_tokens": target_tokens,
+        "overlap_tokens": overlap_tokens,
+        "input_tokens": sum(count_tokens(p) for p in paragraphs),
+        "chunk_tokens_total": sum(sizes),
+        "chunk_tokens_min": min(sizes) if sizes else 0,
+        "chunk_tokens_mean": round(statistics.mean(sizes), 1) if sizes else 0.0,
+        "chunk_tokens_max": max(sizes) if sizes else 0,
+    }
+    return chunks, stats
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    from app.gemini.pdf_extraction import iter_paragraphs
+
+    parser = argparse.ArgumentParser(description="Print chunking statistics for a PDF")
+    parser.add_argument("pdf")
+    parser.add_argument("--target", type=int, default=CHUNK_TARGET_TOKENS)
+    parser.add_argument("--overlap", type=int, default=CHUNK_OVERLAP_TOKENS)
+    args = parser.parse_args()
+
+    _, stats = chunk_paragraphs(list(iter_paragraphs(args.pdf)), args.target, args.overlap)
+    print(json.dumps(stats, indent=2))
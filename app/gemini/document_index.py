@@ -0,0 +1,90 @@
+"""
+Building the cached retrieval index of a document.
+
+A document's index is keyed by the SHA-256 of its contents plus the chunking
+parameters, so the draft pipeline, upload-time extraction and the project
+vector store all share one embedding cache entry per document.
+"""
+
+from typing import List, Optional
+
+import faiss
+import numpy as np
+
+from app.core.config import CHUNK_TARGET_TOKENS, CHUNK_OVERLAP_TOKENS
+from app.gemini.chunker import chunk_paragraphs
+from app.gemini.embedding import encode_query, encode_texts
+from app.gemini.embedding_cache import content_hash, file_content_hash, load_cached_index, store_index
+from app.services.file_storage import StoredBlob
+
+
+def create_faiss_index(paragraphs):
+    embeddings = encode_texts(paragraphs)
+    index = faiss.IndexFlatL2(embeddings.shape[1])
+    index.add(embeddings)
+    return index, embeddings
+
+
+def cache_key_from_hash(digest: str) -> str:
+    # 切塊參數不同時產生的 chunks 也不同，所以一起放進 key
+    return f"{digest}-t{CHUNK_TARGET_TOKENS}-o{CHUNK_OVERLAP_TOKENS}"
+
+
+def document_cache_key(source) -> str:
+    # source 可以是 PDF bytes、已存檔案的路徑（以 mmap 計算 hash，不整份讀進記憶體）或 StoredBlob
+    if isinstance(source, StoredBlob):
+        # 內容定址的 blob 本身就帶著 hash，不需要讀檔
+        return cache_key_from_hash(source.sha256)
+    if isinstance(source, str):
+        return cache_key_from_hash(file_content_hash(source))
+    return cache_key_from_hash(content_hash(source))
+
+
+def build_faiss_index(key: str, paragraphs: List[str], meta: Optional[dict] = None):
+    chunks, stats = chunk_paragraphs(paragraphs)
+    index, embeddings = create_faiss_index(chunks)
+    store_index(key, chunks, index, embeddings, meta={**(meta or {}), "chunk_stats": stats})
+    return chunks, index, embeddings
+
+
+# 在 process pool 中執行，只回傳數量，避免在 process 間傳遞 FAISS index
+def build_document_index(key: str, paragraphs: List[str], meta: Optional[dict] = None) -> int:
+    chunks, _, _ = build_faiss_index(key, paragraphs, meta)
+    return len(chunks)
+
+
+class MissingDocumentIndex(RuntimeError):
+    """Raised by retrieve_from_documents when cache entries were evicted after the documents were prepared."""
+
+    def __init__(self, keys: List[str]):
+        # args 只放 keys，跨 process pickle 回來時才能還原
+        super().__init__(list(keys))
+        self.keys = list(keys)
+
+    def __str__(self):
+        return f"Document indexes missing from the cache: {', '.join(self.keys)}"
+
+
+def retrieve_relevant_chunks(query, paragraphs, index, embeddings, top_k):
+    query_vec = encode_query(query)
+    D, I = index.search(query_vec, min(top_k, index.ntotal))
+    return [paragraphs[i] for i in I[0] if i >= 0]
+
+
+# 在 process pool 中執行，只回傳挑出來的段落，避免在 process 間傳遞 FAISS index
+def retrieve_from_documents(keys, query: str, top_k: int):
+    """Search the cached indexes of one or more documents as a single retrieval index."""
+    documents = [load_cached_index(key) for key in keys]
+    missing = [key for key, cached in zip(keys, documents) if cached is None]
+    if missing:
+        raise MissingDocumentIndex(missing)
+
+    if len(documents) == 1:
+        return retrieve_relevant_chunks(query, *documents[0], top_k=top_k)
+
+    # 多份文件：合併已快取的 embeddings 建立一個暫時的 index，不需要重新 embedding
+    chunks = [chunk for document in documents for chunk in document[0]]
+    embeddings = np.vstack([document[2] for document in documents])
+    index = faiss.IndexFlatL2(embeddings.shape[1])
+    index.add(embeddings)
+    return retrieve_relevant_chunks(query, chunks, index, embeddings, top_k=top_k)
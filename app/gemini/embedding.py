@@ -0,0 +1,30 @@
+"""
+Shared SentenceTransformer helpers for the draft pipeline and the project vector store.
+"""
+
+from functools import lru_cache
+from typing import List
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+_embedding_model = None
+
+
+def get_embedding_model():
+    # 延遲載入：快取命中時完全不需要載入模型
+    global _embedding_model
+    if _embedding_model is None:
+        _embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+    return _embedding_model
+
+
+def encode_texts(texts: List[str]) -> np.ndarray:
+    return np.asarray(get_embedding_model().encode(texts), dtype=np.float32)
+
+
+@lru_cache(maxsize=128)
+def encode_query(query: str) -> np.ndarray:
+    # 草稿流程使用固定的 query，同一個 process 內只需要 encode 一次
+    return encode_texts([query])
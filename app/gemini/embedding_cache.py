@@ -0,0 +1,157 @@
+"""
+Disk cache for per-document paragraph embeddings and FAISS indexes.
+
+Each entry lives in its own directory under EMBEDDING_CACHE_DIR, keyed by the
+SHA-256 of the uploaded document bytes:
+
+    <key>/paragraphs.json   paragraphs in index order
+    <key>/embeddings.npy    float32 matrix, loaded with mmap
+    <key>/index.faiss       serialized FAISS index, loaded with mmap
+    <key>/meta.json         optional document facts (page count, chunk stats)
+
+Entries are evicted least-recently-used first once the total size on disk
+exceeds EMBEDDING_CACHE_MAX_BYTES.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import uuid
+from typing import List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from app.core.config import EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_MAX_BYTES
+
+PARAGRAPHS_FILE = "paragraphs.json"
+EMBEDDINGS_FILE = "embeddings.npy"
+INDEX_FILE = "index.faiss"
+META_FILE = "meta.json"
+
+
+def content_hash(content: bytes) -> str:
+    """Return the hex SHA-256 of the document bytes."""
+    return hashlib.sha256(content).hexdigest()
+
+
+def file_content_hash(path: str) -> str:
+    """Return the hex SHA-256 of a stored file, hashing it through a read-only memory map."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return hashlib.sha256(b"").hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return hashlib.sha256(mm).hexdigest()
+
+
+def _entry_dir(key: str) -> str:
+    return os.path.join(EMBEDDING_CACHE_DIR, key)
+
+
+def entry_file(key: str, name: str) -> str:
+    return os.path.join(_entry_dir(key), name)
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for name in os.listdir(path):
+        try:
+            total += os.path.getsize(os.path.join(path, name))
+        except OSError:
+            pass
+    return total
+
+
+def has_cached_index(key: str) -> bool:
+    return os.path.exists(os.path.join(_entry_dir(key), INDEX_FILE))
+
+
+def load_cached_index(key: str) -> Optional[Tuple[List[str], faiss.Index, np.ndarray]]:
+    """
+    Load a cached entry.
+
+    Returns:
+        (paragraphs, index, embeddings) or None when the entry is missing or unreadable.
+    """
+    path = _entry_dir(key)
+    try:
+        with open(os.path.join(path, PARAGRAPHS_FILE), "r", encoding="utf-8") as f:
+            paragraphs = json.load(f)
+        embeddings = np.load(os.path.join(path, EMBEDDINGS_FILE), mmap_mode="r")
+        index = faiss.read_index(
+            os.path.join(path, INDEX_FILE),
+            faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY,
+        )
+    except (OSError, ValueError, RuntimeError):
+        return None
+
+    # 更新 mtime 作為 LRU 的最近使用時間
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return paragraphs, index, embeddings
+
+
+def load_meta(key: str) -> Optional[dict]:
+    try:
+        with open(entry_file(key, META_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def store_index(
+    key: str,
+    paragraphs: List[str],
+    index: faiss.Index,
+    embeddings: np.ndarray,
+    meta: Optional[dict] = None,
+) -> None:
+    """Persist an entry atomically, then evict old entries if the cache is over budget."""
+    os.makedirs(EMBEDDING_CACHE_DIR, exist_ok=True)
+    tmp_path = os.path.join(EMBEDDING_CACHE_DIR, f".tmp-{key}-{uuid.uuid4().hex}")
+    os.makedirs(tmp_path)
+    try:
+        with open(os.path.join(tmp_path, PARAGRAPHS_FILE), "w", encoding="utf-8") as f:
+            json.dump(paragraphs, f, ensure_ascii=False)
+        np.save(os.path.join(tmp_path, EMBEDDINGS_FILE), np.ascontiguousarray(embeddings, dtype=np.float32))
+        faiss.write_index(index, os.path.join(tmp_path, INDEX_FILE))
+        if meta is not None:
+            with open(os.path.join(tmp_path, META_FILE), "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False)
+        os.rename(tmp_path, _entry_dir(key))
+    except OSError:
+        # 另一個 request 已經寫入同一份文件，保留既有的 entry
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        if not os.path.isdir(_entry_dir(key)):
+            raise
+
+    evict_cache()
+
+
+def evict_cache(max_bytes: int = EMBEDDING_CACHE_MAX_BYTES) -> None:
+    """Delete least-recently-used entries until the cache fits in max_bytes."""
+    if not os.path.isdir(EMBEDDING_CACHE_DIR):
+        return
+
+    entries = []
+    for name in os.listdir(EMBEDDING_CACHE_DIR):
+        if name.startswith(".tmp-"):
+            continue
+        path = os.path.join(EMBEDDING_CACHE_DIR, name)
+        if not os.path.isdir(path):
+            continue
+        try:
+            entries.append((os.path.getmtime(path), _dir_size(path), path))
+        except OSError:
+            continue
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
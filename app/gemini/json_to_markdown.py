@@ -4,6 +4,7 @@ import os
 from dotenv import load_dotenv
 
 import google.generativeai as genai
+from app.core.metrics import generate_content
 
 # Load environment variables
 load_dotenv()
@@ -46,7 +47,7 @@ def json_to_markdown(json_data: Dict[Any, Any]) -> str:
         """
         
         # Generate response
-        response = model.generate_content(prompt)
+        response = generate_content(model, prompt, "markdown")
         
         # Return the markdown content
         return response.text
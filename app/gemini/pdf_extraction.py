@@ -0,0 +1,169 @@
+"""
+PDF paragraph extraction with an optional process-pool mode for large documents.
+
+Small PDFs are walked page by page in the calling process. Once a document has
+at least PDF_PARALLEL_MIN_PAGES pages, its pages are split into contiguous
+ranges that are extracted in worker processes, and paragraphs are streamed back
+in page order as each range finishes.
+"""
+
+import asyncio
+import math
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Iterator, List, Optional, Union
+
+import fitz
+
+from app.core.config import PDF_EXTRACT_WORKERS, PDF_PARALLEL_MIN_PAGES, PDF_PAGES_PER_TASK
+
+MIN_PARAGRAPH_LENGTH = 30
+
+# 檔案路徑或 PDF 原始 bytes
+PdfSource = Union[str, bytes]
+
+
+def open_pdf(source: PdfSource) -> fitz.Document:
+    if isinstance(source, str):
+        return fitz.open(source, filetype="pdf")
+    return fitz.open(stream=source, filetype="pdf")
+
+
+def split_paragraphs(text: str) -> List[str]:
+    paragraphs = []
+    for para in text.split("\n\n"):
+        clean_para = para.strip()
+        if len(clean_para) > MIN_PARAGRAPH_LENGTH:
+            paragraphs.append(clean_para)
+    return paragraphs
+
+
+def extract_page_range(source: PdfSource, start: int, stop: int) -> List[str]:
+    """Extract paragraphs from pages [start, stop). Runs inside worker processes."""
+    doc = open_pdf(source)
+    try:
+        paragraphs = []
+        for page_number in range(start, min(stop, len(doc))):
+            paragraphs.extend(split_paragraphs(doc[page_number].get_text()))
+        return paragraphs
+    finally:
+        doc.close()
+
+
+def page_count(source: PdfSource) -> int:
+    doc = open_pdf(source)
+    try:
+        return len(doc)
+    finally:
+        doc.close()
+
+
+def page_ranges(total_pages: int, workers: int, pages_per_task: int = PDF_PAGES_PER_TASK) -> List[tuple]:
+    """
+    Split pages into contiguous ranges.
+
+    Uses at least two ranges per worker so a slow range does not leave the other
+    workers idle, but never fewer than pages_per_task pages per range.
+    """
+    if total_pages <= 0:
+        return []
+    size = max(pages_per_task, math.ceil(total_pages / (max(workers, 1) * 2)))
+    return [(start, min(start + size, total_pages)) for start in range(0, total_pages, size)]
+
+
+def iter_paragraphs(
+    source: PdfSource,
+    max_pages: Optional[int] = None,
+    timeout: Optional[float] = None,
+    workers: Optional[int] = None,
+    executor: Optional[Executor] = None,
+    parallel: Optional[bool] = None,
+) -> Iterator[str]:
+    """
+    Yield paragraphs of a PDF in page order.
+
+    Args:
+        source: file path or PDF bytes
+        max_pages: only read the first max_pages pages
+        timeout: overall time limit in seconds; raises TimeoutError when exceeded
+        workers: size of the process pool (defaults to PDF_EXTRACT_WORKERS)
+        executor: reuse an existing executor instead of starting a new pool
+        parallel: force (True) or disable (False) the process-pool mode;
+            by default it is used once the page count reaches PDF_PARALLEL_MIN_PAGES
+    """
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    total_pages = page_count(source)
+    if max_pages is not None:
+        total_pages = min(total_pages, max_pages)
+
+    workers = workers or PDF_EXTRACT_WORKERS
+    if parallel is None:
+        parallel = total_pages >= PDF_PARALLEL_MIN_PAGES and (workers > 1 or executor is not None)
+
+    if not parallel:
+        doc = open_pdf(source)
+        try:
+            for page_number in range(total_pages):
+                if deadline is not None and time.monotonic() > deadline:
+                    raise TimeoutError(f"PDF extraction exceeded {timeout} seconds")
+                yield from split_paragraphs(doc[page_number].get_text())
+        finally:
+            doc.close()
+        return
+
+    own_executor = executor is None
+    if own_executor:
+        # 與共用的 process pool 相同，用 spawn 避免 fork 到其他 thread 持有的鎖
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+    futures = [
+        executor.submit(extract_page_range, source, start, stop)
+        for start, stop in page_ranges(total_pages, workers)
+    ]
+    try:
+        for future in futures:
+            remaining = None
+            if deadline is not None:
+                remaining = max(deadline - time.monotonic(), 0)
+            try:
+                paragraphs = future.result(timeout=remaining)
+            except FutureTimeoutError:
+                raise TimeoutError(f"PDF extraction exceeded {timeout} seconds")
+            yield from paragraphs
+    finally:
+        for future in futures:
+            future.cancel()
+        if own_executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def extract_paragraphs_async(
+    source: PdfSource,
+    executor: Executor,
+    workers: int,
+    max_pages: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> List[str]:
+    """
+    Extract paragraphs on executor without blocking the event loop.
+
+    Large documents are fanned out as page ranges over the executor's workers;
+    small ones are extracted by a single worker.
+    """
+    loop = asyncio.get_running_loop()
+    total_pages = await loop.run_in_executor(executor, page_count, source)
+    if max_pages is not None:
+        total_pages = min(total_pages, max_pages)
+
+    if total_pages >= PDF_PARALLEL_MIN_PAGES and workers > 1:
+        ranges = page_ranges(total_pages, workers)
+    else:
+        ranges = [(0, total_pages)]
+
+    jobs = [loop.run_in_executor(executor, extract_page_range, source, start, stop) for start, stop in ranges]
+    try:
+        results = await asyncio.wait_for(asyncio.gather(*jobs), timeout)
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"PDF extraction exceeded {timeout} seconds")
+    return [para for paragraphs in results for para in paragraphs]
@@ -2,8 +2,9 @@ import google.generativeai as genai
 import json
 from datetime import datetime
 from app.gemini.json_to_markdown import json_to_markdown
+from app.core.metrics import generate_content
 
-def replan_project_with_gemini(original_json: dict, chat_history: list[dict]) -> dict:
+def replan_project_with_gemini(original_json: dict, chat_history: list[dict], reference_context: list[str] | None = None) -> dict:
     cleaned_json = {
         "projects": original_json.get("projects", [])
     }
@@ -12,6 +13,11 @@ def replan_project_with_gemini(original_json: dict, chat_history: list[dict]) ->
         f"{item['sender'].upper()}: {item['message']}" for item in chat_history
     ])
 
+    # 只放與這次回饋相關的文件段落與過去對話，而不是整份文件
+    reference_text = ""
+    if reference_context:
+        reference_text = "\n## 相關文件與歷史對話（僅供參考）：\n" + "\n---\n".join(reference_context) + "\n"
+
     prompt = f"""
 你是一個專案助理，根據下方原始專案規劃 JSON 與使用者的完整回饋紀錄，請重新產出專案規劃。
 
@@ -69,14 +75,14 @@ def replan_project_with_gemini(original_json: dict, chat_history: list[dict]) ->
 
 ## 使用者對話紀錄：
 {chat_text}
-
+{reference_text}
 ## 請直接輸出符合格式的 JSON 結果，不需額外說明或註解。
 """
 
     model = genai.GenerativeModel("gemini-1.5-flash", generation_config=genai.types.GenerationConfig(temperature=0.2,top_p=0.9))
     
     try:
-        response = model.generate_content(prompt)
+        response = generate_content(model, prompt, "replan")
         if not response.text or not response.text.strip():
             print("⚠️ Gemini 回傳空內容")
             print("🧪 Prompt Preview:\n", prompt[:1000])
@@ -4,11 +4,13 @@ It takes the current project state and a new task, then generates an updated pro
 """
 
 import json
+import uuid
 from typing import Dict, Any
 import google.generativeai as genai
 from dotenv import load_dotenv
 import os
 from app.core.db import get_db
+from app.core.metrics import generate_content
 from app.models import Milestone as MilestoneModel, Task as TaskModel
 from contextlib import contextmanager
 from app.schemas.project import ProjectSchema, TaskSchema
@@ -39,6 +41,8 @@ text_model = genai.GenerativeModel(
 def default_serializer(obj):
     if hasattr(obj, 'isoformat'):
         return obj.isoformat()
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
     raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
 # def separate_completed_tasks(project_data: Dict[str, Any]) -> tuple[Dict[str, Any], Dict[str, Any]]:
 #     """
@@ -163,13 +167,13 @@ def reschedule_project(project: Dict[str, Any], new_task: Dict[str, Any], new_ta
 Return only the updated JSON without any additional text or explanation.
 """.format(
       project=json.dumps(project, indent=2, ensure_ascii=False, default=default_serializer),
-      new_task=json.dumps(new_task.dict(), indent=2, ensure_ascii=False, default=default_serializer),
+      new_task=json.dumps(new_task.dict(exclude={"expected_version", "reschedule_token"}), indent=2, ensure_ascii=False, default=default_serializer),
       new_task_id=new_task_id
   )
     
     try:
         # Get response from Gemini
-        response = text_model.generate_content(prompt)
+        response = generate_content(text_model, prompt, "reschedule")
         
         # Extract JSON from response
         response_text = response.text.strip()
@@ -277,7 +281,7 @@ Return only the updated JSON without any additional text or explanation.
     
     try:
         # Get response from Gemini
-        response = text_model.generate_content(prompt)
+        response = generate_content(text_model, prompt, "reschedule")
         
         # Extract JSON from response
         response_text = response.text.strip()
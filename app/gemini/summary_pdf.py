@@ -1,50 +1,41 @@
+import asyncio
 from datetime import datetime
-import string
-import fitz
-import faiss
-import numpy as np
-from sentence_transformers import SentenceTransformer
 import google.generativeai as genai
 import os
 import json
-import io
 from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
+from app.gemini.pdf_extraction import extract_paragraphs_async
+from app.core.executor import get_process_pool, run_in_process
+from app.core.config import PROCESS_POOL_SIZE
+from app.core.metrics import generate_content
+from app.gemini.embedding_cache import has_cached_index
+from app.gemini.document_index import (
+    build_document_index,
+    document_cache_key,
+    MissingDocumentIndex,
+    retrieve_from_documents,
+)
+from app.services import extraction
+from app.services.file_storage import StoredBlob
 
 # === 初始化 ===
 load_dotenv()
 GEMINI_KEY = os.getenv("GEMINI_KEY")
 genai.configure(api_key=GEMINI_KEY)
 
-embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
 text_model = genai.GenerativeModel(
     model_name="gemini-1.5-flash",
     generation_config=genai.types.GenerationConfig(temperature=0)
 )
 
+DRAFT_QUERY = "請整理專案概述、里程碑與任務資訊"
+DRAFT_TOP_K = 15
+# 檢索時 entry 已被清出快取的話，重新準備文件後再試的次數上限
+RETRIEVE_ATTEMPTS = 3
+
 # === 工具函式 ===
-def extract_paragraphs_from_pdf_bytes(file_content: bytes):
-    doc = fitz.open(stream=io.BytesIO(file_content), filetype="pdf")
-    paragraphs = []
-    for page in doc:
-        text = page.get_text()
-        for para in text.split("\n\n"):
-            clean_para = para.strip()
-            if len(clean_para) > 30:
-                paragraphs.append(clean_para)
-    return paragraphs
-
-def create_faiss_index(paragraphs):
-    embeddings = embedding_model.encode(paragraphs)
-    index = faiss.IndexFlatL2(embeddings.shape[1])
-    index.add(np.array(embeddings))
-    return index, embeddings
-
-def retrieve_relevant_chunks(query, paragraphs, index, embeddings, top_k):
-    query_vec = embedding_model.encode([query])
-    D, I = index.search(np.array(query_vec), top_k)
-    return [paragraphs[i] for i in I[0]]
-
-def refine_chunks_with_gemini(chunks, target="請整理專案概述、里程碑與任務資訊"):
+def refine_chunks_with_gemini(chunks, target=DRAFT_QUERY):
     context = "\n\n".join(chunks)
     prompt = f"""
 你是一位專業的文件理解助手。
@@ -59,7 +50,7 @@ def refine_chunks_with_gemini(chunks, target="請整理專案概述、里程碑
 以下為原始內容：
 {context}
 """
-    response = text_model.generate_content(prompt)
+    response = generate_content(text_model, prompt, "refine")
     return response.text.strip()
 
 def generate_structured_json(context, title, deadline):
@@ -124,15 +115,47 @@ def generate_structured_json(context, title, deadline):
 以下為內容：
 {context}
 """
-    response = text_model.generate_content(prompt)
+    response = generate_content(text_model, prompt, "draft")
     clean_text = response.text.replace("```json", "").replace("```", "")
     return json.loads(clean_text)
 
 # === 主 API 函式 ===
-def get_gemini_project_draft(file_content: bytes, title: string, deadline: datetime):
-    paragraphs = extract_paragraphs_from_pdf_bytes(file_content)
-    index, embeddings = create_faiss_index(paragraphs)
-    top_chunks = retrieve_relevant_chunks("請整理專案概述、里程碑與任務資訊", paragraphs, index, embeddings, top_k=15)
-    refined_context = refine_chunks_with_gemini(top_chunks)
-    structured_json = generate_structured_json(refined_context, title, deadline)
-    return structured_json
+async def prepare_document(source) -> str:
+    """Make sure a document (PDF bytes, file path or StoredBlob) is in the embedding cache and return its key."""
+    if isinstance(source, StoredBlob):
+        # 上傳時已在背景解析；還在進行中就等同一個工作完成，不重複解析
+        return await asyncio.wrap_future(extraction.submit(source.sha256))
+
+    key = await run_in_threadpool(document_cache_key, source)
+    if not await run_in_threadpool(has_cached_index, key):
+        paragraphs = await extract_paragraphs_async(source, get_process_pool(), PROCESS_POOL_SIZE)
+        await run_in_process(build_document_index, key, paragraphs)
+    return key
+
+async def retrieve_from_documents_async(sources, query: str = DRAFT_QUERY, top_k: int = DRAFT_TOP_K):
+    keys = await asyncio.gather(*[prepare_document(source) for source in sources])
+    for attempt in range(RETRIEVE_ATTEMPTS):
+        try:
+            return await run_in_process(retrieve_from_documents, list(keys), query, top_k)
+        except MissingDocumentIndex as e:
+            if attempt == RETRIEVE_ATTEMPTS - 1:
+                raise
+            # 準備完到檢索之間 entry 被 evict_cache 刪掉：從 storage 還原或重建後再檢索
+            missing = set(e.keys)
+            await asyncio.gather(*[
+                prepare_document(source) for source, key in zip(sources, keys) if key in missing
+            ])
+
+async def get_gemini_project_draft_async(sources, title: str, deadline: datetime):
+    """
+    Draft a project from one or more documents without blocking the event loop.
+
+    sources is a list of PDF bytes, file paths and/or StoredBlob; their cached
+    indexes are merged into one retrieval index, the chunks closest to
+    DRAFT_QUERY are refined by Gemini and turned into the project JSON. PDF
+    parsing, chunking, embedding and FAISS search run in the shared process
+    pool; the two Gemini calls are network-bound and run in the thread pool.
+    """
+    top_chunks = await retrieve_from_documents_async(sources)
+    refined_context = await run_in_threadpool(refine_chunks_with_gemini, top_chunks)
+    return await run_in_threadpool(generate_structured_json, refined_context, title, deadline)
@@ -1,10 +1,39 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.openapi.utils import get_openapi
 from app.models import Base
 from app.core.db import engine
 from app.api.main import router as api_router 
+from app.core.executor import shutdown_process_pool
+from app.core.middleware import CompressionMiddleware, MetricsMiddleware, RequestSizeLimitMiddleware
+from app.core.config import (
+    COMPRESSION_BROTLI_QUALITY,
+    COMPRESSION_GZIP_LEVEL,
+    COMPRESSION_MEDIA_TYPES,
+    COMPRESSION_MIN_BYTES,
+    MAX_UPLOAD_REQUEST_BYTES,
+    QUERY_DEBUG,
+    QUERY_REPEAT_THRESHOLD,
+)
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    shutdown_process_pool()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(RequestSizeLimitMiddleware, max_bytes=MAX_UPLOAD_REQUEST_BYTES, path_prefixes=("/upload",))
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=COMPRESSION_MIN_BYTES,
+    media_types=COMPRESSION_MEDIA_TYPES,
+    gzip_level=COMPRESSION_GZIP_LEVEL,
+    brotli_quality=COMPRESSION_BROTLI_QUALITY,
+)
+# 最後加入的在最外層，延遲包含壓縮與整個 response body
+app.add_middleware(MetricsMiddleware, debug_queries=QUERY_DEBUG, repeat_threshold=QUERY_REPEAT_THRESHOLD)
 
 app.include_router(api_router)
 
@@ -1,5 +1,5 @@
 import uuid
-from sqlalchemy import Column, String, Text, Date, Boolean, ForeignKey, TIMESTAMP, Numeric
+from sqlalchemy import Column, String, Text, Date, Boolean, ForeignKey, TIMESTAMP, Numeric, BigInteger, Integer
 from sqlalchemy.dialects.postgresql import UUID  # 若你用的是 PostgreSQL
 from sqlalchemy.orm import relationship, declarative_base
 from datetime import datetime
@@ -30,6 +30,8 @@ class Project(Base):
     due_date = Column(Date)
     current_milestone = Column(String(255))
     user_id = Column(UUID(as_uuid=True), ForeignKey('users.id', ondelete='CASCADE'))
+    # 專案、里程碑或任務有任何寫入時加一，作為 ETag 的依據
+    version = Column(Integer, nullable=False, default=1, server_default='1')
 
     user = relationship('User', back_populates='projects')
     milestones = relationship('Milestone', back_populates='project', cascade='all, delete-orphan')
@@ -73,10 +75,21 @@ class Files(Base):
     name = Column(String(255), nullable=False)
     url = Column(Text, nullable=False)
     project_id = Column(UUID(as_uuid=True), ForeignKey('projects.id', ondelete='CASCADE'))
+    user_id = Column(UUID(as_uuid=True), ForeignKey('users.id', ondelete='CASCADE'))  # 上傳者，檔案尚未關聯專案時用來判斷權限
+    sha256 = Column(String(64), index=True)  # 內容 hash，對應 uploads/<前兩碼>/<hash> 的 blob
+    size = Column(BigInteger)
 
     project = relationship('Project', back_populates='files')
 
 
+class BlobReservation(Base):
+    # 已存進儲存後端、但 Files 紀錄還沒寫入的上傳數；多個 instance 透過這一列的 row lock 協調 blob 的保留與刪除
+    __tablename__ = 'blob_reservations'
+
+    sha256 = Column(String(64), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+
 class ChatHistory(Base):
     __tablename__ = 'chat_histories'
 
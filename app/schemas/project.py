@@ -1,7 +1,8 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field
 from datetime import datetime, date
 from typing import List
 from typing import Dict
+import uuid
 
 
 class ProjectSchema(BaseModel):
@@ -11,9 +12,7 @@ class ProjectSchema(BaseModel):
     progress: float
     current_milestone: str
 
-    class Config:
-        from_attributes = True
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class MilestoneSummarySchema(BaseModel):
@@ -23,8 +22,7 @@ class MilestoneSummarySchema(BaseModel):
     estimated_loading: float
     progress: float
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class ProjectDetailSchema(BaseModel):
@@ -34,9 +32,9 @@ class ProjectDetailSchema(BaseModel):
     project_end_time: datetime
     estimated_loading: float
     milestones: List[MilestoneSummarySchema]
+    version: int
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class TaskSchema(BaseModel):
     task_name: str
@@ -46,9 +44,7 @@ class TaskSchema(BaseModel):
     estimated_loading: float | None = None
     isCompleted: bool
 
-    class Config:
-        from_attributes = True
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class MilestoneDetailSchema(BaseModel):
@@ -59,56 +55,112 @@ class MilestoneDetailSchema(BaseModel):
     milestone_end_time: datetime
     milestone_estimated_loading: float
     tasks: List[TaskSchema]
+    version: int
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
-class UpdateProjectRequest(BaseModel):
+class MilestoneTreeSchema(BaseModel):
+    milestone_id: str
+    milestone_name: str
+    milestone_summary: str | None = None
+    milestone_start_time: datetime
+    milestone_end_time: datetime | None = None
+    milestone_estimated_loading: float
+    progress: float
+    tasks: List[TaskSchema]
+
+
+class ProjectTreeSchema(BaseModel):
     project_id: str
+    project_name: str
+    project_summary: str | None = None
+    project_start_time: datetime
+    project_end_time: datetime | None = None
+    estimated_loading: float
+    progress: float
+    milestones: List[MilestoneTreeSchema]
+    version: int
+
+class UpdateProjectRequest(BaseModel):
+    project_id: uuid.UUID
     changed_project_summary: str
     changed_name: str
     changed_project_start_time: datetime
     changed_project_end_time: datetime
+    expected_version: int | None = None
 
 class UpdateProjectResponse(BaseModel):
     status: str
     updated_fields: Dict[str, datetime | str]
+    version: int | None = None
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class UpdateMilestoneRequest(BaseModel):
-    project_id: str
-    milestone_id: str
+    project_id: uuid.UUID
+    milestone_id: uuid.UUID
     changed_milestone_summary: str
     changed_milestone_start_time: datetime
     changed_milestone_end_time: datetime
+    expected_version: int | None = None
 
 class UpdateMilestoneResponse(BaseModel):
     status: str
     updated_fields: Dict[str, datetime | str]
+    version: int | None = None
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class CreateTaskRequest(BaseModel):
-    milestone_id: str
+    milestone_id: uuid.UUID
     ddl: date
     name: str
     estimated_loading: float | None = None
     description: str | None = None
+    expected_version: int | None = None
+    # 上次回傳 409 時附的 token，帶上時直接重新套用當時的排程結果
+    reschedule_token: str | None = None
 
 class CreateTaskResponse(BaseModel):
     status: str
     task: Dict[str, str | float | bool | date]
+    version: int | None = None
+    conflicts: List[str] = []
 
 class UpdateTaskRequest(BaseModel):
-    task_id: str
+    task_id: uuid.UUID
     changed_name: str
     changed_ddl: date
     changed_estimated_loading: float | None = None
     changed_description: str | None = None
+    expected_version: int | None = None
+    reschedule_token: str | None = None
 
 class UpdateTaskResponse(BaseModel):
     status: str
-    updated_fields: Dict[str, str | float | bool | date]
\ No newline at end of file
+    updated_fields: Dict[str, str | float | bool | date | None]
+    version: int | None = None
+    conflicts: List[str] = []
+
+class BatchTaskChange(BaseModel):
+    task_id: uuid.UUID
+    isCompleted: bool | None = None
+    title: str | None = Field(None, min_length=1, max_length=255)
+    due_date: date | None = None
+    estimated_loading: float | None = Field(None, ge=0, lt=100)
+
+class BatchTaskUpdateRequest(BaseModel):
+    tasks: List[BatchTaskChange] = Field(..., min_length=1, max_length=500)
+
+class BatchTaskResult(BaseModel):
+    task_id: str
+    status: str
+    updated_fields: List[str]
+
+class ProjectProgressSchema(BaseModel):
+    project_id: str
+    progress: float
+
+class BatchTaskUpdateResponse(BaseModel):
+    results: List[BatchTaskResult]
+    projects: List[ProjectProgressSchema]
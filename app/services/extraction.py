@@ -0,0 +1,147 @@
+"""
+Upload-time extraction of stored PDFs.
+
+As soon as a PDF is stored, a background job extracts its paragraphs and page
+count, chunks and embeds them, and writes the result to the embedding cache
+under the document's content hash. When the draft request arrives only
+retrieval and the Gemini calls are left on the critical path.
+
+The cache entry is also copied next to the blob in storage:
+
+    <sha[:2]>/<cache key>.extract/paragraphs.json
+    <sha[:2]>/<cache key>.extract/embeddings.npy
+    <sha[:2]>/<cache key>.extract/meta.json
+
+so another instance (or this one after cache eviction) restores the index from
+storage instead of parsing and embedding the PDF again.
+
+Jobs are deduplicated by hash: submitting a document that is already being
+extracted returns the running job's future.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict
+
+import faiss
+import numpy as np
+
+from app.core.config import PROCESS_POOL_SIZE
+from app.core.executor import get_process_pool
+from app.gemini.document_index import build_document_index, cache_key_from_hash
+from app.gemini.embedding_cache import (
+    EMBEDDINGS_FILE,
+    META_FILE,
+    PARAGRAPHS_FILE,
+    entry_file,
+    has_cached_index,
+    store_index,
+)
+from app.gemini.pdf_extraction import iter_paragraphs, page_count
+from app.services.file_storage import local_blob
+from app.services.storage import get_storage
+
+SIDECAR_FILES = (PARAGRAPHS_FILE, EMBEDDINGS_FILE, META_FILE)
+
+# 實際的 CPU 工作在共用的 process pool，這裡的 thread 只負責協調與等待
+_executor = ThreadPoolExecutor(max_workers=PROCESS_POOL_SIZE, thread_name_prefix="extraction")
+_jobs: Dict[str, Future] = {}
+_jobs_lock = threading.Lock()
+
+
+def sidecar_key(sha256: str, name: str) -> str:
+    return f"{sha256[:2]}/{cache_key_from_hash(sha256)}.extract/{name}"
+
+
+def submit(sha256: str) -> Future:
+    """Start extracting a stored PDF in the background. The future resolves to its cache key."""
+    with _jobs_lock:
+        job = _jobs.get(sha256)
+        if job is not None:
+            return job
+        job = _executor.submit(extract_blob, sha256)
+        _jobs[sha256] = job
+    # 在鎖外註冊：工作已經結束時 callback 會立刻在這個 thread 執行
+    job.add_done_callback(lambda _: _finish(sha256))
+    return job
+
+
+def _finish(sha256: str) -> None:
+    with _jobs_lock:
+        job = _jobs.pop(sha256, None)
+    # 失敗的工作從清單移除，下次 submit 會重試
+    if job is not None and job.exception() is not None:
+        print(f"⚠️ Extraction of {sha256} failed: {job.exception()}")
+
+
+def ensure_extracted(sha256: str) -> str:
+    """Block until the document is in the embedding cache and return its cache key."""
+    return submit(sha256).result()
+
+
+def extract_blob(sha256: str) -> str:
+    key = cache_key_from_hash(sha256)
+    if has_cached_index(key) or restore_from_storage(sha256, key):
+        return key
+
+    with local_blob(sha256) as path:
+        pages = page_count(path)
+        # 大型 PDF 會依頁數分段交給 process pool 平行解析
+        paragraphs = list(iter_paragraphs(path, workers=PROCESS_POOL_SIZE, executor=get_process_pool()))
+    meta = {"sha256": sha256, "page_count": pages, "paragraphs": len(paragraphs)}
+    get_process_pool().submit(build_document_index, key, paragraphs, meta).result()
+
+    publish_to_storage(sha256, key)
+    return key
+
+
+def publish_to_storage(sha256: str, key: str) -> None:
+    storage = get_storage()
+    os.makedirs(storage.staging_dir, exist_ok=True)
+    for name in SIDECAR_FILES:
+        # put_file 會移走來源檔，所以先複製一份到暫存區
+        fd, tmp_path = tempfile.mkstemp(prefix=".extract-", dir=storage.staging_dir)
+        os.close(fd)
+        shutil.copyfile(entry_file(key, name), tmp_path)
+        storage.put_file(sidecar_key(sha256, name), tmp_path)
+
+
+def restore_from_storage(sha256: str, key: str) -> bool:
+    """Rebuild the cache entry from the copy stored next to the blob. Returns False when there is none."""
+    storage = get_storage()
+    if not storage.exists(sidecar_key(sha256, META_FILE)):
+        return False
+
+    os.makedirs(storage.staging_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=".restore-", dir=storage.staging_dir)
+    try:
+        for name in SIDECAR_FILES:
+            with open(os.path.join(tmp_dir, name), "wb") as out:
+                for data in storage.open(sidecar_key(sha256, name)):
+                    out.write(data)
+        with open(os.path.join(tmp_dir, PARAGRAPHS_FILE), "r", encoding="utf-8") as f:
+            chunks = json.load(f)
+        with open(os.path.join(tmp_dir, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        embeddings = np.load(os.path.join(tmp_dir, EMBEDDINGS_FILE))
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Restoring extraction of {sha256} from storage failed: {e}")
+        return False
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    # FAISS index 只是 embeddings 的 IndexFlatL2，直接重建比另外存一份便宜
+    index = faiss.IndexFlatL2(embeddings.shape[1])
+    index.add(embeddings)
+    store_index(key, chunks, index, embeddings, meta)
+    return True
+
+
+def delete_from_storage(sha256: str) -> None:
+    storage = get_storage()
+    for name in SIDECAR_FILES:
+        storage.delete(sidecar_key(sha256, name))
@@ -0,0 +1,159 @@
+# 上傳檔案的儲存：以固定大小的區塊串流寫入磁碟，邊寫邊計算 SHA-256
+#
+# 檔案以內容定址存放：儲存後端裡的 <sha256 前兩碼>/<sha256>。
+# 內容相同的檔案只存一份，Files 資料表的多筆紀錄可以指向同一個 blob。
+import hashlib
+import os
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Iterator, NamedTuple, Tuple
+from urllib.parse import quote
+
+import anyio
+from fastapi import HTTPException, UploadFile
+
+from app.core.config import UPLOAD_CHUNK_SIZE
+from app.services.storage import get_storage
+
+INCOMING_PREFIX = ".incoming-"
+CHECKOUT_PREFIX = ".checkout-"
+
+
+async def stream_to_file(upload: UploadFile, dest_path: str, max_bytes: int) -> Tuple[int, str]:
+    """
+    Stream an upload to dest_path in UPLOAD_CHUNK_SIZE chunks.
+
+    Disk writes run in worker threads, so the event loop never blocks on I/O,
+    and only one chunk is held in memory at a time. The file is written to a
+    temporary name and renamed into place once complete.
+
+    Returns:
+        (size in bytes, hex SHA-256 of the contents)
+
+    Raises:
+        HTTPException(413) as soon as more than max_bytes have been read.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    tmp_path = f"{dest_path}.part-{uuid.uuid4().hex}"
+    try:
+        async with await anyio.open_file(tmp_path, "wb") as out:
+            while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"File '{upload.filename}' exceeds the {max_bytes} byte limit",
+                    )
+                digest.update(chunk)
+                await out.write(chunk)
+        await anyio.to_thread.run_sync(os.replace, tmp_path, dest_path)
+    except BaseException:
+        # 請求被取消時也要清掉寫到一半的暫存檔
+        remove_quietly(tmp_path)
+        raise
+    return size, digest.hexdigest()
+
+
+class StoredBlob(NamedTuple):
+    """Reference to a stored file, used as a document source in place of a path or bytes."""
+    sha256: str
+
+
+def blob_key(sha256: str) -> str:
+    return f"{sha256[:2]}/{sha256}"
+
+
+def blob_url(sha256: str, filename: str) -> str:
+    # URL 帶著內容 hash，內容不變網址就不變，可以放心快取
+    return f"/uploads/{sha256}/{quote(filename)}"
+
+
+async def save_blob(upload: UploadFile, max_bytes: int, reserve: Callable[[str], None]) -> Tuple[int, str]:
+    """
+    Stream an upload into content-addressed storage.
+
+    The upload is written to the backend's local staging directory while it is
+    hashed, then handed to the backend under its blob key; when a blob with the
+    same contents already exists the new copy is discarded. reserve(sha256)
+    runs in a worker thread before that, so the blob cannot be deleted by
+    another request until the caller releases it (see crud_file.reserve_blob).
+
+    Returns:
+        (size in bytes, hex SHA-256 of the contents)
+    """
+    staging_dir = get_storage().staging_dir
+    os.makedirs(staging_dir, exist_ok=True)
+    incoming = os.path.join(staging_dir, f"{INCOMING_PREFIX}{uuid.uuid4().hex}")
+    size, sha256 = await stream_to_file(upload, incoming, max_bytes)
+    try:
+        await anyio.to_thread.run_sync(reserve, sha256)
+        await anyio.to_thread.run_sync(commit_blob, incoming, sha256)
+    except BaseException:
+        remove_quietly(incoming)
+        raise
+    return size, sha256
+
+
+def commit_blob(incoming: str, sha256: str) -> None:
+    """
+    Store a fully written local file as a blob, or drop it if the blob already exists.
+
+    Reserve the blob first when it may be deleted concurrently: an existing
+    blob is kept only because of that reservation until a Files row points to it.
+    """
+    storage = get_storage()
+    if storage.exists(blob_key(sha256)):
+        remove_quietly(incoming)
+    else:
+        storage.put_file(blob_key(sha256), incoming)
+
+
+def remove_blob(sha256: str) -> None:
+    get_storage().delete(blob_key(sha256))
+
+
+def checkout_blob(sha256: str) -> str:
+    """
+    Return a local path to a blob's contents.
+
+    Local storage (and a remote backend's read-through cache) hands back the
+    stored file itself; otherwise the blob is downloaded to a temporary file,
+    which release_blob deletes.
+    """
+    storage = get_storage()
+    path = storage.local_path(blob_key(sha256))
+    if path is not None:
+        return path
+
+    os.makedirs(storage.staging_dir, exist_ok=True)
+    tmp_path = os.path.join(storage.staging_dir, f"{CHECKOUT_PREFIX}{uuid.uuid4().hex}")
+    try:
+        with open(tmp_path, "wb") as out:
+            for data in storage.open(blob_key(sha256)):
+                out.write(data)
+    except BaseException:
+        remove_quietly(tmp_path)
+        raise
+    return tmp_path
+
+
+def release_blob(path: str) -> None:
+    if os.path.basename(path).startswith(CHECKOUT_PREFIX):
+        remove_quietly(path)
+
+
+@contextmanager
+def local_blob(sha256: str) -> Iterator[str]:
+    path = checkout_blob(sha256)
+    try:
+        yield path
+    finally:
+        release_blob(path)
+
+
+def remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
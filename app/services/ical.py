@@ -0,0 +1,90 @@
+"""
+Minimal iCalendar (RFC 5545) writer for the task and milestone feed.
+
+Events are all-day VEVENTs on the task due date or milestone end date. Lines
+are CRLF-terminated, text values are escaped, and lines longer than 75 octets
+are folded without splitting UTF-8 characters.
+"""
+
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterable, Iterator, List, Optional
+
+PRODID = "-//beLiver//Task Feed//EN"
+UID_DOMAIN = "beliver"
+MAX_LINE_OCTETS = 75
+
+
+def escape_text(value: str) -> str:
+    return (
+        value.replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\r\n", "\\n")
+        .replace("\n", "\\n")
+    )
+
+
+def fold_line(line: str) -> str:
+    """Fold a content line into 75-octet pieces joined by CRLF + space."""
+    pieces = []
+    current, size = [], 0
+    for char in line:
+        octets = len(char.encode("utf-8"))
+        # 續行開頭的空白也算一個 octet
+        limit = MAX_LINE_OCTETS if not pieces else MAX_LINE_OCTETS - 1
+        if size + octets > limit:
+            pieces.append("".join(current))
+            current, size = [], 0
+        current.append(char)
+        size += octets
+    pieces.append("".join(current))
+    return "\r\n ".join(pieces) + "\r\n"
+
+
+def format_date(value: date) -> str:
+    return value.strftime("%Y%m%d")
+
+
+def event_lines(
+    uid: str,
+    day: date,
+    summary: str,
+    stamp: str,
+    description: Optional[str] = None,
+    categories: Optional[str] = None,
+    completed: bool = False,
+) -> List[str]:
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:{uid}@{UID_DOMAIN}",
+        f"DTSTAMP:{stamp}",
+        f"DTSTART;VALUE=DATE:{format_date(day)}",
+        f"DTEND;VALUE=DATE:{format_date(day + timedelta(days=1))}",
+        f"SUMMARY:{escape_text(('✓ ' if completed else '') + summary)}",
+        "TRANSP:TRANSPARENT",
+    ]
+    if description:
+        lines.append(f"DESCRIPTION:{escape_text(description)}")
+    if categories:
+        lines.append(f"CATEGORIES:{escape_text(categories)}")
+    lines.append("END:VEVENT")
+    return lines
+
+
+def iter_calendar(events: Iterable[List[str]], name: str = "beLiver") -> Iterator[str]:
+    """Yield the calendar as text chunks, one VEVENT per chunk."""
+    yield "".join(fold_line(line) for line in (
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:{PRODID}",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        f"X-WR-CALNAME:{escape_text(name)}",
+    ))
+    for lines in events:
+        yield "".join(fold_line(line) for line in lines)
+    yield fold_line("END:VCALENDAR")
+
+
+def utc_stamp(moment: Optional[datetime] = None) -> str:
+    return (moment or datetime.now(timezone.utc)).strftime("%Y%m%dT%H%M%SZ")
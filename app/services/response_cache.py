@@ -0,0 +1,218 @@
+"""
+Per-user cache of serialized project read responses.
+
+Entries are JSON bodies stored under (user_id, key). The key is the response
+ETag, which contains the project version, so an entry can never be served
+after a write; invalidate(user_id) drops the user's entries right after a
+commit to free the space. Backends, selected with RESPONSE_CACHE_BACKEND:
+
+    memory  an LRU bounded by RESPONSE_CACHE_MAX_BYTES in this process
+    redis   one hash per user in a shared Redis (several instances); requires redis
+    off     every read goes to the database
+
+ResponseCache wraps a backend with hit / miss counters per route, exported
+on /metrics. A failing network backend is counted as an error and treated as
+a miss.
+"""
+
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from app.core.config import (
+    REDIS_URL,
+    RESPONSE_CACHE_BACKEND,
+    RESPONSE_CACHE_MAX_BYTES,
+    RESPONSE_CACHE_TTL_SECONDS,
+)
+from app.core.metrics import RESPONSE_CACHE_ERRORS, RESPONSE_CACHE_INVALIDATIONS, RESPONSE_CACHE_LOOKUPS
+
+
+class CacheBackend(ABC):
+    name: str
+
+    @abstractmethod
+    def get(self, user_id, key: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    def set(self, user_id, key: str, value: bytes) -> None:
+        ...
+
+    @abstractmethod
+    def invalidate(self, user_id) -> None:
+        """Drop every entry of the user."""
+
+
+class NullCache(CacheBackend):
+    name = "off"
+
+    def get(self, user_id, key: str) -> Optional[bytes]:
+        return None
+
+    def set(self, user_id, key: str, value: bytes) -> None:
+        pass
+
+    def invalidate(self, user_id) -> None:
+        pass
+
+
+class LRUCache(CacheBackend):
+    """In-process LRU bounded by the total size of the cached bodies."""
+
+    name = "memory"
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: "OrderedDict[tuple, bytes]" = OrderedDict()
+        # 每個使用者有哪些 key，失效時不必掃過整個快取
+        self._user_keys: Dict[object, set] = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id, key: str) -> Optional[bytes]:
+        with self._lock:
+            value = self._entries.get((user_id, key))
+            if value is not None:
+                self._entries.move_to_end((user_id, key))
+            return value
+
+    def set(self, user_id, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            self._remove((user_id, key))
+            self._entries[(user_id, key)] = value
+            self._user_keys.setdefault(user_id, set()).add(key)
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, user_id) -> None:
+        with self._lock:
+            for key in list(self._user_keys.get(user_id, ())):
+                self._remove((user_id, key))
+
+    def _remove(self, entry: tuple) -> None:
+        value = self._entries.pop(entry, None)
+        if value is None:
+            return
+        self.size -= len(value)
+        user_id, key = entry
+        keys = self._user_keys.get(user_id)
+        keys.discard(key)
+        if not keys:
+            del self._user_keys[user_id]
+
+
+class RedisCache(CacheBackend):
+    """Shared cache in Redis. Pass client to use a preconfigured (or stand-in) redis client."""
+
+    name = "redis"
+
+    def __init__(self, url: Optional[str] = None, ttl: int = 3600, prefix: str = "beliver:read-cache:", client=None):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError("RESPONSE_CACHE_BACKEND=redis requires redis (pip install redis)")
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _key(self, user_id) -> str:
+        # 每個使用者一個 hash，失效時整個刪掉
+        return f"{self.prefix}{user_id}"
+
+    def get(self, user_id, key: str) -> Optional[bytes]:
+        return self.client.hget(self._key(user_id), key)
+
+    def set(self, user_id, key: str, value: bytes) -> None:
+        self.client.hset(self._key(user_id), key, value)
+        self.client.expire(self._key(user_id), self.ttl)
+
+    def invalidate(self, user_id) -> None:
+        self.client.delete(self._key(user_id))
+
+
+class ResponseCache:
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self.invalidations = 0
+        self.errors = 0
+
+    def _count(self, route: str, counter: str) -> None:
+        RESPONSE_CACHE_LOOKUPS.labels(route, "hit" if counter == "hits" else "miss").inc()
+        with self._lock:
+            counters = self._counters.setdefault(route, {"hits": 0, "misses": 0})
+            counters[counter] += 1
+
+    def get(self, route: str, user_id, key: str) -> Optional[bytes]:
+        try:
+            value = self.backend.get(user_id, key)
+        except Exception:
+            self._error()
+            value = None
+        self._count(route, "hits" if value is not None else "misses")
+        return value
+
+    def set(self, user_id, key: str, value: bytes) -> None:
+        try:
+            self.backend.set(user_id, key, value)
+        except Exception:
+            self._error()
+
+    def invalidate(self, user_id) -> None:
+        self.invalidations += 1
+        RESPONSE_CACHE_INVALIDATIONS.inc()
+        try:
+            self.backend.invalidate(user_id)
+        except Exception:
+            self._error()
+
+    def _error(self) -> None:
+        self.errors += 1
+        RESPONSE_CACHE_ERRORS.inc()
+
+    def stats(self) -> dict:
+        """In-process counters of this cache; the same numbers are exported on /metrics."""
+        with self._lock:
+            routes = {route: dict(counters) for route, counters in self._counters.items()}
+        for counters in routes.values():
+            total = counters["hits"] + counters["misses"]
+            counters["hit_rate"] = counters["hits"] / total if total else 0.0
+        hits = sum(counters["hits"] for counters in routes.values())
+        misses = sum(counters["misses"] for counters in routes.values())
+        return {
+            "backend": self.backend.name,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "invalidations": self.invalidations,
+            "errors": self.errors,
+            "routes": routes,
+        }
+
+
+def create_response_cache() -> ResponseCache:
+    if RESPONSE_CACHE_BACKEND == "memory":
+        return ResponseCache(LRUCache(RESPONSE_CACHE_MAX_BYTES))
+    if RESPONSE_CACHE_BACKEND == "redis":
+        return ResponseCache(RedisCache(REDIS_URL, ttl=RESPONSE_CACHE_TTL_SECONDS))
+    if RESPONSE_CACHE_BACKEND == "off":
+        return ResponseCache(NullCache())
+    raise RuntimeError(f"Unknown RESPONSE_CACHE_BACKEND: {RESPONSE_CACHE_BACKEND}")
+
+
+_response_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = create_response_cache()
+    return _response_cache
@@ -0,0 +1,292 @@
+"""
+Storage backends for uploaded files.
+
+Objects are addressed by a key such as "ab/ab12...". Two backends are
+available, selected with STORAGE_BACKEND:
+
+    local   files under UPLOAD_DIR (single instance, or a shared volume)
+    s3      an S3-compatible bucket (AWS S3, MinIO, ...); requires boto3
+
+Remote backends are wrapped in a ReadThroughCache when STORAGE_CACHE_MAX_BYTES
+is positive, so the draft pipeline and downloads read a local copy after the
+first access instead of going back to the bucket.
+
+Reads and writes are streamed: put_file moves or uploads a file that was
+already written to local scratch space, and open yields the object in chunks.
+"""
+
+import os
+import shutil
+import uuid
+from abc import ABC, abstractmethod
+from typing import Iterator, Optional
+
+from app.core.config import (
+    S3_BUCKET,
+    S3_ENDPOINT_URL,
+    S3_PREFIX,
+    S3_REGION,
+    STORAGE_BACKEND,
+    STORAGE_CACHE_DIR,
+    STORAGE_CACHE_MAX_BYTES,
+    UPLOAD_CHUNK_SIZE,
+    UPLOAD_DIR,
+)
+
+
+class StorageBackend(ABC):
+    # 上傳中的檔案先寫到這個本機目錄，完成後再交給 put_file
+    staging_dir: str
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    def size(self, key: str) -> int:
+        ...
+
+    @abstractmethod
+    def put_file(self, key: str, path: str) -> None:
+        """Store the local file at path under key. The local file is consumed."""
+
+    @abstractmethod
+    def open(self, key: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """Yield bytes [start, end) of the object in chunks."""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+    def local_path(self, key: str) -> Optional[str]:
+        """Return a path to the object on local disk, or None when it has to be downloaded."""
+        return None
+
+
+class LocalStorage(StorageBackend):
+    def __init__(self, root: str):
+        self.root = root
+        self.staging_dir = root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def exists(self, key: str) -> bool:
+        return os.path.isfile(self._path(key))
+
+    def size(self, key: str) -> int:
+        return os.path.getsize(self._path(key))
+
+    def put_file(self, key: str, path: str) -> None:
+        dest = self._path(key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        # 同一個檔案系統時是 rename，否則才會複製
+        shutil.move(path, dest)
+
+    def open(self, key: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        return _read_file(self._path(key), start, end)
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def local_path(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        return path if os.path.isfile(path) else None
+
+
+class S3Storage(StorageBackend):
+    """S3-compatible object storage. Pass client to use a preconfigured (or stand-in) boto3 client."""
+
+    NOT_FOUND_CODES = {"404", "NoSuchKey", "NotFound"}
+
+    def __init__(self, bucket: str, prefix: str = "", client=None, staging_dir: str = UPLOAD_DIR, **client_kwargs):
+        if client is None:
+            try:
+                import boto3
+            except ImportError:
+                raise RuntimeError("STORAGE_BACKEND=s3 requires boto3 (pip install boto3)")
+            client = boto3.client("s3", **client_kwargs)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.staging_dir = staging_dir
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def _is_not_found(self, error: Exception) -> bool:
+        code = getattr(error, "response", {}).get("Error", {}).get("Code")
+        return code in self.NOT_FOUND_CODES
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+            return True
+        except Exception as e:
+            if self._is_not_found(e):
+                return False
+            raise
+
+    def size(self, key: str) -> int:
+        return self.client.head_object(Bucket=self.bucket, Key=self._key(key))["ContentLength"]
+
+    def put_file(self, key: str, path: str) -> None:
+        # upload_file 會自動分段（multipart）上傳，不會整份讀進記憶體
+        self.client.upload_file(path, self.bucket, self._key(key))
+        os.remove(path)
+
+    def open(self, key: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        kwargs = {"Bucket": self.bucket, "Key": self._key(key)}
+        if start or end is not None:
+            kwargs["Range"] = f"bytes={start}-{'' if end is None else end - 1}"
+        body = self.client.get_object(**kwargs)["Body"]
+        try:
+            while data := body.read(UPLOAD_CHUNK_SIZE):
+                yield data
+        finally:
+            body.close()
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+
+class ReadThroughCache(StorageBackend):
+    """
+    Keep local copies of objects read from a remote backend.
+
+    Copies are evicted least-recently-used first once they exceed max_bytes.
+    Files written through put_file are copied into the cache as well, since a
+    new upload is usually read again right away (extraction, first download).
+    """
+
+    def __init__(self, backend: StorageBackend, cache_dir: str, max_bytes: int):
+        self.backend = backend
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.staging_dir = backend.staging_dir
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def exists(self, key: str) -> bool:
+        return os.path.isfile(self._path(key)) or self.backend.exists(key)
+
+    def size(self, key: str) -> int:
+        path = self._path(key)
+        if os.path.isfile(path):
+            return os.path.getsize(path)
+        return self.backend.size(key)
+
+    def put_file(self, key: str, path: str) -> None:
+        tmp_path = self._tmp_path(key)
+        shutil.copyfile(path, tmp_path)
+        self.backend.put_file(key, path)
+        os.replace(tmp_path, self._path(key))
+        self.evict()
+
+    def open(self, key: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        path = self._path(key)
+        if os.path.isfile(path):
+            return _read_file(path, start, end)
+        return self.backend.open(key, start, end)
+
+    def delete(self, key: str) -> None:
+        self.backend.delete(key)
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def local_path(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        if os.path.isfile(path):
+            # 更新 mtime 作為 LRU 的最近使用時間
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            return path
+
+        tmp_path = self._tmp_path(key)
+        try:
+            with open(tmp_path, "wb") as out:
+                for data in self.backend.open(key):
+                    out.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        self.evict(keep=path)
+        return path
+
+    def _tmp_path(self, key: str) -> str:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return f"{path}.part-{uuid.uuid4().hex}"
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        entries = []
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for name in filenames:
+                if ".part-" in name:
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    entries.append((os.path.getmtime(path), os.path.getsize(path), path))
+                except OSError:
+                    continue
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def _read_file(path: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = None if end is None else end - start
+        while remaining is None or remaining > 0:
+            size = UPLOAD_CHUNK_SIZE if remaining is None else min(UPLOAD_CHUNK_SIZE, remaining)
+            data = f.read(size)
+            if not data:
+                break
+            if remaining is not None:
+                remaining -= len(data)
+            yield data
+
+
+def create_storage() -> StorageBackend:
+    if STORAGE_BACKEND == "local":
+        return LocalStorage(UPLOAD_DIR)
+    if STORAGE_BACKEND == "s3":
+        if not S3_BUCKET:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires S3_BUCKET")
+        backend = S3Storage(S3_BUCKET, S3_PREFIX, endpoint_url=S3_ENDPOINT_URL, region_name=S3_REGION)
+        if STORAGE_CACHE_MAX_BYTES > 0:
+            return ReadThroughCache(backend, STORAGE_CACHE_DIR, STORAGE_CACHE_MAX_BYTES)
+        return backend
+    raise RuntimeError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+
+
+_storage: Optional[StorageBackend] = None
+
+
+def get_storage() -> StorageBackend:
+    global _storage
+    if _storage is None:
+        _storage = create_storage()
+    return _storage
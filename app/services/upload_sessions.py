@@ -0,0 +1,217 @@
+"""
+Resumable chunked uploads.
+
+A session is a directory under UPLOAD_SESSION_DIR:
+
+    <upload_id>/session.json   owner, file name, size and chunk size
+    <upload_id>/<n>.chunk      chunk n, written once it has been fully received
+
+Clients PUT numbered chunks in any order and may retry any of them; the set of
+chunk files on disk is the record of what has been received. Finalizing
+streams the chunks into one file while hashing it, checks the hash against the
+one the client sent, and moves the result into content-addressed storage.
+Sessions untouched for UPLOAD_SESSION_TTL_SECONDS are garbage-collected.
+
+Sessions live on local disk, not in the storage backend: with several
+instances, UPLOAD_SESSION_DIR must be a shared volume or every request of a
+session must reach the same instance.
+"""
+
+import hashlib
+import json
+import math
+import os
+import shutil
+import time
+import uuid
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+
+import anyio
+from fastapi import HTTPException
+
+from app.core.config import UPLOAD_CHUNK_SIZE, UPLOAD_SESSION_DIR, UPLOAD_SESSION_TTL_SECONDS
+from app.services import file_storage
+
+SESSION_FILE = "session.json"
+CHUNK_SUFFIX = ".chunk"
+
+
+def _session_dir(upload_id: str) -> str:
+    return os.path.join(UPLOAD_SESSION_DIR, upload_id)
+
+
+def _chunk_path(upload_id: str, index: int) -> str:
+    return os.path.join(_session_dir(upload_id), f"{index}{CHUNK_SUFFIX}")
+
+
+def total_chunks(session: dict) -> int:
+    return max(math.ceil(session["size"] / session["chunk_size"]), 1)
+
+
+def chunk_length(session: dict, index: int) -> int:
+    start = index * session["chunk_size"]
+    return min(session["chunk_size"], session["size"] - start)
+
+
+def create_session(user_id, filename: str, size: int, chunk_size: int, project_id=None) -> dict:
+    session = {
+        "upload_id": uuid.uuid4().hex,
+        "user_id": str(user_id),
+        "file_name": filename,
+        "size": size,
+        "chunk_size": chunk_size,
+        "project_id": str(project_id) if project_id else None,
+        "created_at": time.time(),
+    }
+    path = _session_dir(session["upload_id"])
+    os.makedirs(path)
+    with open(os.path.join(path, SESSION_FILE), "w", encoding="utf-8") as f:
+        json.dump(session, f)
+    return session
+
+
+def load_session(upload_id: str, user_id) -> dict:
+    """Load a session owned by user_id; other users' sessions are reported as missing."""
+    try:
+        uuid.UUID(hex=upload_id)
+        with open(os.path.join(_session_dir(upload_id), SESSION_FILE), "r", encoding="utf-8") as f:
+            session = json.load(f)
+    except (ValueError, OSError):
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    if session["user_id"] != str(user_id):
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return session
+
+
+def received_chunks(session: dict) -> List[int]:
+    indexes = []
+    for name in os.listdir(_session_dir(session["upload_id"])):
+        if name.endswith(CHUNK_SUFFIX) and name[:-len(CHUNK_SUFFIX)].isdigit():
+            indexes.append(int(name[:-len(CHUNK_SUFFIX)]))
+    return sorted(i for i in indexes if i < total_chunks(session))
+
+
+def received_ranges(session: dict, chunks: List[int]) -> List[Tuple[int, int]]:
+    """Merge received chunks into [start, end) byte ranges."""
+    ranges: List[List[int]] = []
+    for index in chunks:
+        start = index * session["chunk_size"]
+        end = start + chunk_length(session, index)
+        if ranges and ranges[-1][1] == start:
+            ranges[-1][1] = end
+        else:
+            ranges.append([start, end])
+    return [tuple(r) for r in ranges]
+
+
+def session_status(session: dict) -> dict:
+    chunks = received_chunks(session)
+    received = set(chunks)
+    return {
+        "upload_id": session["upload_id"],
+        "file_name": session["file_name"],
+        "size": session["size"],
+        "chunk_size": session["chunk_size"],
+        "total_chunks": total_chunks(session),
+        "received_ranges": received_ranges(session, chunks),
+        "missing_chunks": [i for i in range(total_chunks(session)) if i not in received],
+    }
+
+
+async def write_chunk(session: dict, index: int, body: AsyncIterator[bytes]) -> int:
+    """
+    Stream one chunk body to disk.
+
+    The chunk is written to a temporary name and only renamed into place when
+    its length matches, so a dropped connection never leaves a partial chunk
+    that looks received.
+    """
+    if not 0 <= index < total_chunks(session):
+        raise HTTPException(status_code=400, detail=f"Chunk index out of range: {index}")
+    expected = chunk_length(session, index)
+
+    path = _chunk_path(session["upload_id"], index)
+    tmp_path = f"{path}.part-{uuid.uuid4().hex}"
+    size = 0
+    try:
+        async with await anyio.open_file(tmp_path, "wb") as out:
+            async for data in body:
+                size += len(data)
+                if size > expected:
+                    raise HTTPException(status_code=400, detail=f"Chunk {index} must be {expected} bytes")
+                await out.write(data)
+        if size != expected:
+            raise HTTPException(status_code=400, detail=f"Chunk {index} must be {expected} bytes")
+        await anyio.to_thread.run_sync(os.replace, tmp_path, path)
+    except BaseException:
+        file_storage.remove_quietly(tmp_path)
+        raise
+
+    # 更新 mtime，仍在上傳中的 session 不會被回收
+    try:
+        os.utime(_session_dir(session["upload_id"]))
+    except OSError:
+        pass
+    return size
+
+
+def assemble(session: dict, expected_sha256: Optional[str], reserve: Callable[[str], None]) -> Tuple[int, str]:
+    """
+    Concatenate all chunks into content-addressed storage.
+
+    Chunks are copied UPLOAD_CHUNK_SIZE bytes at a time while the SHA-256 is
+    computed, so memory use does not depend on the file size. reserve(sha256)
+    is called before the blob is committed, like file_storage.save_blob does.
+
+    Returns:
+        (size, sha256)
+    """
+    status = session_status(session)
+    if status["missing_chunks"]:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Missing chunks: {', '.join(str(i) for i in status['missing_chunks'])}",
+        )
+
+    upload_id = session["upload_id"]
+    assembled = os.path.join(_session_dir(upload_id), f"assembled-{uuid.uuid4().hex}")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(assembled, "wb") as out:
+            for index in range(total_chunks(session)):
+                with open(_chunk_path(upload_id, index), "rb") as chunk:
+                    while data := chunk.read(UPLOAD_CHUNK_SIZE):
+                        digest.update(data)
+                        out.write(data)
+                        size += len(data)
+        sha256 = digest.hexdigest()
+        if expected_sha256 and sha256 != expected_sha256.lower():
+            raise HTTPException(status_code=400, detail="SHA-256 of the assembled file does not match")
+        reserve(sha256)
+        file_storage.commit_blob(assembled, sha256)
+    except BaseException:
+        file_storage.remove_quietly(assembled)
+        raise
+    return size, sha256
+
+
+def delete_session(upload_id: str) -> None:
+    shutil.rmtree(_session_dir(upload_id), ignore_errors=True)
+
+
+def collect_abandoned_sessions(max_age: float = UPLOAD_SESSION_TTL_SECONDS) -> int:
+    """Delete sessions with no activity for max_age seconds. Returns the number removed."""
+    if not os.path.isdir(UPLOAD_SESSION_DIR):
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    for name in os.listdir(UPLOAD_SESSION_DIR):
+        path = os.path.join(UPLOAD_SESSION_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+        except OSError:
+            continue
+    return removed
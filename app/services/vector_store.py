@@ -0,0 +1,314 @@
+"""
+Per-project persistent vector store over uploaded files and chat history.
+
+Each project gets a directory under VECTOR_STORE_DIR:
+
+    <project_id>/vectors.f32     float32 embeddings, appended row by row
+    <project_id>/entries.jsonl   one {"row", "source", "source_id", "text"} line per row
+
+Writes are appends, so new files and chat messages are indexed incrementally.
+Each entry records the vector row it describes, so an append interrupted
+between the two files cannot shift later entries onto the wrong vectors:
+vectors left without an entry are skipped, and a partial trailing row or
+line is cut off before the next append.
+
+Search uses an in-memory FAISS index per project, rebuilt lazily from the
+memory-mapped vectors: an exact IndexFlatL2 while the project has fewer than
+VECTOR_STORE_FLAT_MAX rows, and an approximate IndexHNSWFlat beyond that.
+"""
+
+import fcntl
+import json
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Union
+
+import faiss
+import numpy as np
+
+from app.core.config import VECTOR_STORE_DIR, VECTOR_STORE_FLAT_MAX, VECTOR_STORE_HNSW_M
+from app.gemini.chunker import chunk_paragraphs
+from app.gemini.embedding import encode_texts, get_embedding_model
+from app.gemini.embedding_cache import load_cached_index
+from app.gemini.pdf_extraction import iter_paragraphs
+from app.services import extraction
+from app.services.file_storage import StoredBlob
+
+VECTORS_FILE = "vectors.f32"
+ENTRIES_FILE = "entries.jsonl"
+LOCK_FILE = ".lock"
+
+SOURCE_FILE = "file"
+SOURCE_CHAT = "chat"
+
+# 單一 thread 負責寫入，讓同一個 process 內的 append 依序進行
+_index_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vector-store")
+_indexes: Dict[str, tuple] = {}
+_indexes_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+# 還有排隊中工作的專案 -> 工作數；這些專案被刪除時記在 _deleted，讓之後的寫入跳過，不會重建目錄
+_store_lock = threading.Lock()
+_pending_jobs: Dict[str, int] = {}
+_deleted: set = set()
+
+
+def _project_dir(project_id) -> str:
+    return os.path.join(VECTOR_STORE_DIR, str(project_id))
+
+
+def _dimension() -> int:
+    return get_embedding_model().get_sentence_embedding_dimension()
+
+
+def _build_index(vectors: np.ndarray) -> faiss.Index:
+    dim = vectors.shape[1]
+    if len(vectors) < VECTOR_STORE_FLAT_MAX:
+        index = faiss.IndexFlatL2(dim)
+    else:
+        index = faiss.IndexHNSWFlat(dim, VECTOR_STORE_HNSW_M)
+    if len(vectors):
+        index.add(np.ascontiguousarray(vectors))
+    return index
+
+
+def _load_entries(path: str) -> Dict[int, dict]:
+    """Entries by vector row; a trailing line cut off by a crash is ignored."""
+    entries = {}
+    try:
+        with open(os.path.join(path, ENTRIES_FILE), "r", encoding="utf-8") as f:
+            for position, line in enumerate(f):
+                if not line.endswith("\n"):
+                    break
+                entry = json.loads(line)
+                # 舊格式的 entries 沒有 row，以行號對應
+                entries[entry.pop("row", position)] = entry
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def _load_vectors(path: str, dim: int) -> np.ndarray:
+    vectors_path = os.path.join(path, VECTORS_FILE)
+    rows = os.path.getsize(vectors_path) // (4 * dim) if os.path.exists(vectors_path) else 0
+    if rows == 0:
+        return np.zeros((0, dim), dtype=np.float32)
+    # 寫到一半的最後一列不讀
+    return np.memmap(vectors_path, dtype=np.float32, mode="r", shape=(rows, dim))
+
+
+def _truncate_partial_tail(path: str, dim: int) -> int:
+    """
+    Cut a partially written last vector row and entries line; call with the write lock held.
+
+    Returns:
+        the number of complete vector rows, i.e. the row index of the next append
+    """
+    vectors_path = os.path.join(path, VECTORS_FILE)
+    size = os.path.getsize(vectors_path) if os.path.exists(vectors_path) else 0
+    row_bytes = 4 * dim
+    if size % row_bytes:
+        os.truncate(vectors_path, size - size % row_bytes)
+
+    entries_path = os.path.join(path, ENTRIES_FILE)
+    if os.path.exists(entries_path) and os.path.getsize(entries_path):
+        with open(entries_path, "rb+") as f:
+            end = f.seek(0, os.SEEK_END)
+            f.seek(end - 1)
+            if f.read(1) != b"\n":
+                # 往回找最後一個換行，之後的內容是沒寫完的一行
+                position = end
+                while position > 0:
+                    step = min(4096, position)
+                    position -= step
+                    f.seek(position)
+                    newline = f.read(step).rfind(b"\n")
+                    if newline >= 0:
+                        position += newline + 1
+                        break
+                f.truncate(position)
+    return size // row_bytes
+
+
+def add_texts(project_id, source: str, source_id, texts: List[str]) -> int:
+    """Embed texts and append them to the project's store. Returns the number of rows added."""
+    texts = [text for text in texts if text and text.strip()]
+    if not texts:
+        return 0
+    return add_vectors(project_id, source, source_id, texts, encode_texts(texts))
+
+
+def add_vectors(project_id, source: str, source_id, texts: List[str], vectors: np.ndarray) -> int:
+    """Append already-embedded texts to the project's store; nothing is written once the store was deleted."""
+    path = _project_dir(project_id)
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    # 與 delete_project_store 互斥，刪除後不會再建立目錄
+    with _store_lock:
+        if str(project_id) in _deleted:
+            return 0
+        os.makedirs(path, exist_ok=True)
+        return _append(path, source, source_id, texts, vectors)
+
+
+def _append(path: str, source: str, source_id, texts: List[str], vectors: np.ndarray) -> int:
+    # 多個 worker process 可能同時寫同一個專案，用檔案鎖保護 append
+    with open(os.path.join(path, LOCK_FILE), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        start = _truncate_partial_tail(path, vectors.shape[1])
+        with open(os.path.join(path, VECTORS_FILE), "ab") as f:
+            f.write(vectors.tobytes())
+        with open(os.path.join(path, ENTRIES_FILE), "a", encoding="utf-8") as f:
+            for row, text in enumerate(texts, start):
+                entry = {"row": row, "source": source, "source_id": str(source_id), "text": text}
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    return len(texts)
+
+
+def index_file(project_id, file_id, source: Union[StoredBlob, str, bytes]) -> int:
+    """Extract, chunk and index a PDF (stored blob, file path or bytes)."""
+    if isinstance(source, StoredBlob):
+        # 重用上傳時背景解析的 chunks 與 embeddings，不再重新 embedding
+        cached = load_cached_index(extraction.ensure_extracted(source.sha256))
+        if cached is None:
+            raise RuntimeError(f"Extraction of {source.sha256} is missing from the embedding cache")
+        chunks, _, embeddings = cached
+        return add_vectors(project_id, SOURCE_FILE, file_id, chunks, embeddings)
+    chunks, _ = chunk_paragraphs(list(iter_paragraphs(source)))
+    return add_texts(project_id, SOURCE_FILE, file_id, chunks)
+
+
+def index_chat_message(project_id, chat_id, sender: str, message: str) -> int:
+    return add_texts(project_id, SOURCE_CHAT, chat_id, [f"{sender.upper()}: {message}"])
+
+
+def submit_file(project_id, file_id, source: Union[StoredBlob, str, bytes]):
+    return _submit(index_file, project_id, file_id, source)
+
+
+def submit_chat_message(project_id, chat_id, sender: str, message: str):
+    return _submit(index_chat_message, project_id, chat_id, sender, message)
+
+
+def _submit(fn, project_id, *args):
+    key = str(project_id)
+    with _store_lock:
+        _pending_jobs[key] = _pending_jobs.get(key, 0) + 1
+    return _index_executor.submit(_run_job, key, fn, project_id, *args)
+
+
+def _run_job(key: str, fn, *args):
+    try:
+        with _store_lock:
+            if key in _deleted:
+                # 專案已刪除，不必再解析或 embedding
+                return 0
+        return _log_errors(fn, *args)
+    finally:
+        with _store_lock:
+            remaining = _pending_jobs[key] - 1
+            if remaining:
+                _pending_jobs[key] = remaining
+            else:
+                # 沒有排隊中的工作了，不必再記住這個專案
+                del _pending_jobs[key]
+                _deleted.discard(key)
+
+
+def _log_errors(fn, *args):
+    # 索引失敗不應該影響原本的寫入流程
+    try:
+        return fn(*args)
+    except Exception as e:
+        print(f"⚠️ Vector store indexing failed: {e}")
+        return 0
+
+
+def _entries_size(path: str) -> int:
+    try:
+        return os.path.getsize(os.path.join(path, ENTRIES_FILE))
+    except OSError:
+        return 0
+
+
+def _get_index(project_id):
+    key = str(project_id)
+    path = _project_dir(project_id)
+    # 以 entries 檔案大小判斷快取是否過期，其他 worker process 寫入時也能察覺
+    size = _entries_size(path)
+    if size == 0:
+        return None
+    with _indexes_lock:
+        cached = _indexes.get(key)
+    if cached is not None and cached[2] == size:
+        return cached[0], cached[1]
+
+    with _refresh_lock:
+        with _indexes_lock:
+            cached = _indexes.get(key)
+        with open(os.path.join(path, LOCK_FILE), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_SH)
+            size = _entries_size(path)
+            entries = _load_entries(path)
+            vectors = _load_vectors(path, _dimension())
+        count = len(vectors)
+
+        index = None
+        if cached is not None:
+            index = cached[0]
+            crossed_threshold = index.ntotal < VECTOR_STORE_FLAT_MAX <= count
+            if crossed_threshold or count < index.ntotal:
+                index = None
+            elif count > index.ntotal:
+                # 只把新增的列加進既有的 index（faiss 的 add 與 search 不能同時進行）
+                with _indexes_lock:
+                    index.add(np.ascontiguousarray(vectors[index.ntotal:count]))
+        if index is None:
+            index = _build_index(vectors)
+
+        with _indexes_lock:
+            _indexes[key] = (index, entries, size)
+        return index, entries
+
+
+def search(project_id, query: str, top_k: int = 5, source: Optional[str] = None) -> List[dict]:
+    """
+    Return the top_k entries closest to query.
+
+    Args:
+        source: only return entries from "file" or "chat"
+    """
+    loaded = _get_index(project_id)
+    if loaded is None:
+        return []
+    index, entries = loaded
+
+    # 有來源篩選時多取一些候選再過濾
+    query_vec = encode_texts([query])
+    with _indexes_lock:
+        k = min(index.ntotal, top_k * 4 if source else top_k)
+        distances, ids = index.search(query_vec, k)
+
+    results = []
+    for distance, i in zip(distances[0], ids[0]):
+        if i < 0:
+            continue
+        entry = entries.get(int(i))
+        # 中斷的寫入留下沒有 entry 的向量
+        if entry is None or (source and entry["source"] != source):
+            continue
+        results.append({**entry, "score": float(distance)})
+        if len(results) >= top_k:
+            break
+    return results
+
+
+def delete_project_store(project_id) -> None:
+    """Delete the project's store; index jobs still queued for it are skipped and cannot recreate it."""
+    key = str(project_id)
+    with _store_lock:
+        if key in _pending_jobs:
+            _deleted.add(key)
+        with _indexes_lock:
+            _indexes.pop(key, None)
+        shutil.rmtree(_project_dir(project_id), ignore_errors=True)
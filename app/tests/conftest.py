@@ -1,5 +1,8 @@
 import os
 import pytest
+
+# 測試時開啟查詢檢查：response 帶 X-Query-Count，供 query_budget 標記比對
+os.environ.setdefault("QUERY_DEBUG", "true")
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
@@ -31,8 +34,74 @@ app.dependency_overrides[get_db] = override_get_db
 
 @pytest.fixture(scope="module")
 def client():
+    # 每個測試模組結束時會刪掉 test.db，所以這裡重新建立資料表
+    Base.metadata.create_all(bind=engine)
     with TestClient(app) as c:
         yield c
 
+    # 先關掉連線池裡指向舊檔案的連線，下一個模組才會連到新的 test.db
+    engine.dispose()
     if os.path.exists("test.db"):
         os.remove("test.db")
+
+
+@pytest.fixture
+def auth_headers(client):
+    """Return register(email): sign up a user and get the Authorization header for it."""
+    def register(email, name="Test User"):
+        token = client.post("/auth/register", json={
+            "name": name,
+            "email": email,
+            "password": "securepass"
+        }).json()["token"]
+        return {"Authorization": f"Bearer {token}"}
+
+    return register
+
+
+@pytest.fixture
+def db_session(client):
+    """A session on the test database, closed when the test ends."""
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers",
+        "query_budget(n, route=None): fail when a request made by the client fixture runs more than n SQL statements",
+    )
+
+
+@pytest.fixture(autouse=True)
+def query_budget(request):
+    """
+    Enforce @pytest.mark.query_budget(n) on every request the test makes with the client fixture.
+
+    The count comes from the X-Query-Count header and includes the lookup of
+    the current user. Pass route="/path" to only check requests to that path,
+    so the requests that set up data (registering, creating projects) are not
+    held to the same budget.
+    """
+    marker = request.node.get_closest_marker("query_budget")
+    if marker is None:
+        yield
+        return
+    budget = marker.args[0]
+    route = marker.kwargs.get("route")
+    c = request.getfixturevalue("client")
+
+    def check(response):
+        path = response.request.url.path
+        count = response.headers.get("x-query-count")
+        if (route is None or path == route) and count is not None and int(count) > budget:
+            pytest.fail(f"{response.request.method} {path} ran {count} SQL statements, budget is {budget}")
+
+    c.event_hooks["response"].append(check)
+    try:
+        yield
+    finally:
+        c.event_hooks["response"].remove(check)
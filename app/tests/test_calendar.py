@@ -0,0 +1,65 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+from app.models import Milestone, Project, Task, User
+from app.services.ical import escape_text, fold_line
+
+
+def create_project(db, email):
+    user = db.query(User).filter_by(email=email).one()
+    project = Project(name="Thesis, draft", start_time=datetime(2026, 1, 1), user_id=user.id)
+    milestone = Milestone(name="Research", start_time=datetime(2026, 1, 1), end_time=datetime(2026, 2, 15, 18), project=project)
+    milestone.tasks.append(Task(title="Read papers", description="Line one\nline two; more", due_date=date(2026, 2, 1), estimated_loading=Decimal("2")))
+    milestone.tasks.append(Task(title="Undated", due_date=None))
+    db.add(project)
+    db.commit()
+    return str(milestone.tasks[0].id)
+
+
+def feed_path(client, headers):
+    url = client.get("/calendar/feed_url", headers=headers).json()["url"]
+    return url[url.index("/calendar/"):]
+
+
+def test_fold_line_keeps_utf8_characters_whole():
+    line = "SUMMARY:" + "讀書計畫" * 20
+    folded = fold_line(line)
+    pieces = folded[:-2].split("\r\n ")
+    assert all(len(piece.encode("utf-8")) <= 75 for piece in pieces)
+    assert "".join(pieces) == line
+    assert escape_text("a,b;c\\d\ne") == "a\\,b\\;c\\\\d\\ne"
+
+
+def test_calendar_feed(client, auth_headers, db_session):
+    headers = auth_headers("calendar@example.com")
+    task_id = create_project(db_session, "calendar@example.com")
+    path = feed_path(client, headers)
+
+    # 訂閱網址本身就是憑證，不需要 Authorization header
+    response = client.get(path)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/calendar")
+    body = response.text
+    assert body.startswith("BEGIN:VCALENDAR\r\n") and body.endswith("END:VCALENDAR\r\n")
+    assert body.count("BEGIN:VEVENT") == 2
+    assert f"UID:task-{task_id}@beliver" in body
+    assert "DTSTART;VALUE=DATE:20260201\r\nDTEND;VALUE=DATE:20260202" in body
+    assert "DTSTART;VALUE=DATE:20260215" in body
+    assert "DESCRIPTION:Line one\\nline two\\; more" in body
+    assert "CATEGORIES:Thesis\\, draft" in body
+
+    etag = response.headers["ETag"]
+    assert client.get(path, headers={"If-None-Match": etag}).status_code == 304
+
+    assert client.patch(f"/tasks/{task_id}", json={"isCompleted": True}, headers=headers).status_code == 200
+    response = client.get(path, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert "SUMMARY:✓ Read papers" in response.text
+
+
+def test_calendar_feed_rejects_other_tokens(client, auth_headers):
+    headers = auth_headers("calendar-token@example.com")
+    assert client.get("/calendar/not-a-token.ics").status_code == 401
+    # 登入用的 JWT 不能拿來當訂閱 token
+    assert client.get(f"/calendar/{headers['Authorization'].split()[1]}.ics").status_code == 401
@@ -0,0 +1,39 @@
+from app.gemini.chunker import chunk_paragraphs, count_tokens, deduplicate
+
+
+def test_repeated_headers_are_removed():
+    paragraphs = [
+        "Software Requirement Specification - Page 1",
+        "第一章 系統需求說明，包含登入、專案建立與任務排程。",
+        "Software Requirement Specification - Page 2",
+        "第二章 資料庫設計，包含使用者、專案、里程碑與任務資料表。",
+    ]
+    unique, repeated = deduplicate(paragraphs)
+    assert len(unique) == 3
+    assert list(repeated.values()) == [2]
+
+
+def test_long_paragraph_is_split_with_overlap():
+    paragraph = " ".join(f"word{i}" for i in range(500))
+    chunks, stats = chunk_paragraphs([paragraph], target_tokens=100, overlap_tokens=20)
+
+    assert stats["chunks"] == len(chunks) > 1
+    assert stats["chunk_tokens_max"] <= 100
+    # 相鄰兩塊共用 20 個 token
+    assert chunks[0].split()[-20:] == chunks[1].split()[:20]
+
+
+def test_small_paragraphs_are_merged():
+    paragraphs = [f"第{chr(0x4e00 + i)}段比較短的內容，用來測試合併" for i in range(40)]
+    chunks, stats = chunk_paragraphs(paragraphs, target_tokens=120, overlap_tokens=0)
+
+    assert stats["duplicates_removed"] == 0
+    assert len(chunks) < len(paragraphs)
+    assert all(count_tokens(chunk) <= 120 for chunk in chunks)
+    assert "\n\n".join(chunks) == "\n\n".join(paragraphs)
+
+
+def test_page_numbers_do_not_defeat_dedup():
+    paragraphs = [f"這是第 {i} 頁的頁尾，版權所有請勿轉載" for i in range(40)]
+    _, stats = chunk_paragraphs(paragraphs)
+    assert stats["duplicates_removed"] == 39
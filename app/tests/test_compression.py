@@ -0,0 +1,125 @@
+import asyncio
+import gzip
+import zlib
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.core.middleware import CompressionMiddleware, choose_encoding
+
+MARKDOWN = "## Milestone\n- read the related chapters and write notes\n" * 100
+
+
+def build_app():
+    app = FastAPI()
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=1024,
+        media_types=("application/json", "text/markdown", "text/event-stream"),
+    )
+
+    @app.get("/draft")
+    def draft():
+        return {"markdown": MARKDOWN}
+
+    @app.get("/small")
+    def small():
+        return {"status": "ok"}
+
+    @app.get("/tagged")
+    def tagged():
+        return Response(MARKDOWN, media_type="text/markdown", headers={"ETag": '"draft-v1"'})
+
+    @app.get("/file.pdf")
+    def pdf():
+        return Response(b"%PDF-1.7" + b"0" * 4096, media_type="application/pdf")
+
+    @app.get("/events")
+    def events():
+        def stream():
+            for index in range(3):
+                yield f"data: {index}\n\n"
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return app
+
+
+def collect(app, path, accept_encoding="gzip"):
+    # 直接呼叫 ASGI app，拿到每一個送出的訊息（TestClient 會自動解壓縮）
+    messages = []
+    requested = []
+
+    async def receive():
+        if requested:
+            # 之後只等 disconnect，串流結束時會被取消
+            await asyncio.Event().wait()
+        requested.append(True)
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"accept-encoding", accept_encoding.encode())],
+        "client": ("test", 1),
+        "server": ("test", 80),
+    }
+    asyncio.run(app(scope, receive, send))
+    return messages[0], messages[1:]
+
+
+def test_choose_encoding():
+    assert choose_encoding("gzip, deflate") == "gzip"
+    assert choose_encoding("gzip;q=0") is None
+    assert choose_encoding("*") in ("br", "gzip")
+    assert choose_encoding("identity") is None
+
+
+def test_large_json_is_gzipped():
+    client = TestClient(build_app())
+    response = client.get("/draft", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "accept-encoding" in response.headers["vary"].lower()
+    assert response.json() == {"markdown": MARKDOWN}
+
+    start, bodies = collect(build_app(), "/draft")
+    headers = dict(start["headers"])
+    body = b"".join(message["body"] for message in bodies)
+    assert int(headers[b"content-length"]) == len(body)
+    assert len(body) < len(MARKDOWN) / 5
+
+
+def test_small_pdf_and_identity_are_untouched():
+    client = TestClient(build_app())
+    assert "content-encoding" not in client.get("/small", headers={"Accept-Encoding": "gzip"}).headers
+    assert "content-encoding" not in client.get("/file.pdf", headers={"Accept-Encoding": "gzip"}).headers
+    assert "content-encoding" not in client.get("/draft", headers={"Accept-Encoding": "identity"}).headers
+
+
+def test_compressed_etag_is_weak():
+    response = TestClient(build_app()).get("/tagged", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == 'W/"draft-v1"'
+
+
+def test_event_stream_chunks_decode_as_they_arrive():
+    start, bodies = collect(build_app(), "/events")
+    headers = dict(start["headers"])
+    assert headers[b"content-encoding"] == b"gzip"
+    assert b"content-length" not in headers
+
+    decoder = zlib.decompressobj(31)
+    received = [decoder.decompress(message["body"]) for message in bodies if message["body"]]
+    # 每個事件壓縮後立即 flush，不必等整個串流結束就能解出來
+    assert received[:3] == [b"data: 0\n\n", b"data: 1\n\n", b"data: 2\n\n"]
+    assert gzip.decompress(b"".join(message["body"] for message in bodies)) == b"data: 0\n\ndata: 1\n\ndata: 2\n\n"
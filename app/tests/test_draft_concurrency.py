@@ -0,0 +1,74 @@
+import asyncio
+import time
+
+import httpx
+
+from app.main import app
+from app.api.routes import assistant
+from app.gemini import summary_pdf
+
+CPU_STAGE_SECONDS = 1.0
+GEMINI_STAGE_SECONDS = 0.5
+
+
+# 這些函式會在 process pool / thread pool 中執行，用 sleep 模擬耗時的解析與 Gemini 呼叫
+def slow_retrieve_from_documents(keys, query, top_k):
+    time.sleep(CPU_STAGE_SECONDS)
+    return ["專案概述", "里程碑"]
+
+
+def slow_refine(chunks):
+    time.sleep(GEMINI_STAGE_SECONDS)
+    return "\n".join(chunks)
+
+
+def fake_generate(context, title, deadline):
+    return {"projects": [{"name": title}]}
+
+
+def test_other_routes_respond_while_draft_runs(client, monkeypatch):
+    monkeypatch.setattr(summary_pdf, "has_cached_index", lambda key: True)
+    monkeypatch.setattr(summary_pdf, "retrieve_from_documents", slow_retrieve_from_documents)
+    monkeypatch.setattr(summary_pdf, "refine_chunks_with_gemini", slow_refine)
+    monkeypatch.setattr(summary_pdf, "generate_structured_json", fake_generate)
+    monkeypatch.setattr(assistant, "json_to_markdown", lambda result: "# draft")
+
+    token = client.post("/auth/register", json={
+        "name": "Draft User",
+        "email": "draft@example.com",
+        "password": "securepass"
+    }).json()["token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+            drafts = [
+                asyncio.create_task(ac.post(
+                    "/assistant/project_draft",
+                    files={"file": ("spec.pdf", b"%PDF-1.4", "application/pdf")},
+                    data={"title": f"Draft {i}", "deadline": "2026-12-31T00:00:00"},
+                    headers=headers,
+                ))
+                for i in range(2)
+            ]
+            await asyncio.sleep(0.2)
+
+            latencies = []
+            for _ in range(5):
+                start = time.perf_counter()
+                response = await ac.get("/user/profile", headers=headers)
+                latencies.append(time.perf_counter() - start)
+                assert response.status_code == 200
+            drafts_running = not any(task.done() for task in drafts)
+
+            results = await asyncio.gather(*drafts)
+            return latencies, drafts_running, results
+
+    latencies, drafts_running, results = asyncio.run(scenario())
+
+    assert drafts_running
+    assert max(latencies) < CPU_STAGE_SECONDS / 2
+    for i, response in enumerate(results):
+        assert response.status_code == 200
+        assert response.json()["projects"] == [{"name": f"Draft {i}"}]
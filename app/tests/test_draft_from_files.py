@@ -0,0 +1,137 @@
+import asyncio
+import hashlib
+import shutil
+from concurrent.futures import Future
+
+import faiss
+import numpy as np
+import pytest
+
+from app.api.routes import assistant
+from app.gemini import document_index, embedding_cache, summary_pdf
+from app.services import extraction, file_storage, storage
+
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "_storage", storage.LocalStorage(str(tmp_path)))
+    return tmp_path
+
+
+@pytest.fixture
+def captured_sources(monkeypatch):
+    captured = []
+
+    async def fake_retrieve(sources, query=summary_pdf.DRAFT_QUERY, top_k=summary_pdf.DRAFT_TOP_K):
+        captured.extend(sources)
+        return ["專案概述"]
+
+    monkeypatch.setattr(summary_pdf, "retrieve_from_documents_async", fake_retrieve)
+    monkeypatch.setattr(summary_pdf, "refine_chunks_with_gemini", lambda chunks: "\n".join(chunks))
+    monkeypatch.setattr(summary_pdf, "generate_structured_json", lambda context, title, deadline: {"projects": []})
+    monkeypatch.setattr(assistant, "json_to_markdown", lambda result: "")
+    return captured
+
+
+def test_draft_from_uploaded_file_ids(client, upload_dir, captured_sources, auth_headers):
+    headers = auth_headers("files@example.com")
+    uploaded = client.post(
+        "/upload",
+        files=[("files", ("a.pdf", b"%PDF-a", "application/pdf")), ("files", ("b.pdf", b"%PDF-b", "application/pdf"))],
+        headers=headers,
+    ).json()["files"]
+    file_ids = [f["file_id"] for f in uploaded]
+
+    response = client.post(
+        "/assistant/project_draft",
+        data={"file_ids": file_ids, "title": "Spec", "deadline": "2026-12-31T00:00:00"},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    assert response.json()["file_name"] == "a.pdf, b.pdf"
+    assert captured_sources == [
+        file_storage.StoredBlob(hashlib.sha256(b"%PDF-a").hexdigest()),
+        file_storage.StoredBlob(hashlib.sha256(b"%PDF-b").hexdigest()),
+    ]
+
+
+def test_draft_rejects_other_users_files(client, upload_dir, captured_sources, auth_headers):
+    owner = auth_headers("owner@example.com")
+    other = auth_headers("other@example.com")
+    file_id = client.post(
+        "/upload",
+        files=[("files", ("secret.pdf", b"%PDF-s", "application/pdf"))],
+        headers=owner,
+    ).json()["files"][0]["file_id"]
+
+    response = client.post(
+        "/assistant/project_draft",
+        data={"file_ids": [file_id], "title": "Spec", "deadline": "2026-12-31T00:00:00"},
+        headers=other,
+    )
+    assert response.status_code == 404
+    assert captured_sources == []
+
+
+def test_draft_requires_a_document(client, auth_headers):
+    headers = auth_headers("nodoc@example.com")
+    response = client.post(
+        "/assistant/project_draft",
+        data={"title": "Spec", "deadline": "2026-12-31T00:00:00"},
+        headers=headers,
+    )
+    assert response.status_code == 400
+
+
+def test_retrieve_merges_multiple_documents(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(document_index, "encode_query", lambda query: np.array([[1.0, 0.0]], dtype=np.float32))
+
+    for key, chunks, vectors in [
+        ("doc-a", ["a-far", "a-near"], [[0.0, 5.0], [0.9, 0.0]]),
+        ("doc-b", ["b-nearest"], [[1.0, 0.0]]),
+    ]:
+        embeddings = np.array(vectors, dtype=np.float32)
+        index = faiss.IndexFlatL2(2)
+        index.add(embeddings)
+        embedding_cache.store_index(key, chunks, index, embeddings)
+
+    chunks = document_index.retrieve_from_documents(["doc-a", "doc-b"], "query", top_k=2)
+    assert chunks == ["b-nearest", "a-near"]
+
+
+def test_retrieve_rebuilds_index_evicted_after_prepare(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(document_index, "encode_query", lambda query: np.array([[1.0, 0.0]], dtype=np.float32))
+    source = file_storage.StoredBlob("ab" * 32)
+    key = document_index.document_cache_key(source)
+
+    prepared = []
+
+    def fake_submit(sha256):
+        # 代替背景解析：把文件放進快取
+        prepared.append(sha256)
+        embeddings = np.array([[1.0, 0.0]], dtype=np.float32)
+        index = faiss.IndexFlatL2(2)
+        index.add(embeddings)
+        embedding_cache.store_index(key, ["概述"], index, embeddings)
+        future = Future()
+        future.set_result(key)
+        return future
+
+    retrievals = []
+
+    async def fake_run_in_process(fn, *args):
+        if not retrievals:
+            # 模擬另一份文件寫入快取時，evict_cache 在檢索前刪掉了這個 entry
+            shutil.rmtree(tmp_path / key)
+        retrievals.append(args)
+        return fn(*args)
+
+    monkeypatch.setattr(extraction, "submit", fake_submit)
+    monkeypatch.setattr(summary_pdf, "run_in_process", fake_run_in_process)
+
+    chunks = asyncio.run(summary_pdf.retrieve_from_documents_async([source]))
+    assert chunks == ["概述"]
+    assert len(prepared) == 2
+    assert len(retrievals) == 2
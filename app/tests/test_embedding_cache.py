@@ -0,0 +1,59 @@
+import os
+import faiss
+import numpy as np
+import pytest
+
+from app.gemini import embedding_cache
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_DIR", str(tmp_path))
+    return tmp_path
+
+
+def make_entry(n=20, dim=8):
+    embeddings = np.random.rand(n, dim).astype(np.float32)
+    index = faiss.IndexFlatL2(dim)
+    index.add(embeddings)
+    paragraphs = [f"段落 {i}" for i in range(n)]
+    return paragraphs, index, embeddings
+
+
+def test_content_hash_is_stable():
+    assert embedding_cache.content_hash(b"abc") == embedding_cache.content_hash(b"abc")
+    assert embedding_cache.content_hash(b"abc") != embedding_cache.content_hash(b"abd")
+
+
+def test_store_and_load_roundtrip(cache_dir):
+    paragraphs, index, embeddings = make_entry()
+    embedding_cache.store_index("doc1", paragraphs, index, embeddings)
+
+    cached = embedding_cache.load_cached_index("doc1")
+    assert cached is not None
+    cached_paragraphs, cached_index, cached_embeddings = cached
+    assert cached_paragraphs == paragraphs
+    assert isinstance(cached_embeddings, np.memmap)
+    assert cached_embeddings.dtype == np.float32
+    np.testing.assert_array_equal(cached_embeddings, embeddings)
+    _, ids = cached_index.search(embeddings[:1], 1)
+    assert ids[0][0] == 0
+
+
+def test_load_missing_entry(cache_dir):
+    assert embedding_cache.load_cached_index("missing") is None
+
+
+def test_evict_least_recently_used(cache_dir):
+    for i, key in enumerate(["old", "mid", "new"]):
+        embedding_cache.store_index(key, *make_entry())
+        os.utime(cache_dir / key, (1000 + i, 1000 + i))
+
+    # 讀取 old 會更新它的使用時間，所以被淘汰的應該是 mid
+    embedding_cache.load_cached_index("old")
+    entry_size = embedding_cache._dir_size(str(cache_dir / "new"))
+    embedding_cache.evict_cache(max_bytes=entry_size * 2)
+
+    assert (cache_dir / "old").exists()
+    assert not (cache_dir / "mid").exists()
+    assert (cache_dir / "new").exists()
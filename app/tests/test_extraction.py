@@ -0,0 +1,63 @@
+import hashlib
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from app.gemini import document_index, embedding_cache
+from app.gemini.pdf_extraction import page_count
+from app.services import extraction, file_storage, storage
+
+EXAMPLE_PDF = "uploads/example.pdf"
+
+
+def fake_encode(texts):
+    return np.array(
+        [np.frombuffer(hashlib.sha256(text.encode("utf-8")).digest()[:8], dtype=np.uint8) for text in texts],
+        dtype=np.float32,
+    )
+
+
+@pytest.fixture
+def stored_pdf(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "_storage", storage.LocalStorage(str(tmp_path / "uploads")))
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(document_index, "encode_texts", fake_encode)
+    # 測試環境沒有 embedding 模型，改在 thread 中執行才能套用上面的假 encoder
+    pool = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(extraction, "get_process_pool", lambda: pool)
+
+    incoming = tmp_path / "incoming.pdf"
+    shutil.copyfile(EXAMPLE_PDF, incoming)
+    sha256 = embedding_cache.file_content_hash(str(incoming))
+    file_storage.commit_blob(str(incoming), sha256)
+    yield sha256
+    pool.shutdown()
+
+
+def test_extraction_fills_cache_and_storage(stored_pdf):
+    key = extraction.ensure_extracted(stored_pdf)
+
+    chunks, index, embeddings = embedding_cache.load_cached_index(key)
+    assert len(chunks) == index.ntotal == len(embeddings) > 0
+    meta = embedding_cache.load_meta(key)
+    assert meta["page_count"] == page_count(EXAMPLE_PDF)
+    assert meta["chunk_stats"]["chunks"] == len(chunks)
+    for name in extraction.SIDECAR_FILES:
+        assert storage.get_storage().exists(extraction.sidecar_key(stored_pdf, name))
+
+
+def test_extraction_restores_from_storage_without_parsing(stored_pdf, monkeypatch):
+    key = extraction.ensure_extracted(stored_pdf)
+    chunks = embedding_cache.load_cached_index(key)[0]
+    # 模擬另一個 instance：本機快取是空的
+    shutil.rmtree(embedding_cache.EMBEDDING_CACHE_DIR)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("PDF should not be parsed again")
+
+    monkeypatch.setattr(extraction, "iter_paragraphs", fail)
+    assert extraction.ensure_extracted(stored_pdf) == key
+    assert embedding_cache.load_cached_index(key)[0] == chunks
+    assert embedding_cache.load_meta(key)["page_count"] == page_count(EXAMPLE_PDF)
@@ -0,0 +1,63 @@
+from types import SimpleNamespace
+
+import pytest
+from prometheus_client import REGISTRY
+
+from app.core.metrics import generate_content
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class FakeModel:
+    def __init__(self, error=None):
+        self.error = error
+
+    def generate_content(self, prompt):
+        if self.error:
+            raise self.error
+        usage = SimpleNamespace(prompt_token_count=120, candidates_token_count=30)
+        return SimpleNamespace(text="{}", usage_metadata=usage)
+
+
+def test_route_latency_and_queries_use_route_template(client, auth_headers):
+    headers = auth_headers("metrics@example.com")
+    before = sample("http_request_duration_seconds_count", method="PATCH", route="/tasks/{task_id}", status="404")
+    queries_before = sample("http_request_db_queries_sum", route="/tasks/{task_id}")
+
+    client.patch("/tasks/00000000-0000-0000-0000-000000000000", json={"isCompleted": True}, headers=headers)
+
+    assert sample("http_request_duration_seconds_count", method="PATCH", route="/tasks/{task_id}", status="404") == before + 1
+    # 至少有查使用者與查任務兩句
+    assert sample("http_request_db_queries_sum", route="/tasks/{task_id}") >= queries_before + 2
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'route="/tasks/{task_id}"' in body
+    assert "threadpool_threads_limit" in body
+    assert "db_pool_checkouts_total" in body
+    assert "http_requests_in_progress" in body
+    assert "response_cache_invalidations_total" in body
+
+
+def test_unknown_paths_share_one_label(client):
+    before = sample("http_request_duration_seconds_count", method="GET", route="unmatched", status="404")
+    client.get("/no-such-page/1")
+    client.get("/no-such-page/2")
+    assert sample("http_request_duration_seconds_count", method="GET", route="unmatched", status="404") == before + 2
+
+
+def test_gemini_latency_and_tokens():
+    before = sample("gemini_tokens_total", prompt_type="replan", kind="prompt")
+    calls = sample("gemini_request_duration_seconds_count", prompt_type="replan", status="ok")
+    assert generate_content(FakeModel(), "prompt", "replan").text == "{}"
+    assert sample("gemini_tokens_total", prompt_type="replan", kind="prompt") == before + 120
+    assert sample("gemini_request_duration_seconds_count", prompt_type="replan", status="ok") == calls + 1
+
+    errors = sample("gemini_request_duration_seconds_count", prompt_type="replan", status="error")
+    with pytest.raises(TimeoutError):
+        generate_content(FakeModel(TimeoutError()), "prompt", "replan")
+    assert sample("gemini_request_duration_seconds_count", prompt_type="replan", status="error") == errors + 1
@@ -0,0 +1,36 @@
+import pytest
+
+from app.gemini.pdf_extraction import iter_paragraphs, page_ranges
+
+SAMPLE_PDF = "uploads/example.pdf"
+
+
+@pytest.fixture(scope="module")
+def sample_pdf():
+    with open(SAMPLE_PDF, "rb") as f:
+        return f.read()
+
+
+def test_page_ranges_cover_all_pages():
+    ranges = page_ranges(100, workers=4, pages_per_task=8)
+    assert ranges[0][0] == 0
+    assert ranges[-1][1] == 100
+    assert all(prev[1] == cur[0] for prev, cur in zip(ranges, ranges[1:]))
+
+
+def test_parallel_matches_serial(sample_pdf):
+    serial = list(iter_paragraphs(sample_pdf, parallel=False))
+    parallel = list(iter_paragraphs(sample_pdf, parallel=True, workers=2))
+    assert serial
+    assert parallel == serial
+
+
+def test_max_pages_and_path_source(sample_pdf):
+    first_page = list(iter_paragraphs(sample_pdf, max_pages=1))
+    assert first_page == list(iter_paragraphs(SAMPLE_PDF, max_pages=1))
+    assert len(first_page) <= len(list(iter_paragraphs(sample_pdf)))
+
+
+def test_timeout(sample_pdf):
+    with pytest.raises(TimeoutError):
+        list(iter_paragraphs(sample_pdf, parallel=True, workers=2, timeout=0))
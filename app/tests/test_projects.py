@@ -0,0 +1,394 @@
+import uuid
+from contextlib import contextmanager
+from datetime import date, datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+from prometheus_client import REGISTRY
+from sqlalchemy import event
+
+from app.api.routes import project as project_routes
+from app.crud import crud_project
+from app.models import Milestone, Project, Task, User
+
+
+def sample(name, labels=None):
+    return REGISTRY.get_sample_value(name, labels or {}) or 0
+
+
+def cache_hits(route):
+    return sample("response_cache_lookups_total", {"route": route, "result": "hit"})
+
+
+def create_project(db, email):
+    user = db.query(User).filter_by(email=email).one()
+    project = Project(
+        name="Versioned", summary="", start_time=datetime(2026, 1, 1), end_time=datetime(2026, 3, 1),
+        due_date=date(2026, 3, 1), estimated_loading=Decimal("2"), user_id=user.id,
+    )
+    milestone = Milestone(
+        name="M1", summary="", start_time=datetime(2026, 1, 1), end_time=datetime(2026, 2, 1),
+        estimated_loading=Decimal("2"), project=project,
+    )
+    milestone.tasks.append(Task(title="Task", due_date=date(2026, 2, 1), estimated_loading=Decimal("2")))
+    db.add(project)
+    db.commit()
+    return str(project.id), str(milestone.id), str(milestone.tasks[0].id)
+
+
+def no_tree_loads(monkeypatch):
+    # 304 時不應該載入專案樹
+    def fail(*args, **kwargs):
+        raise AssertionError("project tree loaded for a 304 response")
+
+    for name in ("get_all_projects_with_progress", "get_project_detail_from_db", "get_milestone_detail_from_db", "get_project_tree_from_db"):
+        monkeypatch.setattr(project_routes, name, fail)
+
+
+def test_project_detail_etag(client, monkeypatch, auth_headers, db_session):
+    headers = auth_headers("etag@example.com")
+    project_id, milestone_id, task_id = create_project(db_session, "etag@example.com")
+    urls = [
+        ("/projects", {}),
+        ("/project_detail", {"project_id": project_id}),
+        ("/milestone_detail", {"project_id": project_id, "milestone_id": milestone_id}),
+        ("/project_tree", {"project_id": project_id}),
+    ]
+
+    etags = []
+    for url, params in urls:
+        response = client.get(url, params=params, headers=headers)
+        assert response.status_code == 200
+        assert response.headers["Cache-Control"] == "private, no-cache"
+        etags.append(response.headers["ETag"])
+
+    with monkeypatch.context() as m:
+        no_tree_loads(m)
+        for (url, params), etag in zip(urls, etags):
+            response = client.get(url, params=params, headers={**headers, "If-None-Match": etag})
+            assert response.status_code == 304
+            assert response.headers["ETag"] == etag
+
+    # 任務的寫入也會讓專案版本號加一
+    assert client.patch(f"/tasks/{task_id}", json={"isCompleted": True}, headers=headers).status_code == 200
+    for (url, params), etag in zip(urls, etags):
+        response = client.get(url, params=params, headers={**headers, "If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+
+    detail = client.get("/project_detail", params={"project_id": project_id}, headers=headers)
+    assert client.patch("/tasks", json={"tasks": [{"task_id": task_id, "title": "Renamed"}]}, headers=headers).status_code == 200
+    response = client.get("/project_detail", params={"project_id": project_id}, headers={
+        **headers, "If-None-Match": detail.headers["ETag"]
+    })
+    assert response.status_code == 200
+
+
+def test_etag_routes_check_ownership(client, auth_headers, db_session):
+    auth_headers("etag-owner@example.com")
+    project_id, milestone_id, _ = create_project(db_session, "etag-owner@example.com")
+    headers = auth_headers("etag-other@example.com")
+
+    response = client.get("/project_detail", params={"project_id": project_id}, headers={**headers, "If-None-Match": "*"})
+    assert response.status_code == 404
+    response = client.get("/milestone_detail", params={"project_id": project_id, "milestone_id": milestone_id}, headers=headers)
+    assert response.status_code == 404
+    assert client.get("/projects", headers=headers).status_code == 404
+
+
+def test_malformed_ids_are_rejected_with_422(client, auth_headers):
+    headers = auth_headers("bad-ids@example.com")
+    times = {"changed_project_start_time": "2026-01-01T00:00:00", "changed_project_end_time": "2026-02-01T00:00:00"}
+    requests = [
+        ("put", "/project_detail", {"project_id": "not-a-uuid", "changed_project_summary": "", "changed_name": "P", **times}),
+        ("put", "/milestone_detail", {
+            "project_id": "not-a-uuid", "milestone_id": "nope", "changed_milestone_summary": "",
+            "changed_milestone_start_time": "2026-01-01T00:00:00", "changed_milestone_end_time": "2026-02-01T00:00:00",
+        }),
+        ("post", "/task", {"milestone_id": "not-a-uuid", "ddl": "2026-02-01", "name": "T"}),
+        ("put", "/task", {"task_id": "not-a-uuid", "changed_name": "T", "changed_ddl": "2026-02-01"}),
+    ]
+    for method, path, body in requests:
+        response = getattr(client, method)(path, json=body, headers=headers)
+        assert response.status_code == 422, path
+
+
+def project_version(db, project_id):
+    # 版本號由 API 遞增，每次都重新讀取
+    return db.get(Project, uuid.UUID(project_id), populate_existing=True).version
+
+
+def test_update_project_checks_expected_version(client, auth_headers, db_session):
+    headers = auth_headers("cas@example.com")
+    project_id, _, _ = create_project(db_session, "cas@example.com")
+    version = client.get("/project_detail", params={"project_id": project_id}, headers=headers).json()["version"]
+    payload = {
+        "project_id": project_id,
+        "changed_project_summary": "Updated",
+        "changed_name": "Renamed",
+        "changed_project_start_time": "2026-01-01T00:00:00",
+        "changed_project_end_time": "2026-03-01T00:00:00",
+    }
+
+    response = client.put("/project_detail", json={**payload, "expected_version": version}, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["version"] == version + 1
+
+    # 用舊的版本號寫入會被拒絕，內容不變
+    response = client.put("/project_detail", json={**payload, "changed_name": "Stale", "expected_version": version}, headers=headers)
+    assert response.status_code == 409
+    assert response.json()["detail"]["current_version"] == version + 1
+    detail = client.get("/project_detail", params={"project_id": project_id}, headers=headers).json()
+    assert detail["project_name"] == "Renamed"
+    assert detail["version"] == version + 1
+
+
+def create_schedule(db, email):
+    user = db.query(User).filter_by(email=email).one()
+    project = Project(name="Schedule", start_time=datetime(2026, 1, 1), user_id=user.id)
+    milestone = Milestone(name="M1", summary="", start_time=datetime(2026, 1, 1), end_time=datetime(2026, 2, 15), project=project)
+    first = Task(title="A", due_date=date(2026, 2, 1), estimated_loading=Decimal("2"), is_completed=False)
+    second = Task(title="B", due_date=date(2026, 2, 5), estimated_loading=Decimal("3"), is_completed=False)
+    milestone.tasks.extend([first, second])
+    db.add(project)
+    db.commit()
+    return str(project.id), str(milestone.id), str(first.id), str(second.id)
+
+
+def fake_reschedule(milestone_id, first_id, second_id, concurrent_write=None):
+    def reschedule(project_data, updated_task):
+        if concurrent_write:
+            concurrent_write()
+        return {"projects": [{"milestones": [{
+            "id": milestone_id,
+            "start_time": "2026-01-01T00:00:00",
+            "end_time": "2026-02-20T00:00:00",
+            "tasks": [
+                {"id": first_id, "title": updated_task.title, "due_date": "2026-02-04", "estimated_loading": 2},
+                {"id": second_id, "title": "B", "due_date": "2026-02-10", "estimated_loading": 4, "is_completed": True},
+            ],
+        }]}]}
+    return reschedule
+
+
+def test_reschedule_conflict_reapplies_without_llm(client, monkeypatch, auth_headers, db_session):
+    headers = auth_headers("reschedule@example.com")
+    project_id, milestone_id, first_id, second_id = create_schedule(db_session, "reschedule@example.com")
+    base_version = project_version(db_session, project_id)
+
+    def toggle_meanwhile():
+        # LLM 執行期間，另一個請求勾選並改了 B 的日期
+        assert client.put(f"/tasks/{second_id}", json={"due_date": "2026-02-07"}, headers=headers).status_code == 200
+        assert client.patch(f"/tasks/{second_id}", json={"isCompleted": True}, headers=headers).status_code == 200
+
+    monkeypatch.setattr(crud_project, "update_project_task", fake_reschedule(milestone_id, first_id, second_id, toggle_meanwhile))
+    payload = {"task_id": first_id, "changed_name": "A2", "changed_ddl": "2026-02-03"}
+    response = client.put("/task", json=payload, headers=headers)
+    assert response.status_code == 409
+    detail = response.json()["detail"]
+    assert detail["current_version"] == base_version + 2
+    token = detail["reschedule_token"]
+
+    def no_llm(*args, **kwargs):
+        raise AssertionError("LLM called while re-applying a reschedule")
+
+    monkeypatch.setattr(crud_project, "update_project_task", no_llm)
+    stale = client.put("/task", json={**payload, "reschedule_token": token, "expected_version": base_version}, headers=headers)
+    assert stale.status_code == 409
+
+    response = client.put("/task", json={**payload, "reschedule_token": token, "expected_version": base_version + 2}, headers=headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["version"] == base_version + 3
+    assert body["updated_fields"]["changed_name"] == "A2"
+    # 使用者指定的日期優先於 LLM 的結果
+    assert body["updated_fields"]["changed_ddl"] == "2026-02-03"
+    # B 的日期在這段期間被改過，保留新的值並回報衝突；工作量照樣套用
+    assert body["conflicts"] == [f"task:{second_id}:due_date"]
+
+    second = db_session.get(Task, uuid.UUID(second_id), populate_existing=True)
+    assert second.due_date == date(2026, 2, 7)
+    assert second.is_completed is True
+    assert float(second.estimated_loading) == 4.0
+    milestone = db_session.get(Milestone, uuid.UUID(milestone_id), populate_existing=True)
+    assert milestone.end_time == datetime(2026, 2, 20)
+    assert float(milestone.estimated_loading) == 6.0
+
+    # 已經套用過的 token 不能再用在其他任務上
+    response = client.put("/task", json={**payload, "task_id": second_id, "reschedule_token": token}, headers=headers)
+    assert response.status_code == 400
+
+
+def test_create_task_applies_reschedule(client, monkeypatch, auth_headers, db_session):
+    headers = auth_headers("create-task@example.com")
+    project_id, milestone_id, first_id, second_id = create_schedule(db_session, "create-task@example.com")
+    base_version = project_version(db_session, project_id)
+
+    def reschedule(project_data, payload, new_task_id):
+        update = fake_reschedule(milestone_id, first_id, second_id)(project_data, SimpleNamespace(title="A"))
+        update["projects"][0]["milestones"][0]["tasks"].append(
+            {"id": new_task_id, "title": payload.name, "due_date": "2026-02-12", "estimated_loading": 5}
+        )
+        return update
+
+    monkeypatch.setattr(crud_project, "reschedule_project", reschedule)
+    response = client.post("/task", json={
+        "milestone_id": milestone_id, "ddl": "2026-02-14", "name": "C", "expected_version": base_version
+    }, headers=headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["version"] == base_version + 1
+    assert body["conflicts"] == []
+    assert body["task"]["ddl"] == "2026-02-12"
+    assert body["task"]["estimated_loading"] == 5.0
+
+    detail = client.get("/milestone_detail", params={"project_id": project_id, "milestone_id": milestone_id}, headers=headers).json()
+    assert sorted(t["task_name"] for t in detail["tasks"]) == ["A", "B", "C"]
+    assert detail["milestone_estimated_loading"] == 11.0
+
+
+@contextmanager
+def count_statements(db, ignore="FROM users"):
+    """Collect the SQL statements run while the block runs, skipping the auth lookup of the current user."""
+    engine = db.get_bind()
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if ignore not in statement:
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+
+def create_tree(db, email, milestones, tasks):
+    user = db.query(User).filter_by(email=email).one()
+    project = Project(name=f"Tree {milestones}", start_time=datetime(2026, 1, 1), estimated_loading=Decimal("0"), user_id=user.id)
+    for m in range(milestones):
+        milestone = Milestone(name=f"M{m}", summary="", start_time=datetime(2026, 1, 1 + m), end_time=datetime(2026, 2, 1), project=project)
+        for t in range(tasks):
+            milestone.tasks.append(Task(
+                title=f"T{t}", due_date=date(2026, 1, 10 + t), estimated_loading=Decimal("1"), is_completed=t == 0,
+            ))
+    db.add(project)
+    db.commit()
+    return str(project.id)
+
+
+def test_project_tree_uses_constant_queries(client, auth_headers, db_session):
+    headers = auth_headers("tree@example.com")
+    small = create_tree(db_session, "tree@example.com", 1, 2)
+    large = create_tree(db_session, "tree@example.com", 6, 8)
+
+    counts = []
+    for project_id in (small, large):
+        with count_statements(db_session) as statements:
+            response = client.get("/project_tree", params={"project_id": project_id}, headers=headers)
+        assert response.status_code == 200
+        counts.append(len(statements))
+    # 版本號、專案、里程碑、任務各一個 query，與樹的大小無關
+    assert counts == [4, 4]
+
+    tree = response.json()
+    assert [m["milestone_name"] for m in tree["milestones"]] == [f"M{m}" for m in range(6)]
+    assert all(len(m["tasks"]) == 8 for m in tree["milestones"])
+    assert tree["milestones"][0]["progress"] == 0.125
+    assert tree["progress"] == 0.125
+
+    with count_statements(db_session) as statements:
+        response = client.get("/project_tree", params={"project_id": large, "exclude_completed": True}, headers=headers)
+    assert len(statements) == 5
+    open_tree = response.json()
+    assert all(len(m["tasks"]) == 7 for m in open_tree["milestones"])
+    assert not any(t["isCompleted"] for m in open_tree["milestones"] for t in m["tasks"])
+    # 排除已完成任務不影響進度
+    assert open_tree["progress"] == tree["progress"]
+    assert response.headers["ETag"] != client.get("/project_tree", params={"project_id": large}, headers=headers).headers["ETag"]
+
+    other = auth_headers("tree-other@example.com")
+    assert client.get("/project_tree", params={"project_id": large}, headers=other).status_code == 404
+
+
+def test_sparse_fields_limit_columns_and_output(client, auth_headers, db_session):
+    headers = auth_headers("sparse@example.com")
+    project_id = create_tree(db_session, "sparse@example.com", 2, 3)
+    tree = client.get("/project_tree", params={"project_id": project_id}, headers=headers).json()
+    milestone_id = tree["milestones"][0]["milestone_id"]
+
+    params = {"project_id": project_id, "milestone_id": milestone_id, "fields": "milestone_name,tasks.task_name,tasks.isCompleted"}
+    with count_statements(db_session) as statements:
+        response = client.get("/milestone_detail", params=params, headers=headers)
+    assert response.status_code == 200
+    assert response.json() == {
+        "milestone_name": "M0",
+        "tasks": [{"task_name": f"T{t}", "isCompleted": t == 0} for t in range(3)],
+    }
+    # 沒選到的長文字欄位不會出現在 SQL 裡
+    assert not any("description" in statement or "summary" in statement for statement in statements)
+
+    etag = response.headers["ETag"]
+    assert etag != client.get("/milestone_detail", params={**params, "fields": None}, headers=headers).headers["ETag"]
+    assert client.get("/milestone_detail", params=params, headers={**headers, "If-None-Match": etag}).status_code == 304
+
+    with count_statements(db_session) as statements:
+        response = client.get("/project_tree", params={
+            "project_id": project_id, "fields": "project_name,progress,milestones.milestone_name,milestones.progress"
+        }, headers=headers)
+    assert response.json() == {
+        "project_name": "Tree 2",
+        "progress": 1 / 3,
+        "milestones": [{"milestone_name": f"M{m}", "progress": 1 / 3} for m in range(2)],
+    }
+    # 不載入任務，進度改用 group by 查詢：版本號、專案、里程碑、進度各一個
+    assert len(statements) == 4
+    assert not any("FROM tasks" in statement and "sum(" not in statement for statement in statements)
+
+    projects = client.get("/projects", params={"fields": "project_name"}, headers=headers).json()
+    assert projects == [{"project_name": "Tree 2"}]
+
+    response = client.get("/project_detail", params={"project_id": project_id, "fields": "milestones.ddl,nope"}, headers=headers)
+    assert response.status_code == 400
+    response = client.get("/project_detail", params={"project_id": project_id, "fields": "milestones.ddl"}, headers=headers)
+    assert response.json() == {"milestones": [{"ddl": "2026-02-01T00:00:00"}] * 2}
+
+
+def test_project_reads_are_cached_until_a_write(client, monkeypatch, auth_headers, db_session):
+    headers = auth_headers("cache@example.com")
+    project_id, milestone_id, task_id = create_project(db_session, "cache@example.com")
+    other_headers = auth_headers("cache-other@example.com")
+    other_project, _, _ = create_project(db_session, "cache-other@example.com")
+    urls = [
+        ("/projects", {}, "projects"),
+        ("/project_detail", {"project_id": project_id}, "project_detail"),
+        ("/milestone_detail", {"project_id": project_id, "milestone_id": milestone_id}, "milestone_detail"),
+        ("/project_tree", {"project_id": project_id}, "project_tree"),
+    ]
+    first = [client.get(url, params=params, headers=headers) for url, params, _ in urls]
+    other = client.get("/project_detail", params={"project_id": other_project}, headers=other_headers)
+    before = {route: cache_hits(route) for _, _, route in urls}
+
+    with monkeypatch.context() as m:
+        no_tree_loads(m)
+        for (url, params, _), response in zip(urls, first):
+            cached = client.get(url, params=params, headers=headers)
+            assert cached.status_code == 200
+            assert cached.content == response.content
+            assert cached.headers["ETag"] == response.headers["ETag"]
+    for _, _, route in urls:
+        assert cache_hits(route) == before[route] + 1
+    invalidations = sample("response_cache_invalidations_total")
+
+    # 寫入 commit 後該使用者的快取被清掉，下一次讀到新的內容
+    assert client.patch(f"/tasks/{task_id}", json={"isCompleted": True}, headers=headers).status_code == 200
+    assert sample("response_cache_invalidations_total") > invalidations
+    detail = client.get("/milestone_detail", params=urls[2][1], headers=headers).json()
+    assert detail["tasks"][0]["isCompleted"] is True
+
+    # 其他使用者的快取不受影響
+    with monkeypatch.context() as m:
+        no_tree_loads(m)
+        response = client.get("/project_detail", params={"project_id": other_project}, headers=other_headers)
+        assert response.content == other.content
@@ -0,0 +1,128 @@
+import logging
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core.db import get_db
+from app.core.middleware import MetricsMiddleware
+from app.crud import crud_project
+from app.main import app
+from app.models import Milestone, Project, Task, User
+
+# 每個測試用小、大兩份資料各打一次 route，查詢數隨資料量成長（N+1）時超出預算就失敗
+
+
+def create_projects(db, email, projects, milestones, tasks):
+    user = db.query(User).filter_by(email=email).one()
+    ids = []
+    for p in range(projects):
+        project = Project(
+            name=f"P{p}", summary="", start_time=datetime(2026, 1, 1), end_time=datetime(2026, 3, 1),
+            due_date=datetime(2026, 3, 1), current_milestone="M0", estimated_loading=Decimal("0"), user_id=user.id,
+        )
+        for m in range(milestones):
+            milestone = Milestone(name=f"M{m}", summary="", start_time=datetime(2026, 1, 1), end_time=datetime(2026, 2, 1 + m), project=project)
+            for t in range(tasks):
+                milestone.tasks.append(Task(
+                    title=f"T{t}", due_date=date(2026, 1, 10), estimated_loading=Decimal("2"), is_completed=t == 0,
+                ))
+        db.add(project)
+        db.flush()
+        ids.append(str(project.id))
+    db.commit()
+    return ids
+
+
+def query_count(response):
+    assert response.status_code == 200
+    return int(response.headers["x-query-count"])
+
+
+@pytest.mark.query_budget(4, route="/projects")
+def test_projects_budget(client, auth_headers, db_session):
+    counts = []
+    for size in (1, 6):
+        email = f"budget-projects{size}@example.com"
+        headers = auth_headers(email)
+        create_projects(db_session, email, size, 3, 4)
+        response = client.get("/projects", headers=headers)
+        counts.append(query_count(response))
+        assert len(response.json()) == size
+        assert all(project["progress"] == 0.25 for project in response.json())
+    assert counts[0] == counts[1]
+
+
+@pytest.mark.query_budget(2, route="/tasks")
+def test_tasks_by_date_budget(client, auth_headers, db_session):
+    headers = auth_headers("budget-tasks@example.com")
+    create_projects(db_session, "budget-tasks@example.com", 1, 1, 1)
+    small = query_count(client.get("/tasks", params={"date": "2026-01-10"}, headers=headers))
+    create_projects(db_session, "budget-tasks@example.com", 4, 3, 5)
+    response = client.get("/tasks", params={"date": "2026-01-10"}, headers=headers)
+    assert len(response.json()) == 61
+    assert query_count(response) == small
+
+
+@pytest.mark.query_budget(5)
+def test_project_reads_budget(client, auth_headers, db_session):
+    headers = auth_headers("budget-reads@example.com")
+    small, large = create_projects(db_session, "budget-reads@example.com", 2, 1, 1)[0], create_projects(db_session, "budget-reads@example.com", 1, 8, 10)[0]
+    for route in ("/project_detail", "/project_tree"):
+        counts = [query_count(client.get(route, params={"project_id": project_id}, headers=headers)) for project_id in (small, large)]
+        assert counts[0] == counts[1], route
+
+
+def schedule(db, project_id):
+    milestone = db.query(Milestone).filter_by(project_id=uuid.UUID(project_id)).one()
+    return str(milestone.id), [str(task.id) for task in milestone.tasks]
+
+
+def shift_every_task(milestone_id, task_ids):
+    # 假的 LLM 結果：每個任務都改日期與工作量，套用時每一列都要更新
+    def reschedule(project_data, updated_task):
+        return {"milestones": [{
+            "id": milestone_id,
+            "end_time": "2026-02-20T00:00:00",
+            "tasks": [{"id": task_id, "due_date": "2026-01-20", "estimated_loading": 3} for task_id in task_ids],
+        }]}
+    return reschedule
+
+
+@pytest.mark.query_budget(10, route="/task")
+def test_reschedule_apply_budget(client, monkeypatch, auth_headers, db_session):
+    headers = auth_headers("budget-reschedule@example.com")
+    counts = []
+    for size in (2, 20):
+        project_id = create_projects(db_session, "budget-reschedule@example.com", 1, 1, size)[0]
+        milestone_id, task_ids = schedule(db_session, project_id)
+        monkeypatch.setattr(crud_project, "update_project_task", shift_every_task(milestone_id, task_ids))
+        payload = {"task_id": task_ids[0], "changed_name": "T0", "changed_ddl": "2026-01-20"}
+        response = client.put("/task", json=payload, headers=headers)
+        counts.append(query_count(response))
+        assert response.json()["conflicts"] == []
+    assert counts[0] == counts[1]
+
+
+def test_repeated_statements_are_logged(caplog):
+    # 迴圈內重複執行同一句 SQL 的 route，開發模式下會被記錄
+    loop_app = FastAPI()
+    loop_app.add_middleware(MetricsMiddleware, debug_queries=True, repeat_threshold=3)
+
+    @loop_app.get("/loop")
+    def loop(db: Session = Depends(get_db)):
+        for value in range(4):
+            db.execute(text("SELECT :value"), {"value": value})
+        return {"status": "ok"}
+
+    loop_app.dependency_overrides = app.dependency_overrides
+    with caplog.at_level(logging.WARNING, logger="app.queries"):
+        response = TestClient(loop_app).get("/loop")
+
+    assert response.headers["x-query-count"] == "4"
+    assert "GET /loop ran the same statement 4 times (possible N+1): SELECT ?" in caplog.text
@@ -0,0 +1,73 @@
+from app.services.response_cache import LRUCache, RedisCache, ResponseCache
+
+
+class FakeRedis:
+    """In-memory stand-in for the subset of the redis client used by RedisCache."""
+
+    def __init__(self):
+        self.hashes = {}
+        self.ttls = {}
+
+    def hget(self, name, key):
+        return self.hashes.get(name, {}).get(key)
+
+    def hset(self, name, key, value):
+        self.hashes.setdefault(name, {})[key] = value
+
+    def expire(self, name, seconds):
+        self.ttls[name] = seconds
+
+    def delete(self, name):
+        self.hashes.pop(name, None)
+
+
+class BrokenRedis(FakeRedis):
+    def hget(self, name, key):
+        raise ConnectionError("redis is down")
+
+
+def test_lru_evicts_by_size_and_invalidates_per_user():
+    cache = LRUCache(max_bytes=10)
+    cache.set("alice", "a", b"1234")
+    cache.set("bob", "b", b"1234")
+    assert cache.get("alice", "a") == b"1234"
+    # bob 的 b 最久沒被讀取，超過大小時先淘汰
+    cache.set("alice", "c", b"1234")
+    assert cache.get("bob", "b") is None
+    assert cache.size == 8
+
+    cache.set("bob", "b", b"12")
+    cache.invalidate("alice")
+    assert cache.get("alice", "a") is None and cache.get("alice", "c") is None
+    assert cache.get("bob", "b") == b"12"
+    assert cache.size == 2
+
+    # 超過上限的單一內容不放進快取
+    cache.set("bob", "big", b"x" * 11)
+    assert cache.get("bob", "big") is None
+
+
+def test_redis_backend_with_stand_in():
+    client = FakeRedis()
+    cache = ResponseCache(RedisCache(client=client, ttl=60, prefix="test:"))
+    assert cache.get("project_detail", "alice", '"project-1-v1"') is None
+    cache.set("alice", '"project-1-v1"', b"{}")
+    cache.set("bob", '"project-2-v1"', b"[]")
+    assert cache.get("project_detail", "alice", '"project-1-v1"') == b"{}"
+    assert client.ttls["test:alice"] == 60
+
+    cache.invalidate("alice")
+    assert "test:alice" not in client.hashes
+    assert cache.get("project_detail", "bob", '"project-2-v1"') == b"[]"
+
+    stats = cache.stats()
+    assert stats["backend"] == "redis"
+    assert stats["routes"]["project_detail"] == {"hits": 2, "misses": 1, "hit_rate": 2 / 3}
+    assert stats["invalidations"] == 1
+
+
+def test_unavailable_network_cache_is_a_miss():
+    cache = ResponseCache(RedisCache(client=BrokenRedis()))
+    assert cache.get("projects", "alice", "key") is None
+    assert cache.stats()["errors"] == 1
+    assert cache.stats()["misses"] == 1
@@ -0,0 +1,123 @@
+import io
+
+import pytest
+
+from app.services import file_storage, storage
+
+
+class NotFound(Exception):
+    def __init__(self):
+        self.response = {"Error": {"Code": "404"}}
+
+
+class FakeS3Client:
+    """In-memory stand-in for the subset of the boto3 S3 client used by S3Storage."""
+
+    def __init__(self):
+        self.objects = {}
+        self.gets = 0
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise NotFound()
+        return {"ContentLength": len(self.objects[(Bucket, Key)])}
+
+    def upload_file(self, Filename, Bucket, Key):
+        with open(Filename, "rb") as f:
+            self.objects[(Bucket, Key)] = f.read()
+
+    def get_object(self, Bucket, Key, Range=None):
+        self.gets += 1
+        if (Bucket, Key) not in self.objects:
+            raise NotFound()
+        data = self.objects[(Bucket, Key)]
+        if Range:
+            start, end = Range.removeprefix("bytes=").split("-")
+            data = data[int(start):int(end) + 1 if end else None]
+        return {"Body": io.BytesIO(data)}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+
+@pytest.fixture
+def s3(tmp_path):
+    client = FakeS3Client()
+    backend = storage.S3Storage("bucket", "uploads/", client=client, staging_dir=str(tmp_path / "staging"))
+    return client, backend
+
+
+def write(path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_s3_storage_streams_ranges(tmp_path, s3):
+    client, backend = s3
+    source = write(tmp_path / "staging" / "incoming", b"0123456789")
+    backend.put_file("ab/abc", source)
+
+    assert client.objects[("bucket", "uploads/ab/abc")] == b"0123456789"
+    assert backend.exists("ab/abc") and not backend.exists("ab/missing")
+    assert backend.size("ab/abc") == 10
+    assert b"".join(backend.open("ab/abc", 2, 5)) == b"234"
+    assert backend.local_path("ab/abc") is None
+
+    backend.delete("ab/abc")
+    assert not backend.exists("ab/abc")
+
+
+def test_read_through_cache_downloads_once_and_evicts(tmp_path, s3):
+    client, backend = s3
+    cache = storage.ReadThroughCache(backend, str(tmp_path / "cache"), max_bytes=15)
+    client.objects[("bucket", "uploads/aa/one")] = b"1" * 10
+    client.objects[("bucket", "uploads/bb/two")] = b"2" * 10
+
+    path = cache.local_path("aa/one")
+    assert open(path, "rb").read() == b"1" * 10
+    assert cache.local_path("aa/one") == path
+    assert client.gets == 1
+
+    # 超過上限時淘汰最久沒用的副本，剛下載的保留
+    cache.local_path("bb/two")
+    assert not (tmp_path / "cache" / "aa" / "one").exists()
+    assert (tmp_path / "cache" / "bb" / "two").exists()
+
+    cache.delete("bb/two")
+    assert not (tmp_path / "cache" / "bb" / "two").exists()
+    assert ("bucket", "uploads/bb/two") not in client.objects
+
+
+def test_blob_checkout_from_remote_storage(tmp_path, s3, monkeypatch):
+    client, backend = s3
+    monkeypatch.setattr(storage, "_storage", backend)
+    incoming = write(tmp_path / "staging" / ".incoming-1", b"%PDF-remote")
+    file_storage.commit_blob(incoming, "ab" * 32)
+    # 內容相同時不會重複上傳
+    duplicate = write(tmp_path / "staging" / ".incoming-2", b"%PDF-remote")
+    file_storage.commit_blob(duplicate, "ab" * 32)
+    assert len(client.objects) == 1
+
+    with file_storage.local_blob("ab" * 32) as path:
+        assert open(path, "rb").read() == b"%PDF-remote"
+    # 沒有快取時取回的暫存檔用完即刪
+    assert list((tmp_path / "staging").iterdir()) == []
+
+
+def test_incomplete_backend_fails_on_creation():
+    class NoDelete(storage.StorageBackend):
+        def exists(self, key):
+            return False
+
+        def size(self, key):
+            return 0
+
+        def put_file(self, key, path):
+            pass
+
+        def open(self, key, start=0, end=None):
+            yield b""
+
+    with pytest.raises(TypeError):
+        NoDelete()
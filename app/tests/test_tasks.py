@@ -0,0 +1,146 @@
+import uuid
+from contextlib import contextmanager
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import event
+
+from app.models import Milestone, Project, Task, User
+
+
+@contextmanager
+def count_statements(db, ignore="FROM users"):
+    """Collect the SQL statements run while the block runs, skipping the auth lookup of the current user."""
+    engine = db.get_bind()
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if ignore not in statement:
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+
+def create_tasks(db, email, count, due_date):
+    user = db.query(User).filter_by(email=email).one()
+    project = Project(name=f"Project {count}", start_time=datetime(2026, 1, 1), user_id=user.id)
+    milestone = Milestone(name="M1", start_time=datetime(2026, 1, 1), project=project)
+    for i in range(count):
+        estimated = None if i == 0 else Decimal("1.5")
+        milestone.tasks.append(Task(title=f"Task {i}", due_date=due_date, estimated_loading=estimated))
+    db.add(project)
+    db.commit()
+    return str(project.id)
+
+
+@pytest.mark.parametrize("count", [1, 5])
+def test_tasks_by_date_uses_one_query(client, count, auth_headers, db_session):
+    email = f"tasks{count}@example.com"
+    headers = auth_headers(email)
+    project_id = create_tasks(db_session, email, count, date(2026, 3, 1))
+
+    with count_statements(db_session) as statements:
+        response = client.get("/tasks", params={"date": "2026-03-01"}, headers=headers)
+
+    assert response.status_code == 200
+    assert len(statements) == 1
+    tasks = sorted(response.json(), key=lambda t: t["task_title"])
+    assert len(tasks) == count
+    assert tasks[0]["estimated_loading"] == 0.0
+    assert all(t["project_id"] == project_id and t["project_name"] == f"Project {count}" for t in tasks)
+    assert all(t["isCompleted"] is False for t in tasks)
+
+
+def task_ids(db, project_id):
+    rows = (
+        db.query(Task.id)
+        .join(Milestone, Task.milestone_id == Milestone.id)
+        .filter(Milestone.project_id == uuid.UUID(project_id))
+        .order_by(Task.title)
+        .all()
+    )
+    return [str(row.id) for row in rows]
+
+
+def test_batch_update_tasks(client, auth_headers, db_session):
+    headers = auth_headers("batch@example.com")
+    project_id = create_tasks(db_session, "batch@example.com", 4, date(2026, 4, 1))
+    ids = task_ids(db_session, project_id)
+    auth_headers("batch-other@example.com")
+    foreign_id = task_ids(db_session, create_tasks(db_session, "batch-other@example.com", 1, date(2026, 4, 1)))[0]
+
+    with count_statements(db_session) as statements:
+        response = client.patch("/tasks", json={"tasks": [
+            {"task_id": ids[1], "isCompleted": True},
+            {"task_id": ids[2], "isCompleted": True, "title": "Renamed", "due_date": "2026-04-02"},
+            {"task_id": ids[3], "estimated_loading": 3},
+            {"task_id": foreign_id, "isCompleted": True},
+            {"task_id": ids[0]},
+        ]}, headers=headers)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [r["status"] for r in body["results"]] == ["updated", "updated", "updated", "not_found", "unchanged"]
+    assert body["results"][1]["updated_fields"] == ["isCompleted", "title", "due_date"]
+    # 權限查詢、bulk UPDATE、milestone 與專案工作量、專案版本號、進度統計各一次，與任務數量無關
+    assert len([s for s in statements if s.lstrip().upper().startswith(("SELECT", "UPDATE"))]) == 6
+    # 1.5 + 1.5 完成 / (0 + 1.5 + 1.5 + 3)
+    assert body["projects"] == [{"project_id": project_id, "progress": 0.5}]
+
+    # 讀到 API 寫入後的值，而不是 session 裡已載入的舊值
+    db_session.expire_all()
+    tasks = {str(t.id): t for t in db_session.query(Task).filter(Task.id.in_([uuid.UUID(i) for i in ids + [foreign_id]]))}
+    assert tasks[ids[2]].title == "Renamed" and tasks[ids[2]].due_date == date(2026, 4, 2)
+    assert float(tasks[ids[3]].estimated_loading) == 3.0
+    assert tasks[ids[0]].is_completed is False
+    assert tasks[foreign_id].is_completed is False
+    project = db_session.get(Project, uuid.UUID(project_id))
+    assert float(project.milestones[0].estimated_loading) == 6.0
+    assert float(project.estimated_loading) == 6.0
+
+
+def test_batch_update_validates_fields(client, auth_headers):
+    headers = auth_headers("batch-invalid@example.com")
+    response = client.patch("/tasks", json={"tasks": [
+        {"task_id": str(uuid.uuid4()), "estimated_loading": -1}
+    ]}, headers=headers)
+    assert response.status_code == 422
+
+
+def test_workload_sums_incomplete_tasks_and_caches(client, auth_headers, db_session):
+    headers = auth_headers("workload@example.com")
+    # 第一個專案：3/1 三個任務（0 + 1.5 + 1.5），第二個專案：3/1 與 3/3
+    first = task_ids(db_session, create_tasks(db_session, "workload@example.com", 3, date(2026, 3, 1)))
+    create_tasks(db_session, "workload@example.com", 2, date(2026, 3, 3))
+    create_tasks(db_session, "workload@example.com", 7, date(2026, 3, 1))
+    params = {"start_date": "2026-03-01", "end_date": "2026-03-03", "capacity": 10}
+
+    with count_statements(db_session) as statements:
+        response = client.get("/workload", params=params, headers=headers)
+    assert response.status_code == 200
+    assert len(statements) == 1
+    body = response.json()
+    assert [(d["date"], d["estimated_loading"], d["task_count"]) for d in body["days"]] == [
+        ("2026-03-01", 12.0, 10), ("2026-03-02", 0.0, 0), ("2026-03-03", 1.5, 2),
+    ]
+    assert body["overloaded_days"] == ["2026-03-01"]
+
+    # 快取命中時不查資料庫，不同的 capacity 共用同一份加總
+    with count_statements(db_session) as statements:
+        response = client.get("/workload", params={**params, "capacity": 20}, headers=headers)
+    assert statements == []
+    assert response.json()["overloaded_days"] == []
+
+    # 完成任務後快取失效
+    assert client.patch(f"/tasks/{first[1]}", json={"isCompleted": True}, headers=headers).status_code == 200
+    response = client.get("/workload", params=params, headers=headers)
+    assert response.json()["days"][0]["estimated_loading"] == 10.5
+    assert response.json()["days"][0]["task_count"] == 9
+
+    response = client.get("/workload", params={"start_date": "2026-03-03", "end_date": "2026-03-01"}, headers=headers)
+    assert response.status_code == 400
@@ -0,0 +1,285 @@
+import hashlib
+import uuid
+from datetime import datetime
+
+import pytest
+from sqlalchemy.orm import Session
+
+from app.api.routes import file as file_routes
+from app.core.middleware import RequestSizeLimitMiddleware
+from app.crud.crud_file import delete_unreferenced_blobs, release_blobs, reserve_blob
+from app.crud.crud_project import delete_project_in_db
+from app.main import app
+from app.models import Project, User
+from app.services import file_storage, storage, upload_sessions
+
+
+def create_project(db, email):
+    user = db.query(User).filter_by(email=email).one()
+    project = Project(name="Blob Project", start_time=datetime(2026, 1, 1), user_id=user.id)
+    db.add(project)
+    db.commit()
+    return str(project.id)
+
+
+def stored_files(upload_dir):
+    return sorted(p.name for p in upload_dir.rglob("*") if p.is_file())
+
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "_storage", storage.LocalStorage(str(tmp_path)))
+    # 用小區塊確保多次讀寫的路徑也有被測到
+    monkeypatch.setattr(file_storage, "UPLOAD_CHUNK_SIZE", 4)
+    monkeypatch.setattr(upload_sessions, "UPLOAD_SESSION_DIR", str(tmp_path / ".sessions"))
+    return tmp_path
+
+
+def test_upload_streams_file_and_returns_hash(client, upload_dir, auth_headers):
+    headers = auth_headers("stream@example.com")
+    content = b"0123456789" * 5
+    sha256 = hashlib.sha256(content).hexdigest()
+    response = client.post(
+        "/upload",
+        files=[("files", ("../notes.txt", content, "text/plain"))],
+        headers=headers,
+    )
+    assert response.status_code == 200
+    saved = response.json()["files"][0]
+    assert saved["file_name"] == "notes.txt"
+    assert saved["size"] == len(content)
+    assert saved["sha256"] == sha256
+    assert saved["file_url"].endswith(f"/uploads/{sha256}/notes.txt")
+    assert (upload_dir / sha256[:2] / sha256).read_bytes() == content
+    assert stored_files(upload_dir) == [sha256]
+
+
+def test_identical_uploads_share_one_blob(client, upload_dir, auth_headers):
+    content = b"same contents"
+    sha256 = hashlib.sha256(content).hexdigest()
+    for email in ["first@example.com", "second@example.com"]:
+        response = client.post(
+            "/upload",
+            files=[("files", ("example.pdf", content, "application/pdf"))],
+            headers=auth_headers(email),
+        )
+        assert response.json()["files"][0]["sha256"] == sha256
+    assert stored_files(upload_dir) == [sha256]
+
+
+def test_project_delete_keeps_shared_blobs(client, upload_dir, auth_headers, db_session):
+    headers = auth_headers("refcount@example.com")
+    project_id = create_project(db_session, "refcount@example.com")
+
+    shared, private = b"shared blob", b"project only"
+    client.post("/upload", files=[("files", ("a.txt", shared, "text/plain"))], headers=headers)
+    client.post(
+        "/upload",
+        files=[("files", ("a.txt", shared, "text/plain")), ("files", ("b.txt", private, "text/plain"))],
+        data={"projectId": project_id},
+        headers=headers,
+    )
+    assert len(stored_files(upload_dir)) == 2
+
+    assert client.delete("/project", params={"project_id": project_id}, headers=headers).status_code == 200
+    # 仍被未關聯專案的紀錄引用的 blob 要保留
+    assert stored_files(upload_dir) == [hashlib.sha256(shared).hexdigest()]
+
+
+def test_upload_racing_project_delete_keeps_blob(client, upload_dir, monkeypatch, auth_headers, db_session):
+    headers = auth_headers("race-owner@example.com")
+    project_id = create_project(db_session, "race-owner@example.com")
+    content = b"shared while uploading"
+    sha256 = hashlib.sha256(content).hexdigest()
+    client.post("/upload", files=[("files", ("a.txt", content, "text/plain"))], data={"projectId": project_id}, headers=headers)
+
+    register_files = file_routes.register_files
+
+    def delete_then_register(db, *args):
+        # 新的上傳已沿用既有的 blob、但 Files 紀錄還沒寫入時，專案被刪除
+        user = db_session.query(User).filter_by(email="race-owner@example.com").one()
+        delete_project_in_db(db_session, user.id, uuid.UUID(project_id))
+        return register_files(db, *args)
+
+    monkeypatch.setattr(file_routes, "register_files", delete_then_register)
+    uploader = auth_headers("race-uploader@example.com")
+    response = client.post("/upload", files=[("files", ("b.txt", content, "text/plain"))], headers=uploader)
+    assert response.status_code == 200
+
+    assert stored_files(upload_dir) == [sha256]
+    download = client.get(f"/uploads/{sha256}/b.txt", headers=uploader)
+    assert download.status_code == 200
+    assert download.content == content
+
+
+def test_blob_reserved_by_another_instance_is_kept(client, upload_dir, db_session):
+    content = b"reserved elsewhere"
+    sha256 = hashlib.sha256(content).hexdigest()
+    incoming = upload_dir / "incoming"
+    incoming.write_bytes(content)
+    # 兩個 session 代表兩個 instance：保留紀錄在資料庫，不在 process 裡
+    instance_a = db_session
+    instance_b = Session(bind=db_session.get_bind())
+    try:
+        reserve_blob(instance_b, sha256)
+        file_storage.commit_blob(str(incoming), sha256)
+        assert delete_unreferenced_blobs(instance_a, [sha256]) == []
+        assert stored_files(upload_dir) == [sha256]
+
+        release_blobs(instance_b, [sha256])
+        assert delete_unreferenced_blobs(instance_a, [sha256]) == [sha256]
+        assert stored_files(upload_dir) == []
+    finally:
+        instance_b.close()
+
+
+def test_upload_rejects_oversized_file(client, upload_dir, monkeypatch, auth_headers):
+    monkeypatch.setattr(file_routes, "MAX_UPLOAD_FILE_BYTES", 16)
+    headers = auth_headers("big@example.com")
+    response = client.post(
+        "/upload",
+        files=[("files", ("small.txt", b"ok", "text/plain")), ("files", ("big.txt", b"x" * 17, "text/plain"))],
+        headers=headers,
+    )
+    assert response.status_code == 413
+    # 同一個請求裡已寫入的檔案與暫存檔都會被清掉
+    assert stored_files(upload_dir) == []
+
+
+def test_upload_rejects_oversized_request(client, upload_dir, monkeypatch, auth_headers):
+    monkeypatch.setattr(file_routes, "MAX_UPLOAD_REQUEST_BYTES", 20)
+    headers = auth_headers("total@example.com")
+    response = client.post(
+        "/upload",
+        files=[("files", ("a.txt", b"a" * 12, "text/plain")), ("files", ("b.txt", b"b" * 12, "text/plain"))],
+        headers=headers,
+    )
+    assert response.status_code == 413
+    assert stored_files(upload_dir) == []
+
+
+def test_chunked_upload_over_request_limit_is_413(client, upload_dir, monkeypatch, auth_headers):
+    headers = auth_headers("chunked@example.com")
+    client.get("/metrics")  # 第一個請求之後 middleware stack 才會建立
+    limiter = app.middleware_stack
+    while not isinstance(limiter, RequestSizeLimitMiddleware):
+        limiter = limiter.app
+    monkeypatch.setattr(limiter, "max_bytes", 64)
+
+    boundary = "chunked-boundary"
+
+    def body():
+        # 以 generator 送出：Transfer-Encoding: chunked，沒有 Content-Length
+        yield (
+            f"--{boundary}\r\n"
+            'Content-Disposition: form-data; name="files"; filename="big.txt"\r\n'
+            "Content-Type: text/plain\r\n\r\n"
+        ).encode()
+        for _ in range(8):
+            yield b"x" * 32
+        yield f"\r\n--{boundary}--\r\n".encode()
+
+    response = client.post(
+        "/upload",
+        content=body(),
+        headers={**headers, "Content-Type": f"multipart/form-data; boundary={boundary}"},
+    )
+    assert response.status_code == 413
+    assert stored_files(upload_dir) == []
+
+
+def test_download_supports_etag_and_range(client, upload_dir, auth_headers):
+    headers = auth_headers("download@example.com")
+    content = b"%PDF-" + bytes(range(256)) * 4
+    url = client.post(
+        "/upload",
+        files=[("files", ("doc.pdf", content, "application/pdf"))],
+        headers=headers,
+    ).json()["files"][0]["file_url"]
+    path = url[url.index("/uploads/"):]
+
+    response = client.get(path, headers=headers)
+    assert response.status_code == 200
+    assert response.content == content
+    assert response.headers["content-type"] == "application/pdf"
+    etag = response.headers["etag"]
+    assert etag == f'"{hashlib.sha256(content).hexdigest()}"'
+    assert "immutable" in response.headers["cache-control"]
+
+    response = client.get(path, headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    response = client.get(path, headers={**headers, "Range": "bytes=5-14", "If-Range": etag})
+    assert response.status_code == 206
+    assert response.content == content[5:15]
+    assert response.headers["content-range"] == f"bytes 5-14/{len(content)}"
+
+
+def test_download_requires_access(client, upload_dir, auth_headers):
+    owner = auth_headers("blobowner@example.com")
+    other = auth_headers("stranger@example.com")
+    url = client.post(
+        "/upload",
+        files=[("files", ("private.txt", b"private contents", "text/plain"))],
+        headers=owner,
+    ).json()["files"][0]["file_url"]
+    path = url[url.index("/uploads/"):]
+
+    assert client.get(path, headers=other).status_code == 404
+    assert client.get(path).status_code in (401, 403)
+
+
+def test_resumable_upload_out_of_order_with_retry(client, upload_dir, auth_headers):
+    headers = auth_headers("resume@example.com")
+    content = bytes(range(256)) * 10 + b"tail"
+    session = client.post("/upload/sessions", json={
+        "file_name": "big.pdf",
+        "size": len(content),
+        "chunk_size": 1000
+    }, headers=headers).json()
+    upload_id = session["upload_id"]
+    assert session["total_chunks"] == 3
+    assert session["missing_chunks"] == [0, 1, 2]
+
+    chunks = [content[i:i + 1000] for i in range(0, len(content), 1000)]
+    assert client.put(f"/upload/sessions/{upload_id}/chunks/2", content=chunks[2], headers=headers).status_code == 200
+    # 長度不對的 chunk 不會被當成已收到
+    assert client.put(f"/upload/sessions/{upload_id}/chunks/0", content=chunks[0][:10], headers=headers).status_code == 400
+    assert client.put(f"/upload/sessions/{upload_id}/chunks/0", content=chunks[0], headers=headers).status_code == 200
+
+    status = client.get(f"/upload/sessions/{upload_id}", headers=headers).json()
+    assert status["received_ranges"] == [[0, 1000], [2000, len(content)]]
+    assert status["missing_chunks"] == [1]
+
+    sha256 = hashlib.sha256(content).hexdigest()
+    response = client.post(f"/upload/sessions/{upload_id}/complete", json={"sha256": sha256}, headers=headers)
+    assert response.status_code == 409
+
+    client.put(f"/upload/sessions/{upload_id}/chunks/1", content=chunks[1], headers=headers)
+    response = client.post(f"/upload/sessions/{upload_id}/complete", json={"sha256": sha256}, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["file"]["sha256"] == sha256
+    assert (upload_dir / sha256[:2] / sha256).read_bytes() == content
+    assert not (upload_dir / ".sessions" / upload_id).exists()
+
+
+def test_resumable_upload_rejects_hash_mismatch(client, upload_dir, auth_headers):
+    headers = auth_headers("mismatch@example.com")
+    upload_id = client.post("/upload/sessions", json={"file_name": "a.txt", "size": 5}, headers=headers).json()["upload_id"]
+    client.put(f"/upload/sessions/{upload_id}/chunks/0", content=b"hello", headers=headers)
+
+    response = client.post(f"/upload/sessions/{upload_id}/complete", json={"sha256": "0" * 64}, headers=headers)
+    assert response.status_code == 400
+    assert stored_files(upload_dir) == ["0.chunk", "session.json"]
+
+    other = auth_headers("intruder@example.com")
+    assert client.get(f"/upload/sessions/{upload_id}", headers=other).status_code == 404
+
+
+def test_abandoned_sessions_are_collected(client, upload_dir, auth_headers):
+    headers = auth_headers("abandon@example.com")
+    upload_id = client.post("/upload/sessions", json={"file_name": "a.txt", "size": 5}, headers=headers).json()["upload_id"]
+    assert upload_sessions.collect_abandoned_sessions(max_age=3600) == 0
+    assert upload_sessions.collect_abandoned_sessions(max_age=-1) == 1
+    assert client.get(f"/upload/sessions/{upload_id}", headers=headers).status_code == 404
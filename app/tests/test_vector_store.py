@@ -0,0 +1,107 @@
+import os
+import threading
+import uuid
+
+import faiss
+import numpy as np
+import pytest
+
+from app.services import vector_store
+
+DIM = 16
+VOCABULARY = ["資料庫", "前端", "報告", "測試", "部署", "會議"]
+
+
+def fake_encode(texts):
+    # 以關鍵字出現與否當作向量，讓測試不需要下載 embedding 模型
+    vectors = np.zeros((len(texts), DIM), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for col, word in enumerate(VOCABULARY):
+            if word in text:
+                vectors[row, col] = 1.0
+    return vectors
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store, "VECTOR_STORE_DIR", str(tmp_path))
+    monkeypatch.setattr(vector_store, "encode_texts", fake_encode)
+    monkeypatch.setattr(vector_store, "_dimension", lambda: DIM)
+    vector_store._indexes.clear()
+    return uuid.uuid4()
+
+
+def test_search_files_and_chat(store):
+    vector_store.add_texts(store, vector_store.SOURCE_FILE, "f1", ["資料庫 設計", "前端 頁面"])
+    vector_store.index_chat_message(store, "c1", "user", "報告 什麼時候交")
+
+    assert vector_store.search(store, "資料庫", top_k=1)[0]["source_id"] == "f1"
+    chat_hits = vector_store.search(store, "報告", top_k=1, source=vector_store.SOURCE_CHAT)
+    assert chat_hits[0]["text"] == "USER: 報告 什麼時候交"
+
+
+def test_incremental_add_is_visible(store):
+    vector_store.add_texts(store, vector_store.SOURCE_FILE, "f1", ["資料庫 設計"])
+    assert vector_store.search(store, "部署", top_k=5)[0]["source_id"] == "f1"
+
+    vector_store.add_texts(store, vector_store.SOURCE_FILE, "f2", ["部署 流程"])
+    hits = vector_store.search(store, "部署", top_k=5)
+    assert [hit["source_id"] for hit in hits] == ["f2", "f1"]
+
+
+def test_switches_to_hnsw_when_large(store, monkeypatch):
+    monkeypatch.setattr(vector_store, "VECTOR_STORE_FLAT_MAX", 3)
+    vector_store.add_texts(store, vector_store.SOURCE_FILE, "f1", ["資料庫", "前端"])
+    vector_store.search(store, "資料庫")
+    assert isinstance(vector_store._indexes[str(store)][0], faiss.IndexFlatL2)
+
+    vector_store.add_texts(store, vector_store.SOURCE_FILE, "f2", ["報告", "測試"])
+    assert vector_store.search(store, "測試", top_k=1)[0]["text"] == "測試"
+    assert isinstance(vector_store._indexes[str(store)][0], faiss.IndexHNSWFlat)
+
+
+def test_interrupted_appends_keep_entries_aligned(store):
+    vector_store.add_texts(store, vector_store.SOURCE_FILE, "f1", ["資料庫 設計"])
+    path = vector_store._project_dir(store)
+    # 模擬兩種中斷：向量寫完但 entries 沒寫，以及兩個檔案都只寫了一半
+    with open(f"{path}/{vector_store.VECTORS_FILE}", "ab") as f:
+        f.write(fake_encode(["會議"]).tobytes())
+        f.write(b"\0" * 10)
+    with open(f"{path}/{vector_store.ENTRIES_FILE}", "a", encoding="utf-8") as f:
+        f.write('{"row": 2, "source": "file", "sou')
+
+    # 寫到一半的內容讀取時略過，搜尋不會因為 reshape 失敗
+    assert vector_store.search(store, "資料庫", top_k=5)[0]["source_id"] == "f1"
+
+    vector_store.add_texts(store, vector_store.SOURCE_FILE, "f2", ["部署 流程", "測試 計畫"])
+    assert vector_store.search(store, "部署", top_k=1)[0]["text"] == "部署 流程"
+    assert vector_store.search(store, "測試", top_k=1)[0]["text"] == "測試 計畫"
+    # 沒有 entry 的向量不會出現在結果裡
+    assert all(hit["text"] != "會議" for hit in vector_store.search(store, "會議", top_k=5))
+
+
+def test_delete_project_store(store):
+    vector_store.add_texts(store, vector_store.SOURCE_FILE, "f1", ["資料庫"])
+    vector_store.delete_project_store(store)
+    assert vector_store.search(store, "資料庫") == []
+
+
+def test_queued_jobs_do_not_recreate_deleted_store(store):
+    started, release = threading.Event(), threading.Event()
+
+    def blocker():
+        started.set()
+        release.wait(5)
+        return 0
+
+    other = uuid.uuid4()
+    # 讓寫入 thread 先卡住，這個專案的工作只能排隊
+    vector_store._submit(lambda project_id: blocker(), other)
+    started.wait(5)
+    queued = vector_store.submit_chat_message(store, "c1", "user", "資料庫 在哪")
+    vector_store.delete_project_store(store)
+    release.set()
+
+    assert queued.result(5) == 0
+    assert not os.path.exists(vector_store._project_dir(store))
+    assert vector_store._pending_jobs == {} and vector_store._deleted == set()
@@ -0,0 +1,78 @@
+"""
+Benchmark serial vs. process-pool PDF paragraph extraction.
+
+Runs every PDF in uploads/ through app.gemini.pdf_extraction.iter_paragraphs
+with an increasing number of worker processes and reports the speedup over the
+serial path and the speedup per core.
+
+The sample documents are short, so each one is first repeated until it has at
+least --min-pages pages to resemble a 200+ page spec.
+
+Usage:
+    PYTHONPATH=. python benchmarks/pdf_extraction.py [--min-pages 240] [--repeat 3]
+"""
+
+import argparse
+import glob
+import os
+import statistics
+import time
+
+import fitz
+
+from app.gemini.pdf_extraction import iter_paragraphs
+
+
+def inflate_pdf(path: str, min_pages: int) -> bytes:
+    """Repeat the document's pages until it has at least min_pages pages."""
+    src = fitz.open(path)
+    out = fitz.open()
+    while len(out) < min_pages:
+        out.insert_pdf(src)
+    data = out.tobytes()
+    out.close()
+    src.close()
+    return data
+
+
+def time_extraction(content: bytes, workers: int, repeat: int) -> tuple:
+    timings = []
+    count = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = sum(1 for _ in iter_paragraphs(content, workers=workers, parallel=workers > 1))
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dir", default="uploads")
+    parser.add_argument("--min-pages", type=int, default=240)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    worker_counts = [1]
+    while worker_counts[-1] * 2 <= args.max_workers:
+        worker_counts.append(worker_counts[-1] * 2)
+    if worker_counts[-1] != args.max_workers:
+        worker_counts.append(args.max_workers)
+
+    print(f"{'document':<34} {'pages':>5} {'workers':>7} {'seconds':>8} {'speedup':>8} {'per core':>8}")
+    for path in sorted(glob.glob(os.path.join(args.dir, "*.pdf"))):
+        content = inflate_pdf(path, args.min_pages)
+        pages = fitz.open(stream=content, filetype="pdf").page_count
+        baseline = None
+        for workers in worker_counts:
+            seconds, count = time_extraction(content, workers, args.repeat)
+            baseline = baseline or seconds
+            speedup = baseline / seconds
+            print(
+                f"{os.path.basename(path):<34} {pages:>5} {workers:>7} "
+                f"{seconds:>8.3f} {speedup:>7.2f}x {speedup / workers:>7.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
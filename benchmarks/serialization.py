@@ -0,0 +1,186 @@
+"""
+Benchmark per-request response serialization on large project trees.
+
+Builds a synthetic milestone with --tasks tasks and a project with
+--milestones milestones, then times what a request spends between the crud
+result and the response body:
+
+  models + JSONResponse   crud builds schema instances, encoded by json.dumps
+  models + dump_json      crud builds schema instances, FastAPI's pydantic-core dump
+  dicts + dump_json       crud returns dicts, validated once and dumped (current path)
+  dicts + ORJSONResponse  dicts validated, then encoded by orjson
+
+and, for routes without a response_model, jsonable_encoder + JSONResponse
+against returning ORJSONResponse directly.
+
+Usage:
+    PYTHONPATH=. python benchmarks/serialization.py [--tasks 3000] [--milestones 500] [--repeat 30]
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from app.core.responses import ORJSONResponse
+from app.schemas.project import MilestoneDetailSchema, MilestoneSummarySchema, ProjectDetailSchema, TaskSchema
+
+
+def make_tasks(count: int) -> list:
+    # 模擬 ORM 物件的屬性，避免把查詢時間算進來
+    today = date.today()
+    return [
+        SimpleNamespace(
+            id=uuid.uuid4(),
+            title=f"Task {i}",
+            description="Read the related chapters and write notes " * 2,
+            due_date=today + timedelta(days=i % 90),
+            estimated_loading=1.5,
+            is_completed=i % 3 == 0,
+        )
+        for i in range(count)
+    ]
+
+
+def milestone_dict(tasks: list) -> dict:
+    now = datetime.now()
+    return {
+        "milestone_id": str(uuid.uuid4()),
+        "milestone_name": "Research",
+        "milestone_summary": "Collect and read the background material",
+        "milestone_start_time": now,
+        "milestone_end_time": now + timedelta(days=90),
+        "milestone_estimated_loading": 1.5 * len(tasks),
+        "tasks": [
+            {
+                "task_name": task.title,
+                "task_id": str(task.id),
+                "task_ddl_day": task.due_date,
+                "estimated_loading": task.estimated_loading,
+                "description": task.description,
+                "isCompleted": task.is_completed,
+            }
+            for task in tasks
+        ],
+        "version": 1,
+    }
+
+
+def milestone_models(tasks: list) -> MilestoneDetailSchema:
+    detail = milestone_dict(tasks)
+    detail["tasks"] = [TaskSchema(**task) for task in detail["tasks"]]
+    return MilestoneDetailSchema(**detail)
+
+
+def project_dict(count: int) -> dict:
+    now = datetime.now()
+    return {
+        "project_name": "Thesis",
+        "project_summary": "Master thesis plan",
+        "project_start_time": now,
+        "project_end_time": now + timedelta(days=365),
+        "estimated_loading": 10.0 * count,
+        "milestones": [
+            {
+                "milestone_id": str(uuid.uuid4()),
+                "milestone_name": f"Milestone {i}",
+                "ddl": now + timedelta(days=i),
+                "estimated_loading": 10.0,
+                "progress": 0.5,
+            }
+            for i in range(count)
+        ],
+        "version": 1,
+    }
+
+
+def project_models(count: int) -> ProjectDetailSchema:
+    detail = project_dict(count)
+    detail["milestones"] = [MilestoneSummarySchema(**ms) for ms in detail["milestones"]]
+    return ProjectDetailSchema(**detail)
+
+
+async def time_path(build, field, dump_json: bool, render, repeat: int) -> tuple:
+    timings = []
+    size = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        content = await serialize_response(field=field, response_content=build(), dump_json=dump_json)
+        body = content if dump_json else render(content)
+        timings.append(time.perf_counter() - start)
+        size = len(body)
+    return statistics.median(timings), size
+
+
+def time_plain(build, render, repeat: int) -> tuple:
+    timings = []
+    size = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = render(build())
+        timings.append(time.perf_counter() - start)
+        size = len(body)
+    return statistics.median(timings), size
+
+
+def report(tree: str, label: str, seconds: float, size: int, baseline: float):
+    print(f"{tree:<18} {label:<28} {seconds * 1000:>9.2f} {size / 1024:>9.0f} {baseline / seconds:>7.2f}x")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=3000)
+    parser.add_argument("--milestones", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=30)
+    args = parser.parse_args()
+
+    tasks = make_tasks(args.tasks)
+    trees = [
+        (
+            f"milestone/{args.tasks}",
+            create_model_field(name="response", type_=MilestoneDetailSchema, mode="serialization"),
+            lambda: milestone_models(tasks),
+            lambda: milestone_dict(tasks),
+        ),
+        (
+            f"project/{args.milestones}",
+            create_model_field(name="response", type_=ProjectDetailSchema, mode="serialization"),
+            lambda: project_models(args.milestones),
+            lambda: project_dict(args.milestones),
+        ),
+    ]
+
+    json_render = lambda content: JSONResponse(content).body
+    orjson_render = lambda content: ORJSONResponse(content).body
+
+    print(f"{'tree':<18} {'path':<28} {'ms/req':>9} {'KiB':>9} {'speedup':>8}")
+    for tree, field, models, dicts in trees:
+        baseline, size = await time_path(models, field, False, json_render, args.repeat)
+        report(tree, "models + JSONResponse", baseline, size, baseline)
+        for label, build, dump_json in (
+            ("models + dump_json", models, True),
+            ("dicts + dump_json", dicts, True),
+            ("dicts + ORJSONResponse", dicts, False),
+        ):
+            seconds, size = await time_path(build, field, dump_json, orjson_render, args.repeat)
+            report(tree, label, seconds, size, baseline)
+
+    # 沒有 response_model 的 route（例如 /tasks、/workload）
+    rows = lambda: [vars(task) for task in tasks]
+    tree = f"rows/{args.tasks}"
+    baseline, size = time_plain(rows, lambda content: JSONResponse(jsonable_encoder(content)).body, args.repeat)
+    report(tree, "jsonable_encoder + JSON", baseline, size, baseline)
+    seconds, size = time_plain(rows, orjson_render, args.repeat)
+    report(tree, "ORJSONResponse", seconds, size, baseline)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,3 +1,4 @@
+DROP TABLE IF EXISTS blob_reservations CASCADE;
 DROP TABLE IF EXISTS chat_histories CASCADE;
 DROP TABLE IF EXISTS files CASCADE;
 DROP TABLE IF EXISTS tasks CASCADE;
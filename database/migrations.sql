@@ -0,0 +1,18 @@
+-- 既有資料庫的欄位異動（新環境直接使用 schema.sql 即可）
+
+-- 檔案上傳者，供尚未關聯專案的檔案判斷權限
+ALTER TABLE files ADD COLUMN IF NOT EXISTS user_id UUID REFERENCES users(id) ON DELETE CASCADE;
+
+-- 內容定址儲存：檔案內容 hash 與大小，同內容的檔案共用 uploads/<前兩碼>/<hash>
+ALTER TABLE files ADD COLUMN IF NOT EXISTS sha256 VARCHAR(64);
+ALTER TABLE files ADD COLUMN IF NOT EXISTS size BIGINT;
+CREATE INDEX IF NOT EXISTS idx_files_sha256 ON files (sha256);
+
+-- 專案版本號：專案、里程碑或任務有寫入時遞增，供 GET /projects、/project_detail、/milestone_detail 產生 ETag
+ALTER TABLE projects ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1;
+
+-- 上傳中的 blob 保留數：Files 紀錄寫入前 blob 不會被刪除（多個 instance 以 row lock 協調）
+CREATE TABLE IF NOT EXISTS blob_reservations (
+    sha256 VARCHAR(64) PRIMARY KEY,
+    count INTEGER NOT NULL DEFAULT 0
+);
@@ -17,7 +17,8 @@ CREATE TABLE projects (
     estimated_loading NUMERIC(5,1),
     due_date DATE,
     current_milestone VARCHAR(255),
-    user_id UUID REFERENCES users(id) ON DELETE CASCADE
+    user_id UUID REFERENCES users(id) ON DELETE CASCADE,
+    version INTEGER NOT NULL DEFAULT 1
 );
 
 -- 里程碑表
@@ -47,7 +48,18 @@ CREATE TABLE files (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
     name VARCHAR(255) NOT NULL,
     url TEXT NOT NULL,
-    project_id UUID REFERENCES projects(id) ON DELETE CASCADE
+    project_id UUID REFERENCES projects(id) ON DELETE CASCADE,
+    user_id UUID REFERENCES users(id) ON DELETE CASCADE,
+    sha256 VARCHAR(64),
+    size BIGINT
+);
+
+CREATE INDEX idx_files_sha256 ON files (sha256);
+
+-- 上傳中的 blob 保留數：Files 紀錄寫入前 blob 不會被刪除（多個 instance 以 row lock 協調）
+CREATE TABLE blob_reservations (
+    sha256 VARCHAR(64) PRIMARY KEY,
+    count INTEGER NOT NULL DEFAULT 0
 );
 
 -- AI 助理訊息表